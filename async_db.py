@@ -0,0 +1,170 @@
+"""
+asyncio interface for the Leafy database
+Runs Database calls on worker threads so event loops never block on SQLite
+"""
+
+import asyncio
+import inspect
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Any
+from db import Database, db
+
+
+READER_THREADS = 4
+ITER_CHUNK_SIZE = 100  # rows pulled per worker hop by async iterators
+
+# Database methods that only read; everything else runs on the single writer.
+# Cache lookups (get_cached_*) are not here: they record hits and may flush
+# them to response_cache
+READ_METHODS = frozenset({
+    'get_note',
+    'search_notes',
+    'list_notes',
+    'search_commands',
+    'get_command_history',
+    'get_setting',
+    'get_all_settings',
+    'get_cache_evictions',
+    'get_cache_generation',
+    'get_stats',
+    'get_top_commands',
+    'get_daily_usage',
+    'get_command_hours',
+    'list_backups',
+})
+
+
+class _Call:
+    """Tracks the connection a running call uses so it can be interrupted."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.conn = None
+        self.cancelled = False
+
+    def interrupt(self):
+        """Abort the call's SQL if it is still running."""
+        with self.lock:
+            self.cancelled = True
+            if self.conn is not None:
+                self.conn.interrupt()
+
+
+class AsyncDatabase:
+    """Coroutine versions of every public Database method.
+
+    Reads run on a pool of reader threads (each with its own pooled
+    connection) and writes run in order on a single writer thread.
+    Cancelling or timing out an awaiting coroutine interrupts its SQL.
+    The streaming iter_* methods become async iterators.
+    """
+
+    def __init__(self, database: Optional[Database] = None, readers: int = READER_THREADS,
+                 timeout: Optional[float] = None):
+        self.database = database or db
+        self.timeout = timeout
+        self._readers = ThreadPoolExecutor(max_workers=readers,
+                                           thread_name_prefix="leafy-db-reader")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="leafy-db-writer")
+
+    async def call(self, name: str, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run Database.<name>(*args, **kwargs) off the event loop.
+
+        timeout overrides the default set on this AsyncDatabase.
+        """
+        method = getattr(self.database, name)
+        executor = self._readers if name in READ_METHODS else self._writer
+        return await self._run(executor, lambda: method(*args, **kwargs), timeout)
+
+    async def iterate(self, name: str, *args, chunk_size: int = ITER_CHUNK_SIZE,
+                      timeout: Optional[float] = None, **kwargs):
+        """Async-iterate Database.<name>(...), pulling chunks on reader threads.
+
+        timeout (or the default) applies to each chunk, and cancelling
+        interrupts the chunk's SQL like call() does.
+        """
+        method = getattr(self.database, name)
+        rows = await self._run(self._readers, lambda: method(*args, **kwargs), timeout)
+
+        while True:
+            chunk = await self._run(self._readers,
+                                    lambda: list(itertools.islice(rows, chunk_size)), timeout)
+            for row in chunk:
+                yield row
+            if len(chunk) < chunk_size:
+                return
+
+    async def _run(self, executor, func, timeout: Optional[float]) -> Any:
+        """Run func() on executor; on timeout or cancellation interrupt its SQL."""
+        call = _Call()
+
+        def work():
+            with call.lock:
+                if call.cancelled:
+                    return None
+                call.conn = self.database.get_connection()
+            try:
+                return func()
+            finally:
+                with call.lock:
+                    call.conn = None
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(executor, work)
+        try:
+            return await asyncio.wait_for(future, timeout if timeout is not None else self.timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            call.interrupt()
+            raise
+
+    async def aclose(self):
+        """Wait for queued calls to finish and stop the worker threads."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.shutdown)
+
+    def shutdown(self):
+        """Stop the worker threads (blocking)."""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+
+def _make_coroutine(name: str, method):
+    async def coroutine(self, *args, **kwargs):
+        return await self.call(name, *args, **kwargs)
+
+    coroutine.__name__ = name
+    coroutine.__qualname__ = f"AsyncDatabase.{name}"
+    coroutine.__doc__ = method.__doc__
+    coroutine.__signature__ = inspect.signature(method)
+    return coroutine
+
+
+def _make_async_iterator(name: str, method):
+    async def iterator(self, *args, **kwargs):
+        async for row in self.iterate(name, *args, **kwargs):
+            yield row
+
+    iterator.__name__ = name
+    iterator.__qualname__ = f"AsyncDatabase.{name}"
+    iterator.__doc__ = method.__doc__
+    iterator.__signature__ = inspect.signature(method)
+    return iterator
+
+
+# Mirror every public Database method: iter_* streams become async
+# iterators, everything else a coroutine
+for _name, _method in inspect.getmembers(Database, inspect.isfunction):
+    if _name.startswith('_') or hasattr(AsyncDatabase, _name):
+        continue
+    if _name.startswith('iter_'):
+        setattr(AsyncDatabase, _name, _make_async_iterator(_name, _method))
+    else:
+        setattr(AsyncDatabase, _name, _make_coroutine(_name, _method))
@@ -0,0 +1,542 @@
+#!/usr/bin/env python3
+"""
+Performance benchmarks for Leafy
+Run all benchmarks, or pass benchmark names to run a subset:
+
+    python benchmark.py
+    python benchmark.py connection_pool
+"""
+
+import random
+import sys
+import shutil
+import sqlite3
+import string
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+
+def _time_per_op(func, iterations: int) -> float:
+    """Return the mean latency of func() in microseconds."""
+    start = time.perf_counter()
+    for i in range(iterations):
+        func(i)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def _print_header(title: str):
+    print("\n" + "="*60)
+    print(title)
+    print("="*60)
+
+
+def _temp_database():
+    """Create a throwaway Database in a temporary directory."""
+    from db import Database
+    tmp_dir = Path(tempfile.mkdtemp(prefix="leafy_bench_"))
+    return Database(tmp_dir / "bench.db"), tmp_dir
+
+
+def _use_cache_database(database):
+    """Point the response cache at database; returns the previous one."""
+    import cache
+    previous, cache.db = cache.db, database
+    cache.ResponseCache.memory.clear()
+    return previous
+
+
+def bench_connection_pool(iterations: int = 2000):
+    """Per-operation latency: connection per call vs pooled connection."""
+    _print_header("Connection pool: per-operation latency")
+    database, tmp_dir = _temp_database()
+
+    try:
+        database.set_setting("speech_rate", 160, "int")
+        database.cache_response("bench_hash", "wikipedia", "cached text", 3600)
+
+        def connect_per_call(sql, params, commit=False):
+            conn = sqlite3.connect(str(database.db_path))
+            conn.row_factory = sqlite3.Row
+            try:
+                rows = conn.execute(sql, params).fetchall()
+                if commit:
+                    conn.commit()
+                return rows
+            finally:
+                conn.close()
+
+        conn = database.get_connection()
+
+        def pooled(sql, params, commit=False):
+            rows = conn.execute(sql, params).fetchall()
+            if commit:
+                conn.commit()
+            return rows
+
+        operations = [
+            ("get_setting", 'SELECT value, type FROM settings WHERE key = ?',
+             lambda i: ("speech_rate",), False),
+            ("cache lookup", 'SELECT response FROM response_cache WHERE query_hash = ?',
+             lambda i: ("bench_hash",), False),
+            ("add_command", 'INSERT INTO command_history (command, status, duration, result) '
+                            'VALUES (?, ?, ?, ?)',
+             lambda i: (f"bench command {i}", "executed", 0.1, ""), True),
+        ]
+
+        print(f"{'operation':<16}{'per-call (us)':>16}{'pooled (us)':>16}{'speedup':>10}")
+        for name, sql, params, commit in operations:
+            before = _time_per_op(lambda i: connect_per_call(sql, params(i), commit), iterations)
+            after = _time_per_op(lambda i: pooled(sql, params(i), commit), iterations)
+            print(f"{name:<16}{before:>16.1f}{after:>16.1f}{before / after:>9.1f}x")
+
+        database.release_connection(conn)
+    finally:
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_write_behind(iterations: int = 2000):
+    """add_command latency: commit per insert vs write-behind batching."""
+    _print_header("Command history: direct vs write-behind inserts")
+    database, tmp_dir = _temp_database()
+
+    try:
+        direct = _time_per_op(
+            lambda i: database.add_command(f"direct command {i}", duration=0.1), iterations)
+
+        database.enable_write_behind()
+        queued = _time_per_op(
+            lambda i: database.add_command(f"queued command {i}", duration=0.1), iterations)
+        start = time.perf_counter()
+        database.flush()
+        drain_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{'mode':<16}{'add_command (us)':>20}")
+        print(f"{'direct':<16}{direct:>20.1f}")
+        print(f"{'write-behind':<16}{queued:>20.1f}")
+        print(f"Final flush of queued rows: {drain_ms:.1f}ms")
+    finally:
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_note_search(notes: int = 5000, iterations: int = 200):
+    """search_notes latency: LIKE table scan vs FTS5 index."""
+    _print_header(f"Note search over {notes} notes: LIKE vs FTS5")
+    database, tmp_dir = _temp_database()
+
+    try:
+        rng = random.Random(42)
+        vocabulary = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+                      for _ in range(3000)]
+        conn = database.get_connection()
+        conn.executemany(
+            'INSERT INTO notes (title, content, tags) VALUES (?, ?, ?)',
+            [(f"note {i} {rng.choice(vocabulary)}",
+              " ".join(rng.choice(vocabulary) for _ in range(60)),
+              rng.choice(vocabulary)) for i in range(notes)])
+        conn.commit()
+
+        if not database.fts_enabled:
+            print("FTS5 not available in this SQLite build; skipping")
+            return
+
+        print(f"{'query':<16}{'LIKE (us)':>14}{'FTS5 (us)':>14}{'speedup':>10}")
+        for keyword in [vocabulary[0], vocabulary[1][:3], f"{vocabulary[2]} {vocabulary[3]}"]:
+            database.fts_enabled = False
+            before = _time_per_op(lambda i: database.search_notes(keyword, limit=20), iterations)
+            database.fts_enabled = True
+            after = _time_per_op(lambda i: database.search_notes(keyword, limit=20), iterations)
+            print(f"{keyword:<16}{before:>14.1f}{after:>14.1f}{before / after:>9.1f}x")
+    finally:
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_command_rollups(rows: int = 100000, iterations: int = 50):
+    """Top-k and per-day usage: scanning command_history vs rollup tables."""
+    _print_header(f"Command analytics over {rows} history rows: scan vs rollups")
+    database, tmp_dir = _temp_database()
+
+    try:
+        rng = random.Random(7)
+        commands = [f"command {i}" for i in range(200)]
+        database.enable_write_behind(batch_size=1000)
+        for i in range(rows):
+            database.add_command(rng.choice(commands), duration=rng.random())
+        database.disable_write_behind()
+        conn = database.get_connection()
+
+        def scan_top(i):
+            conn.execute('''
+                SELECT command, COUNT(*) AS count FROM command_history
+                GROUP BY command ORDER BY count DESC LIMIT 5
+            ''').fetchall()
+
+        def scan_daily(i):
+            conn.execute('''
+                SELECT date(timestamp) AS day, COUNT(*), TOTAL(duration) FROM command_history
+                WHERE timestamp > datetime('now', '-30 days')
+                GROUP BY day ORDER BY day
+            ''').fetchall()
+
+        print(f"{'query':<16}{'scan (us)':>14}{'rollup (us)':>14}{'speedup':>10}")
+        for name, scan, rollup in [
+            ("top 5", scan_top, lambda i: database.get_top_commands(5)),
+            ("daily usage", scan_daily, lambda i: database.get_daily_usage(30)),
+        ]:
+            before = _time_per_op(scan, iterations)
+            after = _time_per_op(rollup, iterations)
+            print(f"{name:<16}{before:>14.1f}{after:>14.1f}{before / after:>9.1f}x")
+    finally:
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_streaming(notes: int = 50000):
+    """Full note export: building a list vs streaming keyset pages."""
+    import tracemalloc
+
+    _print_header(f"Exporting {notes} notes: list vs keyset iterator")
+    database, tmp_dir = _temp_database()
+
+    try:
+        conn = database.get_connection()
+        conn.executemany('INSERT INTO notes (title, content) VALUES (?, ?)',
+                         [(f"note {i}", "lorem ipsum " * 40) for i in range(notes)])
+        conn.commit()
+
+        def export_list():
+            rows = [dict(row) for row in conn.execute(
+                'SELECT * FROM notes ORDER BY updated_at DESC').fetchall()]
+            first = time.perf_counter()
+            for row in rows:
+                pass
+            return first
+
+        def export_stream():
+            first = None
+            for row in database.iter_notes():
+                if first is None:
+                    first = time.perf_counter()
+            return first
+
+        print(f"{'method':<12}{'first row (ms)':>16}{'total (ms)':>14}{'peak memory (KB)':>20}")
+        for name, export in [("list", export_list), ("iterator", export_stream)]:
+            tracemalloc.start()
+            start = time.perf_counter()
+            first = export()
+            total = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:<12}{(first - start) * 1000:>16.1f}{total * 1000:>14.1f}{peak / 1024:>20.0f}")
+    finally:
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_memory_cache(iterations: int = 20000):
+    """Repeated cache lookups: SQLite tier vs in-process LRU tier."""
+    from cache import ResponseCache
+
+    _print_header("Response cache lookup: SQLite vs in-memory tier")
+    database, tmp_dir = _temp_database()
+    previous = _use_cache_database(database)
+
+    try:
+        query = "benchmark repeated question"
+        ResponseCache.cache_result(query, "a cached answer " * 20, "general", 3600)
+
+        # Both tiers go through the full get_cached() path; emptying the
+        # memory tier first sends every lookup to SQLite
+        def cold_lookup(i):
+            ResponseCache.memory.clear()
+            return ResponseCache.get_cached(query, "general")
+
+        sqlite_tier = _time_per_op(cold_lookup, iterations)
+        ResponseCache.get_cached(query, "general")
+        memory_tier = _time_per_op(lambda i: ResponseCache.get_cached(query, "general"), iterations)
+
+        print(f"{'tier':<16}{'lookup (us)':>14}")
+        print(f"{'SQLite':<16}{sqlite_tier:>14.2f}")
+        print(f"{'memory (LRU)':<16}{memory_tier:>14.2f}")
+    finally:
+        _use_cache_database(previous)
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_cache_compression(iterations: int = 2000):
+    """Stored size and read/write latency per query_type, raw vs compressed."""
+    import json
+    import db as db_module
+
+    _print_header("Response cache payloads: raw vs compressed")
+    database, tmp_dir = _temp_database()
+
+    try:
+        rng = random.Random(3)
+        words = ["".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 9)))
+                 for _ in range(2000)]
+
+        def sentence(n):
+            return " ".join(rng.choice(words) for _ in range(n)).capitalize() + "."
+
+        samples = {
+            'calculation': "The answer is 1.4142135623730951",
+            'wikipedia': " ".join(sentence(25) for _ in range(8)),
+            'news': json.dumps([{"title": sentence(10), "description": sentence(30),
+                                 "url": f"https://example.com/articles/{i}",
+                                 "source": {"id": None, "name": "Example News"}}
+                                for i in range(20)]),
+        }
+
+        print(f"{'query_type':<13}{'mode':<12}{'bytes':>9}{'write (us)':>12}{'read (us)':>11}")
+        for query_type, payload in samples.items():
+            for mode, threshold in [("raw", float('inf')),
+                                    ("compressed", db_module.CACHE_COMPRESS_MIN_BYTES)]:
+                original, db_module.CACHE_COMPRESS_MIN_BYTES = db_module.CACHE_COMPRESS_MIN_BYTES, threshold
+                try:
+                    query_hash = f"{query_type}_{mode}"
+                    write = _time_per_op(lambda i: database.cache_response(
+                        query_hash, query_type, payload, 3600), iterations // 10)
+                    read = _time_per_op(lambda i: database.get_cached_entry(query_hash), iterations)
+                    stored = len(db_module.encode_payload(payload))
+                finally:
+                    db_module.CACHE_COMPRESS_MIN_BYTES = original
+                print(f"{query_type:<13}{mode:<12}{stored:>9}{write:>12.1f}{read:>11.1f}")
+    finally:
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def bench_cache_batch(iterations: int = 20):
+    """Per-key vs batched response cache reads and writes."""
+    import cache
+    from cache import ResponseCache
+
+    _print_header("Response cache: per-key vs batched get/put")
+    database, tmp_dir = _temp_database()
+    original = _use_cache_database(database)
+
+    try:
+        print(f"{'keys':>6}{'op':>5}{'per-key (ms)':>15}{'batched (ms)':>15}{'speedup':>10}")
+        for size in [1, 10, 100, 1000]:
+            items = {f"batch query {size} {i}": f"result {i}" for i in range(size)}
+
+            def put_each(i):
+                for query, result in items.items():
+                    ResponseCache.cache_result(query, result, "general", 3600)
+
+            def get_each(i):
+                ResponseCache.memory.clear()
+                for query in items:
+                    ResponseCache.get_cached(query, "general")
+
+            def get_batch(i):
+                ResponseCache.memory.clear()
+                ResponseCache.get_many(items, "general")
+
+            rows = [
+                ("put", put_each, lambda i: ResponseCache.put_many(items, "general", 3600)),
+                ("get", get_each, get_batch),
+            ]
+            for op, each, batch in rows:
+                per_key = _time_per_op(each, iterations) / 1000
+                batched = _time_per_op(batch, iterations) / 1000
+                print(f"{size:>6}{op:>5}{per_key:>15.2f}{batched:>15.2f}{per_key / batched:>9.1f}x")
+    finally:
+        ResponseCache.memory.clear()
+        cache.db = original
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# Stand-in replay when command_history has no cacheable lookups
+SAMPLE_QUERIES = [
+    "wikipedia python", "python wikipedia", "Python wikipedia?", "wikipedia  alan turing",
+    "alan turing wikipedia", "calculate two plus two", "calculate 2+2", "calculate 2 + 2",
+    "calculate twenty one times three", "calculate 21*3", "news", "latest news", "news today",
+    "what is the speed of light", "what's the speed of light?", "who is ada lovelace",
+]
+
+
+def bench_canonical_hit_rate():
+    """Response cache hit rate on a command_history replay: raw vs canonical keys."""
+    from cache import replay_hit_rate
+    from db import db
+    from warmup import classify_command
+
+    _print_header("Response cache hit rate: raw vs canonical query keys")
+    commands = [row['command'].lower() for row in db.iter_command_history()][::-1]
+    queries = [lookup for c in commands if (lookup := classify_command(c))]
+    source = "command_history"
+    if not queries:
+        queries = [classify_command(q) for q in SAMPLE_QUERIES]
+        source = "built-in sample (no cacheable commands in history)"
+
+    stats = replay_hit_rate(queries)
+    print(f"Replayed {stats['queries']} lookups from {source}")
+    print(f"{'keys':<12}{'hit rate':>10}")
+    print(f"{'raw':<12}{stats['raw_hit_rate']:>10.1%}")
+    print(f"{'canonical':<12}{stats['canonical_hit_rate']:>10.1%}")
+
+
+def bench_intent_dispatch(iterations: int = 2000):
+    """Command dispatch cost as intents are added: substring chain vs router."""
+    from commands import INTENTS
+    from intents import Intent, IntentRouter
+
+    _print_header("Command dispatch: if/elif substring chain vs intent router")
+    rng = random.Random(5)
+    utterances = ["what is the weather like in delhi today", "open chrome",
+                  "could you please tell me a joke", "calculate 2 plus 2", "bye"]
+
+    def word():
+        return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 8)))
+
+    print(f"{'intents':>8}{'chain (us)':>12}{'router (us)':>13}")
+    for size in [len(INTENTS), 100, 1000, 10000]:
+        extra = [Intent(f"extra_{i}", [f"{word()} {word()}"]) for i in range(size - len(INTENTS))]
+        intents = extra + INTENTS  # matching intents last, as at the end of a long chain
+        phrases = [(intent.name, phrase) for intent in intents for phrase in intent.phrases]
+        router = IntentRouter(intents)
+
+        def chain(i):
+            query = utterances[i % len(utterances)]
+            for name, phrase in phrases:
+                if phrase in query:
+                    return name
+            return None
+
+        chained = _time_per_op(chain, iterations)
+        routed = _time_per_op(lambda i: router.match(utterances[i % len(utterances)]), iterations)
+        print(f"{size:>8}{chained:>12.1f}{routed:>13.1f}")
+
+
+# Modules Leafy.py imported at load before commands moved into plugins
+EAGER_IMPORTS = ['wolframalpha', 'wikipedia', 'pyautogui', 'pyjokes', 'PIL.Image',
+                 'PIL.ImageTk', 'psutil', 'playsound', 'winshell']
+
+
+def _import_times(modules, runs: int):
+    """Median import time in ms of each module in a fresh interpreter (None if missing)."""
+    import json
+    import statistics
+    import subprocess
+
+    code = (
+        "import importlib, json, time\n"
+        "times = {}\n"
+        f"for name in {modules!r}:\n"
+        "    start = time.perf_counter()\n"
+        "    try:\n"
+        "        importlib.import_module(name)\n"
+        "    except Exception:\n"
+        "        times[name] = None\n"
+        "        continue\n"
+        "    times[name] = (time.perf_counter() - start) * 1000\n"
+        "print(json.dumps(times))\n"
+    )
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                             cwd=Path(__file__).parent, check=True).stdout
+        samples.append(json.loads(out.strip().splitlines()[-1]))
+    return {name: None if samples[0][name] is None
+            else statistics.median(s[name] for s in samples) for name in modules}
+
+
+def bench_startup(runs: int = 5):
+    """Import cost at startup: eager command libraries vs the lazy plugin registry."""
+    _print_header("Startup imports: eager command libraries vs lazy plugins")
+    eager = _import_times(EAGER_IMPORTS, runs)
+    lazy = _import_times(['commands'], runs)['commands']
+
+    print(f"{'module':<16}{'import (ms)':>12}")
+    for name, ms in eager.items():
+        print(f"{name:<16}{'not installed' if ms is None else f'{ms:.1f}':>12}")
+    eager_total = sum(ms for ms in eager.values() if ms is not None)
+    missing = sum(ms is None for ms in eager.values())
+    print(f"{'eager total':<16}{eager_total:>12.1f}"
+          + (f"  ({missing} not installed; would fail at startup)" if missing else ""))
+    print(f"{'commands':<16}{lazy:>12.1f}  (registry and router, no handler libraries)")
+    if not missing:
+        print(f"Startup saving: {eager_total - lazy:.1f} ms")
+
+
+def bench_phrase_audio(phrases=("Noted", "Here you go", "At your service!", "How may I help you?")):
+    """Time to say fixed phrases: live synthesis vs their pre-rendered audio."""
+    import speech
+    from speech import SpeechManager, phrase_file_name
+
+    _print_header("Fixed phrases: live synthesis vs pre-rendered audio")
+    database, tmp_dir = _temp_database()
+    previous, speech.db = speech.db, database
+    manager = SpeechManager(audio_dir=tmp_dir / "phrase_audio", phrases=phrases)
+    try:
+        manager.start()
+        if not manager.wait_until_ready(30) or manager.error:
+            print(f"Skipped: no speech engine ({manager.error or 'timed out'})")
+            return
+        deadline = time.time() + 60
+        while not all((manager._phrase_dir / phrase_file_name(p, manager._extension)).exists()
+                      for p in phrases):
+            if time.time() > deadline:
+                print("Skipped: this speech engine could not render phrase audio")
+                return
+            time.sleep(0.1)
+
+        def say(phrase):
+            start = time.perf_counter()
+            manager.speak(phrase).wait(30)
+            return (time.perf_counter() - start) * 1000
+
+        print(f"{'phrase':<24}{'live (ms)':>11}{'cached (ms)':>13}")
+        for phrase in phrases:
+            manager.phrases = frozenset()
+            live = say(phrase)
+            manager.phrases = frozenset(phrases)
+            print(f"{phrase:<24}{live:>11.0f}{say(phrase):>13.0f}")
+    finally:
+        manager.stop(5)
+        speech.db = previous
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+BENCHMARKS = {
+    'connection_pool': bench_connection_pool,
+    'write_behind': bench_write_behind,
+    'note_search': bench_note_search,
+    'command_rollups': bench_command_rollups,
+    'streaming': bench_streaming,
+    'memory_cache': bench_memory_cache,
+    'cache_compression': bench_cache_compression,
+    'cache_batch': bench_cache_batch,
+    'canonical_hit_rate': bench_canonical_hit_rate,
+    'intent_dispatch': bench_intent_dispatch,
+    'startup': bench_startup,
+    'phrase_audio': bench_phrase_audio,
+}
+
+
+def main(names=None):
+    """Run the selected benchmarks (all by default)."""
+    names = names or list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        print(f"Unknown benchmark(s): {', '.join(unknown)}")
+        print(f"Available: {', '.join(BENCHMARKS)}")
+        return 1
+
+    for name in names:
+        BENCHMARKS[name]()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
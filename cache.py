@@ -5,9 +5,353 @@ Caches Wikipedia, calculations, news, and other API responses
 
 import hashlib
 import json
-from typing import Optional, Any
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Any, Dict, Iterable, Tuple, Union
 from db import db
 from logger import log_info, log_error
+from metrics import LatencyHistogram
+
+# In-process tier in front of the response_cache table
+MEMORY_CACHE_MAX_ENTRIES = 512
+MEMORY_CACHE_MAX_BYTES = 4 * 1024 * 1024  # 4 MB
+
+# Query canonicalization (see canonicalize_query)
+FILLER_WORDS = frozenset({
+    'a', 'an', 'the', 'please', 'hey', 'leafy', 'can', 'could', 'would', 'you',
+    'tell', 'me', 'about', 'search', 'for', 'find', 'look', 'up', 'show',
+})
+TYPE_FILLER_WORDS = {
+    'wikipedia': frozenset({'wikipedia', 'according', 'to', 'what', 'whats', 'who',
+                            'whos', 'is', 'was', 'are', 'were'}),
+    'news': frozenset({'news', 'headlines', 'latest', 'top', 'today', 'todays', 'on', 'in'}),
+    'calculation': frozenset({'calculate', 'compute', 'what', 'whats', 'is', 'equals'}),
+}
+CONTRACTIONS = {"what's": "what is", "who's": "who is", "where's": "where is", "it's": "it is"}
+# Types whose lookups are bags of keywords, so term order does not matter
+SORTED_TERM_TYPES = frozenset({'wikipedia', 'news'})
+
+NUMBER_WORDS = {
+    'zero': 0, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'seven': 7, 'eight': 8, 'nine': 9, 'ten': 10, 'eleven': 11, 'twelve': 12,
+    'thirteen': 13, 'fourteen': 14, 'fifteen': 15, 'sixteen': 16,
+    'seventeen': 17, 'eighteen': 18, 'nineteen': 19, 'twenty': 20, 'thirty': 30,
+    'forty': 40, 'fifty': 50, 'sixty': 60, 'seventy': 70, 'eighty': 80, 'ninety': 90,
+}
+SCALE_WORDS = {'hundred': 100, 'thousand': 1000, 'million': 10 ** 6, 'billion': 10 ** 9}
+OPERATOR_PHRASES = [
+    ('to the power of', '^'),
+    ('multiplied by', '*'),
+    ('divided by', '/'),
+    ('plus', '+'),
+    ('minus', '-'),
+    ('times', '*'),
+    ('over', '/'),
+]
+
+_CALCULATION_TOKEN = re.compile(r'\d+(?:\.\d+)?|[a-z]+|[-+*/^%()]')
+# Words keep the symbols that change their meaning: c++, c#, node.js, .net
+_WORD_TOKEN = re.compile(r'(?<!\w)\.?\w+(?:\.\w+)*[+#]*')
+
+
+def _number_words_to_digits(tokens: list) -> list:
+    """Replace runs of number words ("twenty one") with digits ("21").
+    
+    A units word only joins a directly preceding tens word, and any number
+    word joins a preceding "hundred"; otherwise adjacent number words are
+    separate numbers ("five five" is "5 5", not 10).
+    """
+    result = []
+    total = current = None
+    last = None  # the previous number word, while inside a number
+    
+    def finish():
+        nonlocal total, current, last
+        if total is not None or current is not None:
+            result.append(str((total or 0) + (current or 0)))
+        total = current = last = None
+    
+    for i, token in enumerate(tokens):
+        in_number = total is not None or current is not None
+        if token in NUMBER_WORDS:
+            value = NUMBER_WORDS[token]
+            joins = (current is None
+                     or (last in NUMBER_WORDS and NUMBER_WORDS[last] >= 20 and 0 < value < 10)
+                     or (last == 'hundred' and value > 0))
+            if not joins:
+                finish()
+            current = (current or 0) + value
+            last = token
+        elif (token == 'a' and not in_number and i + 1 < len(tokens)
+              and tokens[i + 1] in SCALE_WORDS):
+            current = 1  # "a hundred"
+        elif token in SCALE_WORDS and in_number:
+            scale = SCALE_WORDS[token]
+            if scale == 100:
+                current = (current or 1) * scale
+            else:
+                total = (total or 0) + (current or 1) * scale
+                current = None
+            last = token
+        elif (token == 'and' and in_number and i + 1 < len(tokens)
+              and tokens[i + 1] in NUMBER_WORDS):
+            continue
+        else:
+            finish()
+            result.append(token)
+    finish()
+    return result
+
+
+def canonicalize_query(query: str, query_type: str = "general") -> str:
+    """Reduce a query to the form used for its cache key.
+    
+    Lowercases, drops punctuation (but not symbols inside words, as in
+    "c++") and filler words, and collapses whitespace. calculation queries
+    keep their operators and get number and operator words turned into
+    symbols; keyword lookups (wikipedia, news) have their terms sorted.
+    A query made only of filler words ("The Who") keeps its lowercased
+    text, so it never shares the empty key with other such queries.
+    """
+    text = query.lower()
+    for contraction, expansion in CONTRACTIONS.items():
+        text = text.replace(contraction, expansion)
+    text = text.replace("'", "")
+    fillers = FILLER_WORDS | TYPE_FILLER_WORDS.get(query_type, frozenset())
+    
+    if query_type == 'calculation':
+        for phrase, symbol in OPERATOR_PHRASES:
+            text = re.sub(rf'\b{phrase}\b', f' {symbol} ', text)
+        tokens = _number_words_to_digits(_CALCULATION_TOKEN.findall(text))
+    else:
+        tokens = _WORD_TOKEN.findall(text)
+    
+    # "a" is filler except as a quantity ("a hundred" is not "hundred")
+    terms = [t for i, t in enumerate(tokens)
+             if t not in fillers or (t == 'a' and tokens[i + 1:i + 2] and tokens[i + 1] in SCALE_WORDS)]
+    if not terms:
+        return " ".join(query.lower().split())
+    if query_type in SORTED_TERM_TYPES:
+        terms.sort()
+    return " ".join(terms)
+
+
+class CacheEntry:
+    """A cached response held in memory.
+    
+    Entries are served fresh until stale_at, then served stale (while a
+    refresh runs) until expires_at. Negative entries have a failure_kind
+    and an empty value.
+    """
+    
+    __slots__ = ('value', 'query_type', 'stale_at', 'expires_at', 'size', 'failure_kind')
+    
+    def __init__(self, value: str, query_type: str, stale_at: float,
+                 expires_at: float, size: int = 0, failure_kind: Optional[str] = None):
+        self.value = value
+        self.query_type = query_type
+        self.stale_at = stale_at
+        self.expires_at = expires_at
+        self.size = size
+        self.failure_kind = failure_kind
+    
+    def is_stale(self, now: Optional[float] = None) -> bool:
+        """Whether the entry is past its soft TTL."""
+        return (time.time() if now is None else now) >= self.stale_at
+
+
+class MemoryCache:
+    """Thread-safe LRU cache bounded by entry count and total bytes."""
+    
+    def __init__(self, max_entries: int = MEMORY_CACHE_MAX_ENTRIES,
+                 max_bytes: int = MEMORY_CACHE_MAX_BYTES, on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict  # called with each entry pushed out by put()
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """Return a live entry and mark it most recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+    
+    def put(self, key: str, value: str, query_type: str, expires_at: float,
+            stale_at: Optional[float] = None, failure_kind: Optional[str] = None):
+        """Store an entry, evicting least recently used ones to stay in bounds."""
+        size = len(value.encode('utf-8'))
+        stale_at = expires_at if stale_at is None else stale_at
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes or expires_at <= time.time():
+                return
+            
+            self._entries[key] = CacheEntry(value, query_type, stale_at, expires_at,
+                                            size, failure_kind)
+            self.total_bytes += size
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= evicted.size
+                if self.on_evict is not None:
+                    self.on_evict(evicted)
+    
+    def remove(self, key: str):
+        """Drop an entry if present."""
+        with self._lock:
+            self._remove(key)
+    
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+    
+    def remove_type(self, query_type: str) -> int:
+        """Drop every entry of query_type."""
+        with self._lock:
+            keys = [k for k, e in self._entries.items() if e.query_type == query_type]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+    
+    def purge_expired(self) -> int:
+        """Drop every expired entry."""
+        now = time.time()
+        with self._lock:
+            expired = [k for k, e in self._entries.items() if e.expires_at <= now]
+            for key in expired:
+                self._remove(key)
+            return len(expired)
+    
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+
+class CacheMetrics:
+    """Thread-safe per-query-type cache counters and latency histograms."""
+    
+    COUNTERS = ('hits', 'negative_hits', 'misses', 'stores', 'negative_stores',
+                'memory_evictions')
+    HISTOGRAMS = ('lookup_time', 'fetch_time')
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._types = {}
+    
+    def _stats(self, query_type: str) -> dict:
+        stats = self._types.get(query_type)
+        if stats is None:
+            stats = dict.fromkeys(self.COUNTERS, 0)
+            stats.update((name, LatencyHistogram()) for name in self.HISTOGRAMS)
+            self._types[query_type] = stats
+        return stats
+    
+    def count(self, query_type: str, counter: str, n: int = 1):
+        """Add n to one of COUNTERS for query_type."""
+        with self._lock:
+            self._stats(query_type)[counter] += n
+    
+    def observe(self, query_type: str, histogram: str, seconds: float):
+        """Record a duration in one of HISTOGRAMS for query_type."""
+        with self._lock:
+            self._stats(query_type)[histogram].record(seconds)
+    
+    def snapshot(self, evictions: Optional[Dict[str, int]] = None) -> Dict[str, Dict[str, Any]]:
+        """Return counters, histogram summaries and derived figures per type.
+        
+        evictions (response_cache rows evicted per type) is merged in as an
+        'evictions' counter. hit_ratio counts negative hits as hits;
+        saved_ms estimates upstream time avoided as hits times the mean
+        fetch time.
+        """
+        evictions = evictions or {}
+        with self._lock:
+            result = {}
+            for query_type in sorted(self._types.keys() | evictions.keys()):
+                stats = self._stats(query_type)
+                snapshot = {name: stats[name] for name in self.COUNTERS}
+                snapshot['evictions'] = evictions.get(query_type, 0)
+                snapshot.update((name, stats[name].summary()) for name in self.HISTOGRAMS)
+                
+                hits = stats['hits'] + stats['negative_hits']
+                lookups = hits + stats['misses']
+                snapshot['hit_ratio'] = hits / lookups if lookups else 0.0
+                snapshot['saved_ms'] = stats['hits'] * snapshot['fetch_time']['mean_ms']
+                result[query_type] = snapshot
+            return result
+    
+    def reset(self):
+        """Drop every counter and histogram."""
+        with self._lock:
+            self._types.clear()
+
+
+class _Flight:
+    """One in-progress call shared by every concurrent caller of a key."""
+    
+    __slots__ = ('done', 'result', 'error')
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into a single execution."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+    
+    def do(self, key: str, func) -> Any:
+        """Run func() once for all concurrent callers of key.
+        
+        The first caller runs it; the others block and get the same result,
+        or the same exception. The key is released as soon as func() returns.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        
+        try:
+            flight.result = func()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+    
+    def in_flight(self, key: str) -> bool:
+        """Whether a call for key is currently running."""
+        with self._lock:
+            return key in self._flights
 
 
 class ResponseCache:
@@ -19,53 +363,270 @@ class ResponseCache:
     TTL_NEWS = 24 * 3600  # 1 day
     TTL_SHORT = 3600  # 1 hour
     
+    # How long past its TTL an entry may still be served while it is
+    # refreshed in the background (stale-while-revalidate)
+    STALE_GRACE = {
+        'wikipedia': 7 * 24 * 3600,
+        'calculation': 30 * 24 * 3600,
+        'news': 2 * 3600,
+    }
+    
+    # How long a failed or empty upstream lookup is remembered before
+    # upstream is asked again (negative caching)
+    NEGATIVE_TTLS = {
+        'wikipedia': 3600,
+        'calculation': 6 * 3600,
+        'news': 300,
+    }
+    NEGATIVE_TTL_DEFAULT = 300
+    
+    # failure_kind recorded when upstream answers with nothing
+    FAILURE_EMPTY = "empty"
+    
+    # Settings whose change invalidates cached responses of these types
+    SETTINGS_INVALIDATE = {
+        'language': ('wikipedia',),
+    }
+    
+    # Per-type counters and latency histograms (see get_metrics)
+    metrics = CacheMetrics()
+    
+    # Recently used responses, checked before SQLite
+    memory = MemoryCache(on_evict=lambda entry: ResponseCache.metrics.count(
+        entry.query_type, 'memory_evictions'))
+    
     @staticmethod
-    def hash_query(query: str, query_type: str) -> str:
-        """Generate hash for query."""
-        combined = f"{query_type}:{query.lower().strip()}"
+    def hash_query(query: str, query_type: str, generation: Optional[int] = None) -> str:
+        """Generate hash for query (after canonicalize_query).
+        
+        The key includes query_type's cache generation (the current one by
+        default), so invalidate_type() makes older entries unreachable.
+        """
+        if generation is None:
+            generation = db.get_cache_generation(query_type)
+        canonical = canonicalize_query(query, query_type)
+        # Generation 0 keeps the keys of entries cached before generations
+        combined = f"{query_type}@{generation}:{canonical}" if generation else f"{query_type}:{canonical}"
         return hashlib.md5(combined.encode()).hexdigest()
     
+    @staticmethod
+    def _serialize(result: Any) -> str:
+        """Convert a result to the string stored in the cache."""
+        if isinstance(result, (dict, list)):
+            return json.dumps(result)
+        return str(result)
+    
     @staticmethod
     def cache_result(query: str, result: str, query_type: str = "general", 
-                    ttl: int = TTL_SHORT) -> bool:
-        """Cache a result."""
+                    ttl: int = TTL_SHORT, hard_ttl: Optional[int] = None) -> bool:
+        """Cache a result.
+        
+        The entry is fresh for ttl seconds. If hard_ttl is longer, it is kept
+        and served as stale until hard_ttl seconds have passed.
+        """
+        success = ResponseCache.put_many([(query, result)], query_type, ttl, hard_ttl)
+        if success:
+            log_info(f"Cached {query_type}: {query[:50]}")
+        return success
+    
+    @staticmethod
+    def put_many(items: Union[Dict[Any, Any], Iterable[tuple]],
+                 query_type: str = "general", ttl: int = TTL_SHORT,
+                 hard_ttl: Optional[int] = None) -> bool:
+        """Cache several results in a single transaction.
+        
+        Items mirror get_many(): a dict mapping queries of query_type, or
+        (query, query_type) pairs, to results (get_many()'s return value
+        can be written back as is), or an iterable of (query, result) and
+        (query, query_type, result) tuples. ttl and hard_ttl apply to all
+        of them as in cache_result().
+        """
         try:
-            query_hash = ResponseCache.hash_query(query, query_type)
+            hard_ttl = max(ttl, hard_ttl or ttl)
+            if isinstance(items, dict):
+                items = [(*key, result) if isinstance(key, tuple) else (key, result)
+                         for key, result in items.items()]
+            generations = {}
+            entries = []
+            for item in items:
+                query, item_type, result = item if len(item) == 3 else (item[0], query_type, item[1])
+                if item_type not in generations:
+                    generations[item_type] = db.get_cache_generation(item_type)
+                generation = generations[item_type]
+                entries.append({
+                    'query_hash': ResponseCache.hash_query(query, item_type, generation),
+                    'query_type': item_type,
+                    'response': ResponseCache._serialize(result),
+                    'ttl_seconds': hard_ttl,
+                    'stale_after': ttl,
+                    'generation': generation,
+                })
             
-            # Convert result to string if needed
-            if isinstance(result, (dict, list)):
-                result = json.dumps(result)
-            else:
-                result = str(result)
+            success = db.cache_responses(entries)
+            if success:
+                now = time.time()
+                for entry in entries:
+                    ResponseCache.memory.put(entry['query_hash'], entry['response'],
+                                             entry['query_type'], now + hard_ttl, stale_at=now + ttl)
+                    ResponseCache.metrics.count(entry['query_type'], 'stores')
+            return success
+        except Exception as e:
+            log_error("CACHE", "Failed to cache results", str(e))
+            return False
+    
+    @staticmethod
+    def cache_failure(query: str, query_type: str = "general",
+                      failure_kind: str = FAILURE_EMPTY, ttl: Optional[int] = None) -> bool:
+        """Remember that a lookup failed so it is not retried until ttl passes.
+        
+        ttl defaults to the NEGATIVE_TTLS entry for query_type.
+        """
+        try:
+            generation = db.get_cache_generation(query_type)
+            query_hash = ResponseCache.hash_query(query, query_type, generation)
+            if ttl is None:
+                ttl = ResponseCache.NEGATIVE_TTLS.get(query_type, ResponseCache.NEGATIVE_TTL_DEFAULT)
             
-            success = db.cache_response(query_hash, query_type, result, ttl)
+            success = db.cache_response(query_hash, query_type, "", ttl,
+                                        failure_kind=failure_kind, generation=generation)
             if success:
-                log_info(f"Cached {query_type}: {query[:50]}")
+                ResponseCache.memory.put(query_hash, "", query_type, time.time() + ttl,
+                                         failure_kind=failure_kind)
+                ResponseCache.metrics.count(query_type, 'negative_stores')
+                log_info(f"Cached {query_type} failure ({failure_kind}): {query[:50]}")
             return success
         except Exception as e:
-            log_error("CACHE", f"Failed to cache result for {query_type}", str(e))
+            log_error("CACHE", f"Failed to cache failure for {query_type}", str(e))
             return False
     
+    @staticmethod
+    def lookup(query: str, query_type: str = "general") -> Optional[CacheEntry]:
+        """Get the cache entry for a query, fresh, stale or negative, if not expired."""
+        query_hash = ResponseCache.hash_query(query, query_type)
+        entry = ResponseCache.memory.get(query_hash)
+        if entry is not None:
+            # Keep the row's access stats current for response_cache eviction
+            db.touch_cache_entry(query_hash)
+            return entry
+        
+        row = db.get_cached_entry(query_hash)
+        if not row:
+            return None
+        
+        log_info(f"Cache hit for {query_type}: {query[:50]}")
+        return ResponseCache._remember_row(query_hash, row)
+    
+    @staticmethod
+    def _remember_row(query_hash: str, row: Dict) -> CacheEntry:
+        """Turn a response_cache row into a CacheEntry, keeping it in memory."""
+        stale_at = row['stale_at'] if row['stale_at'] is not None else row['expires_at']
+        ResponseCache.memory.put(query_hash, row['response'], row['query_type'], row['expires_at'],
+                                 stale_at=stale_at, failure_kind=row['failure_kind'])
+        return CacheEntry(row['response'], row['query_type'], stale_at, row['expires_at'],
+                          failure_kind=row['failure_kind'])
+    
+    @staticmethod
+    def _record_lookup(query_type: str, entry: Optional[CacheEntry], seconds: float):
+        """Count a lookup as a hit, negative hit or miss and record its latency."""
+        if entry is None:
+            outcome = 'misses'
+        elif entry.failure_kind:
+            outcome = 'negative_hits'
+        else:
+            outcome = 'hits'
+        ResponseCache.metrics.count(query_type, outcome)
+        ResponseCache.metrics.observe(query_type, 'lookup_time', seconds)
+    
+    @staticmethod
+    def timed_lookup(query: str, query_type: str = "general") -> Optional[CacheEntry]:
+        """lookup() that records its outcome and latency in metrics."""
+        start = time.perf_counter()
+        entry = ResponseCache.lookup(query, query_type)
+        ResponseCache._record_lookup(query_type, entry, time.perf_counter() - start)
+        return entry
+    
+    @staticmethod
+    def get_metrics() -> Dict[str, Dict[str, Any]]:
+        """Cache metrics per query type.
+        
+        Each type maps to counters (hits, negative_hits, misses, stores,
+        negative_stores, memory_evictions, evictions), lookup_time and
+        fetch_time histogram summaries, hit_ratio and saved_ms.
+        """
+        return ResponseCache.metrics.snapshot(db.get_cache_evictions())
+    
+    @staticmethod
+    def reset_metrics():
+        """Zero the in-process metrics (SQLite eviction counts are kept)."""
+        ResponseCache.metrics.reset()
+    
     @staticmethod
     def get_cached(query: str, query_type: str = "general") -> Optional[str]:
-        """Get cached result."""
+        """Get cached result (possibly stale, never past its hard expiry).
+        
+        Negative entries return None; use get_failure() to tell them apart.
+        """
         try:
-            query_hash = ResponseCache.hash_query(query, query_type)
-            cached = db.get_cached_response(query_hash)
+            entry = ResponseCache.timed_lookup(query, query_type)
+            return entry.value if entry and not entry.failure_kind else None
+        except Exception as e:
+            log_error("CACHE", f"Failed to retrieve cached result for {query_type}", str(e))
+            return None
+    
+    @staticmethod
+    def get_many(queries: Iterable[Union[str, Tuple[str, str]]],
+                 query_type: str = "general") -> Dict[Any, Optional[str]]:
+        """Get cached results for several queries with one SQLite round trip.
+        
+        Each item is a query of query_type or a (query, query_type) pair.
+        Returns each item mapped to its cached result, or None for misses
+        and negative entries.
+        """
+        try:
+            start = time.perf_counter()
+            keys = {}
+            for item in queries:
+                query, item_type = item if isinstance(item, tuple) else (item, query_type)
+                keys[item] = (item_type, ResponseCache.hash_query(query, item_type))
             
-            if cached:
-                log_info(f"Cache hit for {query_type}: {query[:50]}")
-                return cached
+            entries = {}
+            for item_type, query_hash in keys.values():
+                entry = ResponseCache.memory.get(query_hash)
+                if entry is not None:
+                    entries[query_hash] = entry
+            db.touch_cache_entries(entries)
             
-            return None
+            missing = [query_hash for _, query_hash in keys.values() if query_hash not in entries]
+            for query_hash, row in db.get_cached_entries(missing).items():
+                entries[query_hash] = ResponseCache._remember_row(query_hash, row)
+            
+            # Spread the batch's latency over its keys
+            seconds = (time.perf_counter() - start) / max(len(keys), 1)
+            results = {}
+            for item, (item_type, query_hash) in keys.items():
+                entry = entries.get(query_hash)
+                ResponseCache._record_lookup(item_type, entry, seconds)
+                results[item] = entry.value if entry and not entry.failure_kind else None
+            return results
         except Exception as e:
-            log_error("CACHE", f"Failed to retrieve cached result for {query_type}", str(e))
+            log_error("CACHE", "Failed to retrieve cached results", str(e))
+            return {}
+    
+    @staticmethod
+    def get_failure(query: str, query_type: str = "general") -> Optional[str]:
+        """Get the failure_kind of a live negative entry, if there is one."""
+        try:
+            entry = ResponseCache.lookup(query, query_type)
+            return entry.failure_kind if entry else None
+        except Exception as e:
+            log_error("CACHE", f"Failed to retrieve cached failure for {query_type}", str(e))
             return None
     
     @staticmethod
     def clear_expired() -> int:
         """Clear expired cache entries."""
         try:
+            ResponseCache.memory.purge_expired()
             count = db.clear_expired_cache()
             if count > 0:
                 log_info(f"Cleared {count} expired cache entries")
@@ -74,10 +635,37 @@ class ResponseCache:
             log_error("CACHE", "Failed to clear expired cache", str(e))
             return 0
     
+    @staticmethod
+    def invalidate_type(query_type: str) -> int:
+        """Invalidate every cached entry of query_type without scanning.
+        
+        Starts a new cache generation for the type; the old rows are deleted
+        by the sweeper's eviction pass. Returns the new generation.
+        """
+        generation = db.bump_cache_generation(query_type)
+        ResponseCache.memory.remove_type(query_type)
+        log_info(f"Invalidated cached {query_type} responses")
+        return generation
+    
+    @staticmethod
+    def watch_settings():
+        """Invalidate the types in SETTINGS_INVALIDATE when their settings change,
+        and drop the memory tier when the database is restored from a backup."""
+        db.add_settings_listener(ResponseCache._on_settings_changed,
+                                 keys=ResponseCache.SETTINGS_INVALIDATE)
+        db.add_restore_listener(ResponseCache.memory.clear)
+    
+    @staticmethod
+    def _on_settings_changed(changes: Dict[str, Any]):
+        query_types = {t for key in changes for t in ResponseCache.SETTINGS_INVALIDATE[key]}
+        for query_type in sorted(query_types):
+            ResponseCache.invalidate_type(query_type)
+    
     @staticmethod
     def clear_all() -> int:
         """Clear all cache."""
         try:
+            ResponseCache.memory.clear()
             count = db.clear_all_cache()
             log_info(f"Cleared all {count} cache entries")
             return count
@@ -86,35 +674,150 @@ class ResponseCache:
             return 0
 
 
+ResponseCache.watch_settings()
+
+
+def replay_hit_rate(queries: Iterable[Tuple[str, str]]) -> Dict[str, float]:
+    """Replay (query, query_type) pairs through an unbounded cache.
+    
+    Reports the hit rate of the old lowercase-and-strip keys next to that
+    of canonical keys, to measure what canonicalization buys.
+    """
+    raw_keys, canonical_keys = set(), set()
+    raw_hits = canonical_hits = total = 0
+    for query, query_type in queries:
+        total += 1
+        raw = (query_type, query.lower().strip())
+        canonical = (query_type, canonicalize_query(query, query_type))
+        raw_hits += raw in raw_keys
+        canonical_hits += canonical in canonical_keys
+        raw_keys.add(raw)
+        canonical_keys.add(canonical)
+    
+    return {
+        'queries': total,
+        'raw_hit_rate': raw_hits / total if total else 0.0,
+        'canonical_hit_rate': canonical_hits / total if total else 0.0,
+    }
+
+
+# Upstream fetches currently running, keyed by query hash
+_fetches = SingleFlight()
+
+
+def _decode_cached(cached: str) -> Any:
+    """Return JSON-decoded cached data, or the raw string."""
+    try:
+        return json.loads(cached)
+    except:
+        return cached
+
+
+def _timed_fetch(query_type: str, fetch_func) -> Any:
+    """Call fetch_func, recording how long it took in the fetch_time histogram."""
+    start = time.perf_counter()
+    try:
+        return fetch_func()
+    finally:
+        ResponseCache.metrics.observe(query_type, 'fetch_time', time.perf_counter() - start)
+
+
+def _refresh_in_background(query: str, query_type: str, fetch_func,
+                           ttl: int, hard_ttl: int):
+    """Re-fetch a stale entry on a worker thread unless a fetch is running."""
+    query_hash = ResponseCache.hash_query(query, query_type)
+    if _fetches.in_flight(query_hash):
+        return
+    
+    def refresh():
+        result = _timed_fetch(query_type, fetch_func)
+        if result:
+            ResponseCache.cache_result(query, result, query_type, ttl, hard_ttl)
+        return result
+    
+    def run():
+        try:
+            _fetches.do(query_hash, refresh)
+        except Exception as e:
+            log_error("CACHE", f"Background refresh failed for {query_type}", str(e))
+    
+    # A bare daemon thread: async_ops tasks are kept for the life of the
+    # process, and these refreshes are fire-and-forget
+    threading.Thread(target=run, name="leafy-cache-refresh", daemon=True).start()
+
+
 def get_cached_or_fetch(query: str, query_type: str, 
-                       fetch_func, ttl: int = ResponseCache.TTL_SHORT) -> Optional[Any]:
+                       fetch_func, ttl: int = ResponseCache.TTL_SHORT,
+                       hard_ttl: Optional[int] = None,
+                       negative_ttl: Optional[int] = None) -> Optional[Any]:
     """
     Get from cache or fetch fresh data.
     
+    Entries older than ttl but younger than hard_ttl are returned
+    immediately while a background refresh runs; only past hard_ttl does
+    the caller wait for fetch_func. Concurrent callers asking for the same
+    uncached query share a single call to fetch_func, including any
+    exception it raises.
+    
+    When fetch_func raises or returns nothing, a negative entry recording
+    the failure kind (the exception class name, or "empty") is cached for
+    negative_ttl seconds, and repeats return None without calling it.
+    Connectivity errors (OSError, which covers URLError, timeouts and
+    ConnectionError) and missing libraries (ImportError) say nothing
+    about the query and are not remembered.
+    
     Args:
         query: Search query
         query_type: Type of query (wikipedia, calculation, news, etc.)
         fetch_func: Function that fetches fresh data
-        ttl: Time to live in seconds
+        ttl: Time to live in seconds (soft expiry)
+        hard_ttl: Seconds until the entry can no longer be served; defaults
+            to ttl plus ResponseCache.STALE_GRACE for the query type
+        negative_ttl: Seconds to remember a failure; defaults to
+            ResponseCache.NEGATIVE_TTLS for the query type, 0 disables
     
     Returns:
         Cached or fresh result
     """
+    if hard_ttl is None:
+        hard_ttl = ttl + ResponseCache.STALE_GRACE.get(query_type, 0)
+    
     try:
         # Check cache first
-        cached = ResponseCache.get_cached(query, query_type)
-        if cached:
-            try:
-                return json.loads(cached)
-            except:
-                return cached
+        entry = ResponseCache.timed_lookup(query, query_type)
+        if entry and entry.failure_kind:
+            return None
+        if entry and entry.value:
+            if entry.is_stale():
+                _refresh_in_background(query, query_type, fetch_func, ttl, hard_ttl)
+            return _decode_cached(entry.value)
         
-        # Fetch fresh data
-        result = fetch_func()
-        if result:
-            ResponseCache.cache_result(query, result, query_type, ttl)
+        def remember_failure(failure_kind: str):
+            if negative_ttl != 0:
+                ResponseCache.cache_failure(query, query_type, failure_kind, negative_ttl)
         
-        return result
+        def fetch_and_cache():
+            # A fetch that finished just before this one started may have
+            # filled the cache already
+            entry = ResponseCache.lookup(query, query_type)
+            if entry and not entry.is_stale():
+                return None if entry.failure_kind else _decode_cached(entry.value)
+            
+            # Fetch fresh data
+            try:
+                result = _timed_fetch(query_type, fetch_func)
+            except Exception as e:
+                if not isinstance(e, (OSError, ImportError)):
+                    remember_failure(type(e).__name__)
+                raise
+            
+            if result:
+                ResponseCache.cache_result(query, result, query_type, ttl, hard_ttl)
+            else:
+                remember_failure(ResponseCache.FAILURE_EMPTY)
+            return result
+        
+        return _fetches.do(ResponseCache.hash_query(query, query_type), fetch_and_cache)
     except Exception as e:
         log_error("CACHE", f"Error in get_cached_or_fetch for {query_type}", str(e))
         return None
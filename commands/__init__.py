@@ -0,0 +1,149 @@
+"""
+Command plugins for Leafy
+Each plugin declares its intents up front; the module holding its handlers,
+and the libraries those handlers use, are imported on first dispatch
+"""
+
+import importlib
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+from intents import Intent, IntentMatch, IntentRouter, SLOT_AFTER, SLOT_REST
+from logger import log_info, log_error
+
+
+class CommandPlugin:
+    """A group of commands whose handlers live in one lazily imported module.
+
+    The module must define HANDLERS, mapping each intent name to a
+    function taking (assistant, match). A handler returning True stops
+    the command loop.
+    """
+
+    def __init__(self, name: str, module: str, intents: Iterable[Intent]):
+        self.name = name
+        self.module = module
+        self.intents = list(intents)
+        self._handlers = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._handlers is not None
+
+    def handlers(self) -> Dict[str, Callable]:
+        """Import the plugin module on first use and return its HANDLERS."""
+        if self._handlers is None:
+            with self._lock:
+                if self._handlers is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self.module)
+                    self._handlers = module.HANDLERS
+                    elapsed = (time.perf_counter() - start) * 1000
+                    log_info(f"Loaded command plugin {self.name} in {elapsed:.1f} ms")
+        return self._handlers
+
+
+class CommandRegistry:
+    """Routes utterances to the plugins that handle them."""
+
+    def __init__(self, plugins: Iterable[CommandPlugin]):
+        self.plugins = list(plugins)
+        self._plugins_by_intent = {}
+        for plugin in self.plugins:
+            for intent in plugin.intents:
+                if intent.name in self._plugins_by_intent:
+                    raise ValueError(f"Intent {intent.name} is declared twice")
+                self._plugins_by_intent[intent.name] = plugin
+        self.router = IntentRouter(intent for plugin in self.plugins for intent in plugin.intents)
+
+    @property
+    def intents(self) -> List[Intent]:
+        return self.router.intents
+
+    def route(self, text: str) -> Optional[IntentMatch]:
+        """The intent text would be dispatched to, if any."""
+        return self.router.match(text)
+
+    def dispatch(self, text: str, assistant) -> bool:
+        """Run the handler for text. Returns True if Leafy should stop listening.
+
+        assistant provides speak(text) and listen() to handlers. Commands
+        whose libraries are missing on this machine are apologised for
+        instead of failing.
+        """
+        match = self.router.match(text)
+        if match is None:
+            return False
+
+        plugin = self._plugins_by_intent[match.name]
+        try:
+            return bool(plugin.handlers()[match.name](assistant, match))
+        except ImportError as e:
+            log_error("COMMAND", f"Command {match.name} is unavailable", str(e))
+            assistant.speak("Sorry, I can't do that on this computer")
+            return False
+
+
+# Leafy's commands. Specific commands outrank lookups, lookups outrank
+# small talk, single-word power commands come after small talk, and the
+# catch-all "stop" comes last so "stop listening" wins.
+PLUGINS = [
+    CommandPlugin('session', 'commands.session', [
+        Intent('pause_listening', ["don't listen", "stop listening"], priority=60),
+        Intent('time', ["time"], priority=25),
+        Intent('exit', ["bye", "see ya later", "stop"], priority=0),
+    ]),
+    CommandPlugin('apps', 'commands.apps', [
+        Intent('open_app', [f"{verb} {app}" for verb in ("open", "launch")
+                            for app in ("photoshop", "word", "code", "chrome", "maya",
+                                        "counter strike", "apex")], priority=50),
+        Intent('open_website', ["open youtube", "open geeks for geeks"], priority=50),
+        Intent('play_music', ["play music", "play songs"], priority=50),
+        Intent('where_is', ["where is"], priority=40, slot=SLOT_AFTER),
+        Intent('search', ["search for"], priority=40, slot=SLOT_AFTER),
+    ]),
+    CommandPlugin('notes', 'commands.notes', [
+        Intent('write_note', ["write a note", "make a note"], priority=50),
+        Intent('show_notes', ["show notes"], priority=50),
+    ]),
+    CommandPlugin('system', 'commands.system', [
+        Intent('cpu', ["cpu status", "cpu temperature"], priority=50),
+        Intent('switch_window', ["switch window"], priority=50),
+        Intent('screenshot', ["take a screenshot", "screenshot this"], priority=50),
+        Intent('empty_recycle_bin', ["empty the recycle bin"], priority=50),
+        # Loose power words rank below small talk, so "i am sad i cannot
+        # sleep" or "i feel great, restart the music" never power off
+        Intent('restart', ["restart"], priority=5),
+        Intent('hibernate', ["hibernate", "go to sleep"], priority=5),
+        Intent('shutdown', ["shutdown", "turnoff"], priority=5),
+        Intent('log_off', ["log off", "sign out"], priority=45),
+    ]),
+    CommandPlugin('lookup', 'commands.lookup', [
+        Intent('wikipedia', ["wikipedia"], priority=40, slot=SLOT_REST),
+        Intent('calculate', ["calculate"], priority=40, slot=SLOT_AFTER),
+        Intent('news', ["news"], priority=25),
+        Intent('general', ["what is", "what's", "who is"], priority=20),
+    ]),
+    CommandPlugin('chat', 'commands.chat', [
+        Intent('how_are_you', ["how are you"], priority=30),
+        Intent('who_am_i', ["who am i"], priority=30),
+        Intent('about', ["why do you exist", "who are you"], priority=30),
+        Intent('creator', ["who made you", "who is your creator"], priority=30),
+        Intent('role_model', ["who do you look up to", "who inspires you"], priority=30),
+        Intent('name_origin', ["inspiration behind your name"], priority=30),
+        Intent('friends', ["do you have any friends"], priority=30),
+        Intent('joke', ["joke"], priority=20),
+        Intent('toss', ["toss a coin", "flip a coin", "toss"], priority=20),
+        Intent('mood_sad', ["upset", "sad"], priority=10),
+        Intent('mood_good', ["fine", "good", "great"], priority=10),
+    ]),
+]
+
+registry = CommandRegistry(PLUGINS)
+INTENTS = registry.intents
+
+
+def route(text: str) -> Optional[IntentMatch]:
+    """Route an utterance with Leafy's command table."""
+    return registry.route(text)
@@ -0,0 +1,64 @@
+"""Launching applications, websites, music and map/web searches."""
+
+import os
+import random
+import time
+import webbrowser
+
+# "open"/"launch" targets: (spoken name, shortcut)
+APPS = {
+    "photoshop": ("Adobe Photoshop 2021", "C:\\ProgramData\\Microsoft\\Windows\\Start Menu\\Programs\\Adobe Photoshop 2021.lnk"),
+    "word": ("Microsoft Word 2016", "C:\\ProgramData\\Microsoft\\Windows\\Start Menu\\Programs\\Word 2016.lnk"),
+    "code": ("Visual Studio Code", "C:\\Users\\Kahsish Khan\\AppData\\Roaming\\Microsoft\\Windows\\Start Menu\\Programs\\Visual Studio Code\\Visual Studio Code.lnk"),
+    "chrome": ("Google Chrome", "C:\\ProgramData\\Microsoft\\Windows\\Start Menu\\Programs\\Google Chrome.lnk"),
+    "maya": ("Maya 2022", "C:\\ProgramData\\Microsoft\\Windows\\Start Menu\\Programs\\Autodesk Maya 2022\\Maya 2022.lnk"),
+    "counter strike": ("Counter-Strike: Global Offensive", "C:\\Users\\Kahsish Khan\\AppData\\Roaming\\Microsoft\\Windows\\Start Menu\\Programs\\Steam\\Counter-Strike Global Offensive.url"),
+    "apex": ("Apex Legends", "C:\\Users\\Kahsish Khan\\AppData\\Roaming\\Microsoft\\Windows\\Start Menu\\Programs\\Steam\\Apex Legends.url"),
+}
+
+WEBSITES = {
+    "open youtube": "youtube.com",
+    "open geeks for geeks": "google.com",
+}
+
+MUSIC_DIR = "D:\\Leafy\\music"
+
+
+def open_app(assistant, match):
+    name, shortcut = APPS[match.phrase.split(" ", 1)[1]]
+    assistant.speak("Opening " + name)
+    print("Opening " + name)
+    os.startfile(shortcut)
+
+
+def open_website(assistant, match):
+    assistant.speak('At your service!')
+    webbrowser.open(WEBSITES[match.phrase])
+
+
+def play_music(assistant, match):
+    import playsound
+    music = os.listdir(MUSIC_DIR)
+    song = os.path.join(MUSIC_DIR, random.choice(music))
+    playsound.playsound(song)
+
+
+def where_is(assistant, match):
+    location = match.slot
+    assistant.speak("Locating....")
+    assistant.speak(location)
+    webbrowser.open("https://www.google.com/maps/place/" + location + "")
+
+
+def search(assistant, match):
+    webbrowser.open_new_tab(match.slot)
+    time.sleep(5)
+
+
+HANDLERS = {
+    'open_app': open_app,
+    'open_website': open_website,
+    'play_music': play_music,
+    'where_is': where_is,
+    'search': search,
+}
@@ -0,0 +1,63 @@
+"""Small talk, jokes and coin tosses."""
+
+import random
+
+
+def how_are_you(assistant, match):
+    assistant.speak("I am fine, Thank you")
+    assistant.speak("How are you doing?")
+
+
+def mood_good(assistant, match):
+    assistant.speak("I'm glad")
+
+
+def mood_sad(assistant, match):
+    assistant.speak("It is ok, things will get better for you, I am sure.")
+    assistant.speak("Do you want me to cheer you up with a joke?")
+
+    pr = assistant.listen()
+
+    if 'yes' in pr or 'sure' in pr or 'ok' in pr:
+        joke(assistant, match)
+
+    else:
+        assistant.speak("Just trying to help")
+
+
+def joke(assistant, match):
+    import pyjokes
+    text = pyjokes.get_joke(language='en', category='neutral')
+    assistant.speak(text)
+    print(text)
+
+
+def toss(assistant, match):
+    moves = ["head", "tails"]
+    cmove = random.choice(moves)
+    assistant.speak("It's " + cmove)
+
+
+# Intents answered with a fixed line
+REPLIES = {
+    'who_am_i': "You sound like you're human.",
+    'about': "I am Kashish's final year project, and also I like to help people out!",
+    'creator': "My creator is looking at the screen right now.",
+    'role_model': "I want to be as great as Alexa and Siri someday!",
+    'name_origin': "One fine day, while playing games in the computer lab, Kashish had an eureka moment",
+    'friends': "Yeah, one, it's Kashish!",
+}
+
+
+def reply(assistant, match):
+    assistant.speak(REPLIES[match.name])
+
+
+HANDLERS = {
+    'how_are_you': how_are_you,
+    'mood_good': mood_good,
+    'mood_sad': mood_sad,
+    'joke': joke,
+    'toss': toss,
+    **{name: reply for name in REPLIES},
+}
@@ -0,0 +1,103 @@
+"""Answers looked up online: Wikipedia, WolframAlpha and the news.
+
+Lookups go through the response cache under the same (query, query_type)
+keys warmup.classify_command() predicts, so prefetched answers are served.
+"""
+
+import json
+from urllib.request import urlopen
+from cache import ResponseCache, get_cached_or_fetch
+
+WOLFRAM_APP_ID = "WVQW42-4XEJ25LEYJ"
+NEWS_URL = 'https://newsapi.org/v2/top-headlines?country=in&apiKey=81d89036c7f644cc90afa75866b7ee7c'
+NEWS_QUERY = "top headlines"
+
+
+def fetch_wikipedia(query):
+    import wikipedia
+    return wikipedia.summary(query, sentences=2)
+
+
+def fetch_answer(query):
+    """WolframAlpha's first answer, or "" if it has none."""
+    import wolframalpha
+    client = wolframalpha.Client(WOLFRAM_APP_ID)
+    res = client.query(query)
+    return next((result.text for result in res.results), "")
+
+
+def fetch_news(query):
+    data = json.load(urlopen(NEWS_URL))
+    return [{'title': item['title'], 'description': item['description']}
+            for item in data['articles']]
+
+
+# Fetchers for CacheWarmer, by query_type
+FETCHERS = {
+    'wikipedia': fetch_wikipedia,
+    'calculation': fetch_answer,
+    'general': fetch_answer,
+    'news': fetch_news,
+}
+
+
+# Handlers import their library first so a missing one is reported by
+# CommandRegistry.dispatch instead of being swallowed by the cache
+def wikipedia_summary(assistant, match):
+    import wikipedia
+    assistant.speak('Searching wikipedia...')
+    results = get_cached_or_fetch(match.slot, 'wikipedia', lambda: fetch_wikipedia(match.slot),
+                                  ResponseCache.TTL_WIKIPEDIA)
+    if not results:
+        print("No results")
+        return
+    assistant.speak("According to Wikipedia")
+    print(results)
+    assistant.speak(str(results))
+
+
+def calculate(assistant, match):
+    import wolframalpha
+    answer = get_cached_or_fetch(match.slot, 'calculation', lambda: fetch_answer(match.slot),
+                                 ResponseCache.TTL_CALCULATION)
+    if not answer:
+        print("No results")
+        return
+    print("The answer is " + str(answer))
+    assistant.speak("The answer is " + str(answer))
+
+
+def general(assistant, match):
+    import wolframalpha
+    answer = get_cached_or_fetch(match.text, 'general', lambda: fetch_answer(match.text))
+
+    if answer:
+        print(answer)
+        assistant.speak(str(answer))
+
+    else:
+        print("No results")
+
+
+def news(assistant, match):
+    articles = get_cached_or_fetch(NEWS_QUERY, 'news', lambda: fetch_news(NEWS_QUERY),
+                                   ResponseCache.TTL_NEWS)
+    if not articles:
+        print("Could not fetch the news")
+        return
+
+    assistant.speak('Here are some top Headlines from the times of india')
+    print('=============== TIMES OF INDIA ============' + '\n')
+
+    for i, item in enumerate(articles, start=1):
+        print(str(i) + '. ' + item['title'] + '\n')
+        print(str(item['description']) + '\n')
+        assistant.speak(str(i) + '. ' + item['title'] + '\n')
+
+
+HANDLERS = {
+    'wikipedia': wikipedia_summary,
+    'calculate': calculate,
+    'general': general,
+    'news': news,
+}
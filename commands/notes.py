@@ -0,0 +1,33 @@
+"""Writing and reading back the notes file."""
+
+import datetime
+
+NOTES_FILE = 'leafy.txt'
+
+
+def write_note(assistant, match):
+    assistant.speak('OK, what would you like me to note down?')
+    note = assistant.listen()
+    assistant.speak("Do you want me to mention the date and time too?")
+    sn = assistant.listen()
+
+    with open(NOTES_FILE, 'w') as file:
+        if 'yes' in sn or 'sure' in sn or 'yup' in sn:
+            strTime = datetime.datetime.now().strftime("%H:%M:%S")
+            file.write(strTime)
+        file.write(note)
+    assistant.speak("Noted")
+
+
+def show_notes(assistant, match):
+    assistant.speak('Here you go')
+    with open(NOTES_FILE, 'r') as file:
+        notes = file.read()
+    print(notes)
+    assistant.speak(notes[:6])
+
+
+HANDLERS = {
+    'write_note': write_note,
+    'show_notes': show_notes,
+}
@@ -0,0 +1,29 @@
+"""Session commands: the time, pausing and signing out."""
+
+import datetime
+import time
+
+
+def tell_time(assistant, match):
+    strTime = datetime.datetime.now().strftime("%H:%M:%S")
+    assistant.speak(f"the time is {strTime}")
+
+
+def pause_listening(assistant, match):
+    assistant.speak("for how long do you not want me to listen?")
+    a = int(assistant.listen())
+    time.sleep(a)
+    print(a)
+
+
+def sign_off(assistant, match):
+    assistant.speak('Leafy, Signing out!')
+    print('Leafy, Signing out!')
+    return True
+
+
+HANDLERS = {
+    'time': tell_time,
+    'pause_listening': pause_listening,
+    'exit': sign_off,
+}
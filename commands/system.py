@@ -0,0 +1,74 @@
+"""System status, desktop control and power commands (Windows)."""
+
+import subprocess
+import time
+
+
+def cpu(assistant, match):
+    import psutil
+    usage = str(psutil.cpu_percent())
+    assistant.speak("CPU is at" + usage)
+    battery = str(psutil.sensors_battery())
+    assistant.speak("CPU is at" + battery)
+
+
+def switch_window(assistant, match):
+    import pyautogui
+    pyautogui.keyDown('alt')
+    pyautogui.press('tab')
+    time.sleep(1)
+    pyautogui.keyUp('alt')
+
+
+def screenshot(assistant, match):
+    import pyautogui
+    assistant.speak("What should I name the screenshot?")
+    name = assistant.listen().lower()
+    assistant.speak("Please hold the screen")
+    time.sleep(2)
+    img = pyautogui.screenshot()
+    img.save(f"{name}.png")
+    assistant.speak("Done")
+
+
+def empty_recycle_bin(assistant, match):
+    import winshell
+    winshell.recycle_bin().empty(confirm=True, show_progress=False, sound=True)
+    assistant.speak("Recycle Bin Recycled")
+
+
+def restart(assistant, match):
+    subprocess.call(["shutdown", "/r"])
+    time.sleep(10)
+
+
+def hibernate(assistant, match):
+    assistant.speak("Hibernating", interruptible=False).wait()
+    subprocess.call("shutdown / h")
+    time.sleep(5)
+
+
+def shutdown(assistant, match):
+    assistant.speak("Shut down in process.", interruptible=False)
+    assistant.speak("You have 10 seconds to close and save everything.", interruptible=False).wait()
+    subprocess.call("shutdown / s")
+    time.sleep(10)
+
+
+def log_off(assistant, match):
+    assistant.speak("Ok, your system will log off in 10 seconds make sure you exit from all applications",
+                    interruptible=False).wait()
+    subprocess.call(["shutdown", "/l"])
+    time.sleep(5)
+
+
+HANDLERS = {
+    'cpu': cpu,
+    'switch_window': switch_window,
+    'screenshot': screenshot,
+    'empty_recycle_bin': empty_recycle_bin,
+    'restart': restart,
+    'hibernate': hibernate,
+    'shutdown': shutdown,
+    'log_off': log_off,
+}
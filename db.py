@@ -3,29 +3,327 @@ SQLite Database module for Leafy
 Handles persistent storage of notes, history, settings, and cache
 """
 
+import atexit
+import os
+import queue
+import shutil
 import sqlite3
 import json
-from datetime import datetime
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional, List, Dict, Any
+from async_ops import run_async
 from logger import log_info, log_error
 
 DB_PATH = Path(__file__).parent / 'data' / 'leafy.db'
 
+# Connection tuning
+CACHE_SIZE_KB = 8192  # page cache per connection
+STATEMENT_CACHE_SIZE = 256  # prepared statements kept per connection
+BUSY_TIMEOUT = 5.0  # seconds to wait on a locked database
+
+# Write-behind defaults for command history
+WRITE_BEHIND_BATCH_SIZE = 50
+WRITE_BEHIND_FLUSH_MS = 200
+
+# Rows fetched per query by the streaming iter_* methods
+PAGE_SIZE = 100
+
+# command_history statuses counted as failures in the usage rollups
+FAILED_STATUSES = ('failed', 'error')
+
+# Background expiry sweep for response_cache
+CACHE_SWEEP_INTERVAL = 300  # seconds between sweeps
+CACHE_SWEEP_BATCH_SIZE = 200  # rows deleted per transaction
+CACHE_SWEEP_PAUSE = 0.05  # seconds between batches, lets other writers in
+
+# response_cache size budget, enforced by evict_cache() and the sweeper
+CACHE_MAX_BYTES = 50 * 1024 * 1024  # 50 MB of cached responses
+CACHE_TYPE_QUOTAS = {}  # query_type -> max bytes for that type
+CACHE_EVICTION_POLICY = 'lru'
+CACHE_TOUCH_FLUSH_SIZE = 500  # buffered hit updates written in one transaction
+CACHE_BATCH_SIZE = 500  # keys per IN (...) lookup, under SQLite's variable limit
+
+# Cached payloads are stored as a one-byte codec header followed by the body;
+# rows written before this was introduced are plain TEXT
+CODEC_RAW = 0  # utf-8 bytes
+CODEC_ZLIB = 1  # zlib-compressed utf-8 bytes
+CACHE_COMPRESS_MIN_BYTES = 1024  # smaller payloads are stored raw
+CACHE_COMPRESS_LEVEL = 6
+
+# Which entries evict_cache() removes first, per policy
+EVICTION_ORDER = {
+    'lru': 'last_access ASC',
+    'lfu': 'hit_count ASC, last_access ASC',
+    # Big, rarely hit entries that have sat idle longest
+    'size': "size_bytes * (CAST(strftime('%s', 'now') AS INTEGER) - last_access + 1) "
+            "/ (hit_count + 1.0) DESC",
+}
+
+# Online backups
+BACKUP_DIR_NAME = 'backups'
+LATEST_BACKUP_NAME = 'leafy_backup_latest.db'
+BACKUP_PAGES_PER_STEP = 256  # pages copied before yielding to writers
+BACKUP_STEP_SLEEP = 0.01  # seconds between backup steps
+BACKUP_KEEP_DAILY = 7
+BACKUP_KEEP_WEEKLY = 4
+BACKUP_NAME_PATTERN = re.compile(r'^leafy_backup_(\d{8}_\d{6})\.db$')
+
+# Markers wrapped around matched terms in note search snippets
+HIGHLIGHT_START = '['
+HIGHLIGHT_END = ']'
+SNIPPET_TOKENS = 12
+
+
+def _sqlite_timestamp() -> str:
+    """Current UTC time in the format produced by CURRENT_TIMESTAMP."""
+    return datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def encode_payload(text: str, min_bytes: Optional[int] = None) -> bytes:
+    """Encode a cached response as a codec header plus body.
+    
+    Payloads of at least min_bytes (default CACHE_COMPRESS_MIN_BYTES) are
+    zlib-compressed when that makes them smaller.
+    """
+    body = text.encode('utf-8')
+    threshold = CACHE_COMPRESS_MIN_BYTES if min_bytes is None else min_bytes
+    if len(body) >= threshold:
+        compressed = zlib.compress(body, CACHE_COMPRESS_LEVEL)
+        if len(compressed) < len(body):
+            return bytes((CODEC_ZLIB,)) + compressed
+    return bytes((CODEC_RAW,)) + body
+
+
+def decode_payload(value) -> str:
+    """Decode a stored response: encoded BLOBs or legacy TEXT."""
+    if isinstance(value, str):
+        return value
+    codec, body = value[0], value[1:]
+    if codec == CODEC_ZLIB:
+        body = zlib.decompress(body)
+    elif codec != CODEC_RAW:
+        raise ValueError(f"Unknown cache payload codec: {codec}")
+    return body.decode('utf-8')
+
+
+class ConnectionPool:
+    """Hands out one long-lived SQLite connection per thread."""
+    
+    def __init__(self, db_path: Path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {}  # thread ident -> (thread, connection)
+        self._closed = False
+    
+    def _connect(self) -> sqlite3.Connection:
+        """Open and tune a new connection."""
+        # Each connection is only used by the thread that opened it; the
+        # flag is relaxed so close_all() can run from any thread.
+        conn = sqlite3.connect(str(self.db_path), timeout=BUSY_TIMEOUT,
+                               cached_statements=STATEMENT_CACHE_SIZE,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KB}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+    
+    def _prune_dead_threads(self):
+        """Close connections owned by threads that have exited."""
+        for ident, (thread, conn) in list(self._connections.items()):
+            if not thread.is_alive():
+                del self._connections[ident]
+                conn.close()
+    
+    def get(self) -> sqlite3.Connection:
+        """Get the calling thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn
+        
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+            self._prune_dead_threads()
+            conn = self._connect()
+            self._connections[threading.get_ident()] = (threading.current_thread(), conn)
+        
+        self._local.conn = conn
+        return conn
+    
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection to the pool, rolling back unfinished work."""
+        if conn.in_transaction:
+            conn.rollback()
+    
+    def close_all(self):
+        """Close every pooled connection."""
+        with self._lock:
+            self._closed = True
+            for thread, conn in self._connections.values():
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+    
+    def size(self) -> int:
+        """Number of open pooled connections."""
+        with self._lock:
+            return len(self._connections)
+
+
+class CommandWriter:
+    """Batches command history inserts on a single background writer thread."""
+    
+    _STOP = object()
+    
+    def __init__(self, database: 'Database', batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval_ms: int = WRITE_BEHIND_FLUSH_MS):
+        self.database = database
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="leafy-command-writer",
+                                        daemon=True)
+        self._thread.start()
+    
+    def submit(self, row: tuple):
+        """Queue a command_history row for the next batch."""
+        self._queue.put(row)
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every row queued so far has been committed."""
+        barrier = threading.Event()
+        self._queue.put(barrier)
+        return barrier.wait(timeout)
+    
+    def close(self, timeout: Optional[float] = None):
+        """Drain the queue and stop the writer thread."""
+        self._queue.put(self._STOP)
+        self._thread.join(timeout)
+    
+    def _run(self):
+        stopping = False
+        while not stopping:
+            rows, barriers = [], []
+            item = self._queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            
+            while True:
+                if item is self._STOP:
+                    stopping = True
+                    break
+                if isinstance(item, threading.Event):
+                    barriers.append(item)
+                    break
+                rows.append(item)
+                
+                remaining = deadline - time.monotonic()
+                if len(rows) >= self.batch_size or remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            
+            if rows:
+                self.database._insert_commands(rows)
+            for barrier in barriers:
+                barrier.set()
+
+
+class CacheSweeper:
+    """Periodically deletes expired response_cache rows in small batches,
+    then evicts entries over the cache size budget."""
+    
+    def __init__(self, database: 'Database', interval: float = CACHE_SWEEP_INTERVAL,
+                 batch_size: int = CACHE_SWEEP_BATCH_SIZE, pause: float = CACHE_SWEEP_PAUSE):
+        self.database = database
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="leafy-cache-sweeper",
+                                        daemon=True)
+        self._thread.start()
+    
+    def sweep(self) -> int:
+        """Run one full sweep, yielding the write lock between batches."""
+        now = int(time.time())
+        total = 0
+        while not self._stop.is_set():
+            deleted = self.database._delete_expired_batch(now, self.batch_size)
+            total += deleted
+            if deleted < self.batch_size:
+                break
+            self._stop.wait(self.pause)
+        
+        if total:
+            log_info(f"Cache sweeper removed {total} expired entries")
+        if not self._stop.is_set():
+            total += self.database.evict_cache(batch_size=self.batch_size)
+        return total
+    
+    def stop(self, timeout: Optional[float] = None):
+        """Stop the sweeper thread."""
+        self._stop.set()
+        self._thread.join(timeout)
+    
+    def _run(self):
+        # Sweep at startup too: the last session may have left the cache over budget
+        self.sweep()
+        while not self._stop.wait(self.interval):
+            self.sweep()
+
 
 class Database:
     """SQLite database manager for Leafy."""
     
-    def __init__(self):
-        DB_PATH.parent.mkdir(exist_ok=True)
-        self.db_path = DB_PATH
+    def __init__(self, db_path: Optional[Path] = None):
+        self.db_path = Path(db_path) if db_path else DB_PATH
+        self.db_path.parent.mkdir(exist_ok=True)
+        self.pool = ConnectionPool(self.db_path)
+        self.command_writer = None
+        self.cache_sweeper = None
+        self.fts_enabled = False
+        self._settings = None
+        self._settings_lock = threading.RLock()
+        self._settings_listeners = []
+        self._restore_listeners = []
+        self.cache_max_bytes = CACHE_MAX_BYTES
+        self.cache_type_quotas = dict(CACHE_TYPE_QUOTAS)
+        self.cache_eviction_policy = CACHE_EVICTION_POLICY
+        self._cache_touches = {}
+        self._cache_touches_lock = threading.Lock()
+        self._cache_evictions = {}  # query_type -> entries evicted since startup
+        self._cache_evictions_lock = threading.Lock()
+        self._cache_generations = None  # query_type -> generation, loaded on first use
+        self._cache_generations_lock = threading.Lock()
         self.init_database()
     
     def get_connection(self):
-        """Get database connection."""
-        conn = sqlite3.connect(str(self.db_path))
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Get the calling thread's pooled database connection."""
+        return self.pool.get()
+    
+    def release_connection(self, conn):
+        """Hand a connection back to the pool after an operation."""
+        self.pool.release(conn)
+    
+    def close(self):
+        """Drain queued writes and close all pooled connections (called at exit)."""
+        self.stop_cache_sweeper()
+        self.disable_write_behind()
+        self.flush_cache_touches()
+        self.pool.close_all()
     
     def init_database(self):
         """Initialize database tables."""
@@ -44,6 +342,7 @@ class Database:
                     tags TEXT
                 )
             ''')
+            self.fts_enabled = self._init_notes_fts(cursor)
             
             # Command history table
             cursor.execute('''
@@ -56,6 +355,7 @@ class Database:
                     result TEXT
                 )
             ''')
+            self._init_command_stats(cursor)
             
             # Settings table
             cursor.execute('''
@@ -73,23 +373,260 @@ class Database:
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
                     query_hash TEXT UNIQUE NOT NULL,
                     query_type TEXT NOT NULL,
-                    response TEXT NOT NULL,
+                    response BLOB NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    ttl_seconds INTEGER DEFAULT 86400
+                    ttl_seconds INTEGER DEFAULT 86400,
+                    expires_at INTEGER,
+                    stale_at INTEGER,
+                    failure_kind TEXT,
+                    last_access INTEGER,
+                    hit_count INTEGER DEFAULT 0,
+                    size_bytes INTEGER DEFAULT 0,
+                    generation INTEGER DEFAULT 0
                 )
             ''')
             
+            # Current generation of each query_type's cache namespace
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS cache_generations (
+                    query_type TEXT PRIMARY KEY,
+                    generation INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            
+            # Migrate databases created before expires_at existed
+            if self._add_column(cursor, 'response_cache', 'expires_at', 'INTEGER'):
+                cursor.execute('''
+                    UPDATE response_cache
+                    SET expires_at = CAST(strftime('%s', created_at) AS INTEGER) + ttl_seconds
+                ''')
+                log_info("Migrated response_cache to indexed expiry column")
+            if self._add_column(cursor, 'response_cache', 'stale_at', 'INTEGER'):
+                cursor.execute('UPDATE response_cache SET stale_at = expires_at')
+            self._add_column(cursor, 'response_cache', 'failure_kind', 'TEXT')
+            if self._add_column(cursor, 'response_cache', 'last_access', 'INTEGER'):
+                cursor.execute('''
+                    UPDATE response_cache
+                    SET last_access = CAST(strftime('%s', created_at) AS INTEGER)
+                ''')
+            self._add_column(cursor, 'response_cache', 'hit_count', 'INTEGER DEFAULT 0')
+            if self._add_column(cursor, 'response_cache', 'size_bytes', 'INTEGER DEFAULT 0'):
+                cursor.execute('UPDATE response_cache SET size_bytes = length(CAST(response AS BLOB))')
+            self._add_column(cursor, 'response_cache', 'generation', 'INTEGER DEFAULT 0')
+            
             # Create indexes for faster queries
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_notes_title ON notes(title)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_notes_updated_at ON notes(updated_at)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_command_history_timestamp ON command_history(timestamp)')
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_cache_query_hash ON response_cache(query_hash)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_cache_expires_at ON response_cache(expires_at)')
             
             conn.commit()
             log_info("Database initialized")
         except Exception as e:
             log_error("DATABASE", "Failed to initialize database", str(e))
         finally:
-            conn.close()
+            self.release_connection(conn)
+    
+    @staticmethod
+    def _add_column(cursor, table: str, column: str, definition: str) -> bool:
+        """Add a column to an existing table. Returns True if it was missing."""
+        cursor.execute(f'PRAGMA table_info({table})')
+        if column in {row[1] for row in cursor.fetchall()}:
+            return False
+        
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+        return True
+    
+    def _init_command_stats(self, cursor):
+        """Create the command usage rollup tables and their insert trigger."""
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'command_stats'")
+        existed = cursor.fetchone() is not None
+        
+        # Totals per command
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS command_stats (
+                command TEXT PRIMARY KEY,
+                count INTEGER NOT NULL DEFAULT 0,
+                total_duration REAL NOT NULL DEFAULT 0,
+                max_duration REAL NOT NULL DEFAULT 0,
+                failure_count INTEGER NOT NULL DEFAULT 0,
+                last_used TIMESTAMP
+            )
+        ''')
+        
+        # Totals per command per day
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS command_stats_daily (
+                day TEXT NOT NULL,
+                command TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                total_duration REAL NOT NULL DEFAULT 0,
+                max_duration REAL NOT NULL DEFAULT 0,
+                failure_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, command)
+            )
+        ''')
+        
+        failed = ', '.join(f"'{status}'" for status in FAILED_STATUSES)
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS command_stats_insert AFTER INSERT ON command_history BEGIN
+                INSERT INTO command_stats
+                    (command, count, total_duration, max_duration, failure_count, last_used)
+                VALUES (new.command, 1, COALESCE(new.duration, 0), COALESCE(new.duration, 0),
+                        new.status IN ({failed}), new.timestamp)
+                ON CONFLICT(command) DO UPDATE SET
+                    count = count + 1,
+                    total_duration = total_duration + excluded.total_duration,
+                    max_duration = MAX(max_duration, excluded.max_duration),
+                    failure_count = failure_count + excluded.failure_count,
+                    last_used = MAX(last_used, excluded.last_used);
+                
+                INSERT INTO command_stats_daily
+                    (day, command, count, total_duration, max_duration, failure_count)
+                VALUES (date(new.timestamp), new.command, 1, COALESCE(new.duration, 0),
+                        COALESCE(new.duration, 0), new.status IN ({failed}))
+                ON CONFLICT(day, command) DO UPDATE SET
+                    count = count + 1,
+                    total_duration = total_duration + excluded.total_duration,
+                    max_duration = MAX(max_duration, excluded.max_duration),
+                    failure_count = failure_count + excluded.failure_count;
+            END
+        ''')
+        
+        if not existed:
+            self._rebuild_command_stats(cursor)
+    
+    @staticmethod
+    def _rebuild_command_stats(cursor):
+        """Recompute both rollup tables from command_history."""
+        failed = ', '.join(f"'{status}'" for status in FAILED_STATUSES)
+        cursor.execute('DELETE FROM command_stats')
+        cursor.execute('DELETE FROM command_stats_daily')
+        cursor.execute(f'''
+            INSERT INTO command_stats
+                (command, count, total_duration, max_duration, failure_count, last_used)
+            SELECT command, COUNT(*), TOTAL(duration), COALESCE(MAX(duration), 0),
+                   SUM(status IN ({failed})), MAX(timestamp)
+            FROM command_history
+            GROUP BY command
+        ''')
+        cursor.execute(f'''
+            INSERT INTO command_stats_daily
+                (day, command, count, total_duration, max_duration, failure_count)
+            SELECT date(timestamp), command, COUNT(*), TOTAL(duration),
+                   COALESCE(MAX(duration), 0), SUM(status IN ({failed}))
+            FROM command_history
+            GROUP BY date(timestamp), command
+        ''')
+    
+    def _init_notes_fts(self, cursor) -> bool:
+        """Create the notes full-text index and the triggers that keep it in sync.
+        
+        Returns False when this SQLite build has no FTS5 support.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'notes_fts'")
+        existed = cursor.fetchone() is not None
+        
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+                    title, content, tags,
+                    content='notes', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            ''')
+        except sqlite3.OperationalError as e:
+            log_info(f"FTS5 not available, note search will use LIKE: {e}")
+            return False
+        
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS notes_fts_insert AFTER INSERT ON notes BEGIN
+                INSERT INTO notes_fts (rowid, title, content, tags)
+                VALUES (new.id, new.title, new.content, new.tags);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS notes_fts_delete AFTER DELETE ON notes BEGIN
+                INSERT INTO notes_fts (notes_fts, rowid, title, content, tags)
+                VALUES ('delete', old.id, old.title, old.content, old.tags);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS notes_fts_update AFTER UPDATE ON notes BEGIN
+                INSERT INTO notes_fts (notes_fts, rowid, title, content, tags)
+                VALUES ('delete', old.id, old.title, old.content, old.tags);
+                INSERT INTO notes_fts (rowid, title, content, tags)
+                VALUES (new.id, new.title, new.content, new.tags);
+            END
+        ''')
+        
+        if not existed:
+            # One-time backfill for databases created before the index existed
+            cursor.execute("INSERT INTO notes_fts (notes_fts) VALUES ('rebuild')")
+            log_info("Notes search index built")
+        
+        return True
+    
+    @staticmethod
+    def _fts_query(keyword: str, prefix: bool = True) -> str:
+        """Turn user search text into an FTS5 MATCH expression.
+        
+        "Quoted text" becomes a phrase query, other words must all match, and
+        the last bare word also matches as a prefix.
+        """
+        phrases = re.findall(r'"([^"]*)"', keyword)
+        words = re.findall(r'\w+', re.sub(r'"[^"]*"', ' ', keyword))
+        
+        terms = []
+        for phrase in phrases:
+            tokens = re.findall(r'\w+', phrase)
+            if tokens:
+                terms.append('"' + ' '.join(tokens) + '"')
+        for word in words:
+            terms.append(f'"{word}"')
+        
+        if prefix and words:
+            terms[-1] += '*'
+        return ' '.join(terms)
+    
+    def _iter_keyset(self, table: str, order_key: str, where: str = '',
+                     params: tuple = (), page_size: int = PAGE_SIZE):
+        """Yield rows newest first, one keyset page per query.
+        
+        Pages are ordered by (order_key, id) and each query resumes after the
+        last row seen, so memory stays constant and no connection or read
+        transaction is held while the caller consumes rows.
+        """
+        conditions = [where] if where else []
+        last = None
+        
+        while True:
+            page_conditions = list(conditions)
+            page_params = list(params)
+            if last is not None:
+                page_conditions.append(f'({order_key}, id) < (?, ?)')
+                page_params.extend(last)
+            clause = f"WHERE {' AND '.join(page_conditions)}" if page_conditions else ''
+            
+            conn = self.get_connection()
+            try:
+                rows = conn.execute(f'''
+                    SELECT * FROM {table}
+                    {clause}
+                    ORDER BY {order_key} DESC, id DESC
+                    LIMIT ?
+                ''', page_params + [page_size]).fetchall()
+            except Exception as e:
+                log_error("DATABASE", f"Failed to read {table} page", str(e))
+                return
+            finally:
+                self.release_connection(conn)
+            
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last = (rows[-1][order_key], rows[-1]['id'])
     
     # ============ NOTES OPERATIONS ============
     
@@ -99,9 +636,15 @@ class Database:
         cursor = conn.cursor()
         
         try:
+            # Upsert rather than REPLACE so the note keeps its id and the
+            # search index triggers see an UPDATE instead of a silent delete.
             cursor.execute('''
-                INSERT OR REPLACE INTO notes (title, content, tags, updated_at)
+                INSERT INTO notes (title, content, tags, updated_at)
                 VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT(title) DO UPDATE SET
+                    content = excluded.content,
+                    tags = excluded.tags,
+                    updated_at = excluded.updated_at
             ''', (title, content, tags))
             
             conn.commit()
@@ -111,7 +654,7 @@ class Database:
             log_error("DATABASE", f"Failed to save note: {title}", str(e))
             return False
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     def get_note(self, title: str) -> Optional[Dict]:
         """Retrieve a note by title."""
@@ -126,26 +669,60 @@ class Database:
             log_error("DATABASE", f"Failed to get note: {title}", str(e))
             return None
         finally:
-            conn.close()
+            self.release_connection(conn)
     
-    def search_notes(self, keyword: str) -> List[Dict]:
-        """Search notes by keyword."""
+    def search_notes(self, keyword: str, limit: Optional[int] = None,
+                     snippets: bool = False) -> List[Dict]:
+        """Search notes by keyword.
+        
+        With the full-text index, results are ranked by relevance, the last
+        word matches as a prefix and "quoted text" matches as a phrase.
+        snippets=True adds highlighted 'snippet' and 'title_highlight' fields.
+        Without FTS5, falls back to substring matching ordered by update time.
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
+        limit = -1 if limit is None else limit
         
         try:
-            cursor.execute('''
-                SELECT * FROM notes 
-                WHERE title LIKE ? OR content LIKE ? OR tags LIKE ?
-                ORDER BY updated_at DESC
-            ''', (f'%{keyword}%', f'%{keyword}%', f'%{keyword}%'))
+            if not self.fts_enabled:
+                cursor.execute('''
+                    SELECT * FROM notes 
+                    WHERE title LIKE ? OR content LIKE ? OR tags LIKE ?
+                    ORDER BY updated_at DESC
+                    LIMIT ?
+                ''', (f'%{keyword}%', f'%{keyword}%', f'%{keyword}%', limit))
+                return [dict(row) for row in cursor.fetchall()]
+            
+            match = self._fts_query(keyword)
+            if not match:
+                return []
+            
+            extra = ''
+            params = []
+            if snippets:
+                extra = ''',
+                    snippet(notes_fts, 1, ?, ?, '...', ?) AS snippet,
+                    highlight(notes_fts, 0, ?, ?) AS title_highlight'''
+                params = [HIGHLIGHT_START, HIGHLIGHT_END, SNIPPET_TOKENS,
+                          HIGHLIGHT_START, HIGHLIGHT_END]
+            
+            # Title matches weigh most, then tags, then body text
+            cursor.execute(f'''
+                SELECT notes.*, bm25(notes_fts, 10.0, 1.0, 5.0) AS rank{extra}
+                FROM notes_fts
+                JOIN notes ON notes.id = notes_fts.rowid
+                WHERE notes_fts MATCH ?
+                ORDER BY rank
+                LIMIT ?
+            ''', params + [match, limit])
             
             return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
             log_error("DATABASE", f"Failed to search notes: {keyword}", str(e))
             return []
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     def delete_note(self, title: str) -> bool:
         """Delete a note."""
@@ -160,7 +737,7 @@ class Database:
             log_error("DATABASE", f"Failed to delete note: {title}", str(e))
             return False
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     def list_notes(self, limit: int = 50) -> List[Dict]:
         """List all notes."""
@@ -180,32 +757,89 @@ class Database:
             log_error("DATABASE", "Failed to list notes", str(e))
             return []
         finally:
-            conn.close()
+            self.release_connection(conn)
+    
+    def iter_notes(self, page_size: int = PAGE_SIZE):
+        """Stream every note, most recently updated first."""
+        return self._iter_keyset('notes', 'updated_at', page_size=page_size)
+    
+    def iter_search_notes(self, keyword: str, page_size: int = PAGE_SIZE):
+        """Stream notes matching keyword, most recently updated first."""
+        if self.fts_enabled:
+            match = self._fts_query(keyword)
+            if not match:
+                return iter(())
+            return self._iter_keyset(
+                'notes', 'updated_at',
+                'id IN (SELECT rowid FROM notes_fts WHERE notes_fts MATCH ?)',
+                (match,), page_size)
+        
+        pattern = f'%{keyword}%'
+        return self._iter_keyset('notes', 'updated_at',
+                                 '(title LIKE ? OR content LIKE ? OR tags LIKE ?)',
+                                 (pattern, pattern, pattern), page_size)
     
     # ============ COMMAND HISTORY OPERATIONS ============
     
-    def add_command(self, command: str, status: str = "executed", 
-                   duration: float = 0, result: str = "") -> bool:
-        """Add command to history."""
+    def enable_write_behind(self, batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                            flush_interval_ms: int = WRITE_BEHIND_FLUSH_MS):
+        """Queue command history inserts and commit them in batches.
+        
+        Rows are written by a single background thread every batch_size rows
+        or every flush_interval_ms milliseconds, whichever comes first.
+        """
+        if self.command_writer is None:
+            self.command_writer = CommandWriter(self, batch_size, flush_interval_ms)
+            log_info(f"Command write-behind enabled (batch={batch_size}, "
+                     f"interval={flush_interval_ms}ms)")
+    
+    def disable_write_behind(self):
+        """Drain queued command history and go back to direct inserts."""
+        writer, self.command_writer = self.command_writer, None
+        if writer is not None:
+            writer.close()
+    
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until all queued command history rows are committed."""
+        writer = self.command_writer
+        if writer is None:
+            return True
+        return writer.flush(timeout)
+    
+    def _insert_commands(self, rows: List[tuple]) -> bool:
+        """Insert command_history rows in a single transaction."""
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                INSERT INTO command_history (command, status, duration, result)
-                VALUES (?, ?, ?, ?)
-            ''', (command, status, duration, result))
+            cursor.executemany('''
+                INSERT INTO command_history (command, status, duration, result, timestamp)
+                VALUES (?, ?, ?, ?, ?)
+            ''', rows)
             
             conn.commit()
             return True
         except Exception as e:
-            log_error("DATABASE", f"Failed to add command: {command}", str(e))
+            log_error("DATABASE", f"Failed to add {len(rows)} command(s)", str(e))
             return False
         finally:
-            conn.close()
+            self.release_connection(conn)
+    
+    def add_command(self, command: str, status: str = "executed", 
+                   duration: float = 0, result: str = "") -> bool:
+        """Add command to history."""
+        row = (command, status, duration, result, _sqlite_timestamp())
+        
+        writer = self.command_writer
+        if writer is not None:
+            writer.submit(row)
+            return True
+        
+        return self._insert_commands([row])
     
     def search_commands(self, keyword: str, limit: int = 20) -> List[Dict]:
         """Search command history."""
+        self.flush()
         conn = self.get_connection()
         cursor = conn.cursor()
         
@@ -222,10 +856,11 @@ class Database:
             log_error("DATABASE", f"Failed to search commands: {keyword}", str(e))
             return []
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     def get_command_history(self, limit: int = 20) -> List[Dict]:
         """Get recent command history."""
+        self.flush()
         conn = self.get_connection()
         cursor = conn.cursor()
         
@@ -241,10 +876,26 @@ class Database:
             log_error("DATABASE", "Failed to get command history", str(e))
             return []
         finally:
-            conn.close()
+            self.release_connection(conn)
+    
+    def iter_command_history(self, page_size: int = PAGE_SIZE):
+        """Stream the whole command history, newest first."""
+        self.flush()
+        return self._iter_keyset('command_history', 'timestamp', page_size=page_size)
+    
+    def iter_search_commands(self, keyword: str, page_size: int = PAGE_SIZE):
+        """Stream commands containing keyword, newest first."""
+        self.flush()
+        return self._iter_keyset('command_history', 'timestamp', 'command LIKE ?',
+                                 (f'%{keyword}%',), page_size)
     
     def clear_old_history(self, days: int = 30) -> int:
-        """Delete command history older than specified days."""
+        """Delete command history older than specified days.
+        
+        The usage rollups keep their totals for the pruned rows; call
+        rebuild_command_stats() to resync them with the raw table.
+        """
+        self.flush()
         conn = self.get_connection()
         cursor = conn.cursor()
         
@@ -260,68 +911,167 @@ class Database:
             log_error("DATABASE", f"Failed to clear old history", str(e))
             return 0
         finally:
-            conn.close()
-    
-    # ============ SETTINGS OPERATIONS ============
+            self.release_connection(conn)
     
-    def set_setting(self, key: str, value: Any, value_type: str = "string") -> bool:
-        """Set a configuration setting."""
+    def clear_command_history(self) -> int:
+        """Delete all command history and its usage rollups."""
+        self.flush()
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            # Convert value to string if needed
-            if isinstance(value, (dict, list)):
-                value = json.dumps(value)
-            else:
-                value = str(value)
-            
-            cursor.execute('''
-                INSERT OR REPLACE INTO settings (key, value, type, updated_at)
-                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (key, value, value_type))
+            cursor.execute('DELETE FROM command_history')
+            removed = cursor.rowcount
+            cursor.execute('DELETE FROM command_stats')
+            cursor.execute('DELETE FROM command_stats_daily')
             
             conn.commit()
+            return removed
+        except Exception as e:
+            log_error("DATABASE", "Failed to clear command history", str(e))
+            return 0
+        finally:
+            self.release_connection(conn)
+    
+    # ============ COMMAND ANALYTICS ============
+    
+    def rebuild_command_stats(self) -> bool:
+        """Recompute the usage rollup tables from command_history."""
+        self.flush()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            self._rebuild_command_stats(cursor)
+            conn.commit()
+            log_info("Command usage rollups rebuilt")
             return True
         except Exception as e:
-            log_error("DATABASE", f"Failed to set setting: {key}", str(e))
+            log_error("DATABASE", "Failed to rebuild command stats", str(e))
             return False
         finally:
-            conn.close()
+            self.release_connection(conn)
     
-    def get_setting(self, key: str, default: Any = None) -> Any:
-        """Get a configuration setting."""
+    def get_top_commands(self, limit: int = 5, days: Optional[int] = None) -> List[Dict]:
+        """Most used commands, over all time or the last N days.
+        
+        Reads the rollup tables, so the cost depends on the number of
+        distinct commands (and days), not on the size of the history.
+        """
+        self.flush()
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            cursor.execute('SELECT value, type FROM settings WHERE key = ?', (key,))
-            row = cursor.fetchone()
+            if days is None:
+                cursor.execute('''
+                    SELECT command, count, total_duration, max_duration, failure_count
+                    FROM command_stats
+                    ORDER BY count DESC
+                    LIMIT ?
+                ''', (limit,))
+            else:
+                cursor.execute('''
+                    SELECT command, SUM(count) AS count, SUM(total_duration) AS total_duration,
+                           MAX(max_duration) AS max_duration, SUM(failure_count) AS failure_count
+                    FROM command_stats_daily
+                    WHERE day > date('now', '-' || ? || ' days')
+                    GROUP BY command
+                    ORDER BY count DESC
+                    LIMIT ?
+                ''', (days, limit))
             
-            if not row:
-                return default
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            log_error("DATABASE", "Failed to get top commands", str(e))
+            return []
+        finally:
+            self.release_connection(conn)
+    
+    def get_daily_usage(self, days: int = 30, command: Optional[str] = None) -> List[Dict]:
+        """Per-day command counts and durations for the last N days, oldest first."""
+        self.flush()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                SELECT day, SUM(count) AS count, SUM(total_duration) AS total_duration,
+                       MAX(max_duration) AS max_duration, SUM(failure_count) AS failure_count
+                FROM command_stats_daily
+                WHERE day > date('now', '-' || ? || ' days')
+                AND (? IS NULL OR command = ?)
+                GROUP BY day
+                ORDER BY day
+            ''', (days, command, command))
             
-            value, value_type = row[0], row[1]
+            return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            log_error("DATABASE", "Failed to get daily usage", str(e))
+            return []
+        finally:
+            self.release_connection(conn)
+    
+    def get_command_hours(self, days: int = 30, like: Optional[List[str]] = None) -> List[Dict]:
+        """Command counts per local hour of day over the last N days.
+        
+        like optionally limits the scan to commands matching any of the
+        given LIKE patterns. Rows are (command, hour, count).
+        """
+        self.flush()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            patterns = like or ['%']
+            matches = ' OR '.join('command LIKE ?' for _ in patterns)
+            cursor.execute(f'''
+                SELECT command, CAST(strftime('%H', timestamp, 'localtime') AS INTEGER) AS hour,
+                       COUNT(*) AS count
+                FROM command_history
+                WHERE timestamp > datetime('now', '-' || ? || ' days')
+                AND ({matches})
+                GROUP BY command, hour
+            ''', (days, *patterns))
             
-            # Convert based on type
-            if value_type == "json":
-                return json.loads(value)
-            elif value_type == "int":
-                return int(value)
-            elif value_type == "float":
-                return float(value)
-            elif value_type == "bool":
-                return value.lower() in ('true', '1', 'yes')
-            else:
-                return value
+            return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
-            log_error("DATABASE", f"Failed to get setting: {key}", str(e))
-            return default
+            log_error("DATABASE", "Failed to get command hours", str(e))
+            return []
         finally:
-            conn.close()
+            self.release_connection(conn)
     
-    def get_all_settings(self) -> Dict[str, Any]:
-        """Get all settings."""
+    # ============ SETTINGS OPERATIONS ============
+    
+    @staticmethod
+    def _convert_setting(value: str, value_type: str) -> Any:
+        """Convert a stored setting string to its declared type."""
+        if value_type == "json":
+            return json.loads(value)
+        elif value_type == "int":
+            return int(value)
+        elif value_type == "float":
+            return float(value)
+        elif value_type == "bool":
+            return value.lower() in ('true', '1', 'yes')
+        else:
+            return value
+    
+    @staticmethod
+    def _infer_setting_type(value: Any) -> str:
+        """Pick the stored type for a Python value."""
+        if isinstance(value, bool):
+            return "bool"
+        elif isinstance(value, int):
+            return "int"
+        elif isinstance(value, float):
+            return "float"
+        elif isinstance(value, (dict, list)):
+            return "json"
+        return "string"
+    
+    def _load_settings(self) -> Dict[str, Any]:
+        """Read every setting from the database, converted to its type."""
         conn = self.get_connection()
         cursor = conn.cursor()
         
@@ -331,79 +1081,343 @@ class Database:
             
             for row in cursor.fetchall():
                 key, value, value_type = row[0], row[1], row[2]
-                
-                # Convert based on type
-                if value_type == "json":
-                    settings[key] = json.loads(value)
-                elif value_type == "int":
-                    settings[key] = int(value)
-                elif value_type == "float":
-                    settings[key] = float(value)
-                elif value_type == "bool":
-                    settings[key] = value.lower() in ('true', '1', 'yes')
-                else:
-                    settings[key] = value
+                try:
+                    settings[key] = self._convert_setting(value, value_type)
+                except (ValueError, TypeError) as e:
+                    log_error("DATABASE", f"Invalid stored setting: {key}", str(e))
             
             return settings
+        finally:
+            self.release_connection(conn)
+    
+    def _settings_snapshot(self) -> Dict[str, Any]:
+        """Typed in-memory copy of the settings table, loaded on first use."""
+        settings = self._settings
+        if settings is None:
+            with self._settings_lock:
+                if self._settings is None:
+                    self._settings = self._load_settings()
+                settings = self._settings
+        return settings
+    
+    def add_settings_listener(self, callback, keys=None):
+        """Call callback(changes) whenever settings change.
+        
+        changes maps each changed key to its new value (None if removed).
+        If keys is given, the callback only fires for changes to those keys.
+        """
+        self._settings_listeners.append((callback, set(keys) if keys else None))
+    
+    def remove_settings_listener(self, callback):
+        """Stop notifying a settings listener."""
+        self._settings_listeners = [(cb, keys) for cb, keys in self._settings_listeners
+                                    if cb is not callback]
+    
+    def add_restore_listener(self, callback):
+        """Call callback() after restore() replaces the database contents.
+        
+        For in-memory copies of database rows that must be dropped.
+        """
+        self._restore_listeners.append(callback)
+    
+    def _notify_settings(self, changes: Dict[str, Any]):
+        """Send changed settings to interested listeners."""
+        for callback, keys in list(self._settings_listeners):
+            relevant = changes if keys is None else {k: v for k, v in changes.items() if k in keys}
+            if not relevant:
+                continue
+            try:
+                callback(relevant)
+            except Exception as e:
+                log_error("DATABASE", "Settings listener failed", str(e))
+    
+    def set_settings(self, settings: Dict[str, Any],
+                     types: Optional[Dict[str, str]] = None) -> bool:
+        """Save several settings in one transaction.
+        
+        Each value's stored type is taken from types, or inferred from the
+        Python value (bool, int, float, dict/list as json, else string).
+        """
+        types = types or {}
+        rows = []
+        for key, value in settings.items():
+            value_type = types.get(key) or self._infer_setting_type(value)
+            # Convert value to string if needed
+            if isinstance(value, (dict, list)):
+                value = json.dumps(value)
+            else:
+                value = str(value)
+            rows.append((key, value, value_type))
+        
+        if not rows:
+            return True
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            with self._settings_lock:
+                snapshot = self._settings_snapshot()
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO settings (key, value, type, updated_at)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                ''', rows)
+                conn.commit()
+                
+                changes = {}
+                for key, value, value_type in rows:
+                    typed = self._convert_setting(value, value_type)
+                    if key not in snapshot or snapshot[key] != typed:
+                        changes[key] = typed
+                    snapshot[key] = typed
+        except Exception as e:
+            log_error("DATABASE", f"Failed to set settings: {', '.join(settings)}", str(e))
+            return False
+        finally:
+            self.release_connection(conn)
+        
+        if changes:
+            self._notify_settings(changes)
+        return True
+    
+    def set_setting(self, key: str, value: Any, value_type: str = "string") -> bool:
+        """Set a configuration setting."""
+        return self.set_settings({key: value}, {key: value_type})
+    
+    def get_setting(self, key: str, default: Any = None) -> Any:
+        """Get a configuration setting from the in-memory snapshot."""
+        try:
+            return self._settings_snapshot().get(key, default)
+        except Exception as e:
+            log_error("DATABASE", f"Failed to get setting: {key}", str(e))
+            return default
+    
+    def get_all_settings(self) -> Dict[str, Any]:
+        """Get all settings."""
+        try:
+            return dict(self._settings_snapshot())
         except Exception as e:
             log_error("DATABASE", "Failed to get all settings", str(e))
             return {}
+    
+    def clear_settings(self) -> int:
+        """Delete all settings so every reader falls back to its default."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            with self._settings_lock:
+                cursor.execute('DELETE FROM settings')
+                conn.commit()
+                removed = dict.fromkeys(self._settings_snapshot())
+                self._settings = {}
+        except Exception as e:
+            log_error("DATABASE", "Failed to clear settings", str(e))
+            return 0
         finally:
-            conn.close()
+            self.release_connection(conn)
+        
+        if removed:
+            self._notify_settings(removed)
+        return len(removed)
+    
+    def reload_settings(self):
+        """Re-read settings from disk, e.g. after a restore, and notify changes."""
+        try:
+            with self._settings_lock:
+                old = self._settings or {}
+                self._settings = self._load_settings()
+                new = self._settings
+        except Exception as e:
+            log_error("DATABASE", "Failed to reload settings", str(e))
+            return
+        
+        changes = {k: new.get(k) for k in set(old) | set(new) if old.get(k) != new.get(k)}
+        if changes:
+            self._notify_settings(changes)
     
     # ============ CACHE OPERATIONS ============
     
     def cache_response(self, query_hash: str, query_type: str, 
-                      response: str, ttl_seconds: int = 86400) -> bool:
-        """Cache an API response."""
+                      response: str, ttl_seconds: int = 86400,
+                      stale_after: Optional[int] = None,
+                      failure_kind: Optional[str] = None,
+                      generation: Optional[int] = None) -> bool:
+        """Cache an API response.
+        
+        The row is removed after ttl_seconds. If stale_after is given, the
+        entry is reported stale from then on so callers can refresh it.
+        A failure_kind marks a negative entry recording a failed lookup.
+        generation is the query_type generation query_hash was made for
+        (default: the current one). Replacing an entry keeps its hit_count.
+        Large responses are stored compressed (see encode_payload).
+        """
+        return self.cache_responses([{
+            'query_hash': query_hash,
+            'query_type': query_type,
+            'response': response,
+            'ttl_seconds': ttl_seconds,
+            'stale_after': stale_after,
+            'failure_kind': failure_kind,
+            'generation': generation,
+        }])
+    
+    def cache_responses(self, entries: List[Dict]) -> bool:
+        """Cache several API responses in one transaction.
+        
+        Each entry is a dict of cache_response() arguments; query_hash,
+        query_type and response are required.
+        """
+        now = int(time.time())
+        rows = []
+        for entry in entries:
+            ttl_seconds = entry.get('ttl_seconds', 86400)
+            stale_after = entry.get('stale_after')
+            stale_after = ttl_seconds if stale_after is None else min(stale_after, ttl_seconds)
+            generation = entry.get('generation')
+            if generation is None:
+                generation = self.get_cache_generation(entry['query_type'])
+            payload = encode_payload(entry['response'])
+            rows.append((entry['query_hash'], entry['query_type'], payload, ttl_seconds,
+                         now + ttl_seconds, now + stale_after, entry.get('failure_kind'),
+                         now, len(payload), generation))
+        if not rows:
+            return True
+        
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO response_cache 
-                (query_hash, query_type, response, ttl_seconds, created_at)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (query_hash, query_type, response, ttl_seconds))
+            cursor.executemany('''
+                INSERT INTO response_cache
+                (query_hash, query_type, response, ttl_seconds, created_at,
+                 expires_at, stale_at, failure_kind, last_access, size_bytes, generation)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(query_hash) DO UPDATE SET
+                    query_type = excluded.query_type,
+                    response = excluded.response,
+                    ttl_seconds = excluded.ttl_seconds,
+                    created_at = excluded.created_at,
+                    expires_at = excluded.expires_at,
+                    stale_at = excluded.stale_at,
+                    failure_kind = excluded.failure_kind,
+                    last_access = excluded.last_access,
+                    size_bytes = excluded.size_bytes,
+                    generation = excluded.generation
+            ''', rows)
             
             conn.commit()
             return True
         except Exception as e:
-            log_error("DATABASE", f"Failed to cache response: {query_hash}", str(e))
+            log_error("DATABASE", f"Failed to cache {len(rows)} response(s)", str(e))
             return False
         finally:
-            conn.close()
+            self.release_connection(conn)
     
-    def get_cached_response(self, query_hash: str) -> Optional[str]:
-        """Get cached response if not expired."""
+    def get_cached_entry(self, query_hash: str) -> Optional[Dict]:
+        """Get a live cache row with its query_type, failure_kind, stale_at
+        and expires_at epochs."""
+        return self.get_cached_entries([query_hash]).get(query_hash)
+    
+    def get_cached_entries(self, query_hashes: List[str]) -> Dict[str, Dict]:
+        """Get live cache rows for several hashes, keyed by query_hash.
+        
+        Rows are shaped like get_cached_entry(); missing and expired hashes
+        are left out. Hashes are looked up CACHE_BATCH_SIZE per query.
+        """
+        query_hashes = list(dict.fromkeys(query_hashes))
+        now = int(time.time())
+        entries = {}
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
-            cursor.execute('''
-                SELECT response FROM response_cache 
-                WHERE query_hash = ? 
-                AND datetime(created_at, '+' || ttl_seconds || ' seconds') > datetime('now')
-            ''', (query_hash,))
+            for start in range(0, len(query_hashes), CACHE_BATCH_SIZE):
+                batch = query_hashes[start:start + CACHE_BATCH_SIZE]
+                placeholders = ','.join('?' * len(batch))
+                cursor.execute(f'''
+                    SELECT query_hash, response, query_type, failure_kind, stale_at, expires_at
+                    FROM response_cache
+                    WHERE query_hash IN ({placeholders}) AND expires_at > ?
+                ''', (*batch, now))
+                
+                for row in cursor.fetchall():
+                    entry = dict(row)
+                    entry['response'] = decode_payload(entry['response'])
+                    entries[entry.pop('query_hash')] = entry
             
-            row = cursor.fetchone()
-            return row[0] if row else None
+            self.touch_cache_entries(entries)
+            return entries
         except Exception as e:
-            log_error("DATABASE", f"Failed to get cached response: {query_hash}", str(e))
-            return None
+            log_error("DATABASE", f"Failed to get {len(query_hashes)} cached response(s)", str(e))
+            return {}
+        finally:
+            self.release_connection(conn)
+    
+    def touch_cache_entry(self, query_hash: str):
+        """Record a hit on a cache entry for eviction.
+        
+        Hits are buffered and written in batches by flush_cache_touches().
+        """
+        self.touch_cache_entries([query_hash])
+    
+    def touch_cache_entries(self, query_hashes):
+        """Record a hit on each of several cache entries (see touch_cache_entry)."""
+        now = int(time.time())
+        with self._cache_touches_lock:
+            for query_hash in query_hashes:
+                hits, _ = self._cache_touches.get(query_hash, (0, now))
+                self._cache_touches[query_hash] = (hits + 1, now)
+            pending = len(self._cache_touches)
+        
+        if pending >= CACHE_TOUCH_FLUSH_SIZE:
+            self.flush_cache_touches()
+    
+    def flush_cache_touches(self) -> int:
+        """Write buffered hit counts and access times to response_cache."""
+        with self._cache_touches_lock:
+            touches, self._cache_touches = self._cache_touches, {}
+        if not touches:
+            return 0
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.executemany('''
+                UPDATE response_cache
+                SET hit_count = hit_count + ?, last_access = MAX(COALESCE(last_access, 0), ?)
+                WHERE query_hash = ?
+            ''', [(hits, last_access, query_hash)
+                  for query_hash, (hits, last_access) in touches.items()])
+            
+            conn.commit()
+            return len(touches)
+        except Exception as e:
+            log_error("DATABASE", "Failed to record cache hits", str(e))
+            return 0
         finally:
-            conn.close()
+            self.release_connection(conn)
     
-    def clear_expired_cache(self) -> int:
-        """Delete expired cache entries."""
+    def get_cached_response(self, query_hash: str) -> Optional[str]:
+        """Get cached response if not expired (negative entries excluded)."""
+        entry = self.get_cached_entry(query_hash)
+        return entry['response'] if entry and not entry['failure_kind'] else None
+    
+    def _delete_expired_batch(self, now: int, batch_size: int) -> int:
+        """Delete up to batch_size expired cache entries in one transaction."""
         conn = self.get_connection()
         cursor = conn.cursor()
         
         try:
             cursor.execute('''
                 DELETE FROM response_cache 
-                WHERE datetime(created_at, '+' || ttl_seconds || ' seconds') <= datetime('now')
-            ''')
+                WHERE id IN (
+                    SELECT id FROM response_cache 
+                    WHERE expires_at <= ? 
+                    LIMIT ?
+                )
+            ''', (now, batch_size))
             
             conn.commit()
             return cursor.rowcount
@@ -411,7 +1425,211 @@ class Database:
             log_error("DATABASE", "Failed to clear expired cache", str(e))
             return 0
         finally:
-            conn.close()
+            self.release_connection(conn)
+    
+    def clear_expired_cache(self, batch_size: int = CACHE_SWEEP_BATCH_SIZE) -> int:
+        """Delete expired cache entries, committing every batch_size rows."""
+        now = int(time.time())
+        total = 0
+        while True:
+            deleted = self._delete_expired_batch(now, batch_size)
+            total += deleted
+            if deleted < batch_size:
+                return total
+    
+    def start_cache_sweeper(self, interval: float = CACHE_SWEEP_INTERVAL,
+                            batch_size: int = CACHE_SWEEP_BATCH_SIZE):
+        """Start deleting expired cache entries in the background."""
+        if self.cache_sweeper is None:
+            self.cache_sweeper = CacheSweeper(self, interval, batch_size)
+            log_info(f"Cache sweeper started (every {interval}s, batch={batch_size})")
+    
+    def stop_cache_sweeper(self):
+        """Stop the background cache sweeper."""
+        sweeper, self.cache_sweeper = self.cache_sweeper, None
+        if sweeper is not None:
+            sweeper.stop()
+    
+    def set_cache_budget(self, max_bytes: Optional[int] = None,
+                         type_quotas: Optional[Dict[str, int]] = None,
+                         policy: Optional[str] = None):
+        """Change the size budget evict_cache() enforces.
+        
+        Only the arguments given are changed; type_quotas replaces the
+        per-type quotas wholesale.
+        """
+        if policy is not None and policy not in EVICTION_ORDER:
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        
+        if max_bytes is not None:
+            self.cache_max_bytes = max_bytes
+        if type_quotas is not None:
+            self.cache_type_quotas = dict(type_quotas)
+        if policy is not None:
+            self.cache_eviction_policy = policy
+    
+    def get_cache_generation(self, query_type: str) -> int:
+        """Current generation of a query_type's cache namespace (0 until bumped)."""
+        generations = self._cache_generations
+        if generations is None:
+            with self._cache_generations_lock:
+                if self._cache_generations is None:
+                    self._cache_generations = self._load_cache_generations()
+                generations = self._cache_generations
+        return generations.get(query_type, 0)
+    
+    def _load_cache_generations(self) -> Dict[str, int]:
+        conn = self.get_connection()
+        try:
+            rows = conn.execute('SELECT query_type, generation FROM cache_generations').fetchall()
+            return {row['query_type']: row['generation'] for row in rows}
+        except Exception as e:
+            log_error("DATABASE", "Failed to load cache generations", str(e))
+            return {}
+        finally:
+            self.release_connection(conn)
+    
+    def bump_cache_generation(self, query_type: str) -> int:
+        """Invalidate every cached entry of query_type by starting a new generation.
+        
+        Callers mix the generation into their cache keys, so old entries
+        become unreachable at once. Their rows are deleted later by
+        purge_orphaned_cache(). Returns the new generation.
+        """
+        self.get_cache_generation(query_type)  # make sure the map is loaded
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            with self._cache_generations_lock:
+                cursor.execute('''
+                    INSERT INTO cache_generations (query_type, generation) VALUES (?, 1)
+                    ON CONFLICT(query_type) DO UPDATE SET generation = generation + 1
+                ''', (query_type,))
+                cursor.execute('SELECT generation FROM cache_generations WHERE query_type = ?',
+                               (query_type,))
+                generation = cursor.fetchone()[0]
+                conn.commit()
+                self._cache_generations[query_type] = generation
+            log_info(f"Cache generation for {query_type} is now {generation}")
+            return generation
+        except Exception as e:
+            log_error("DATABASE", f"Failed to bump cache generation for {query_type}", str(e))
+            return self.get_cache_generation(query_type)
+        finally:
+            self.release_connection(conn)
+    
+    def _delete_orphaned_batch(self, batch_size: int) -> int:
+        """Delete up to batch_size entries left behind by a generation bump."""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('''
+                DELETE FROM response_cache
+                WHERE id IN (
+                    SELECT response_cache.id FROM response_cache
+                    JOIN cache_generations USING (query_type)
+                    WHERE response_cache.generation < cache_generations.generation
+                    LIMIT ?
+                )
+            ''', (batch_size,))
+            
+            conn.commit()
+            return cursor.rowcount
+        except Exception as e:
+            log_error("DATABASE", "Failed to purge orphaned cache entries", str(e))
+            return 0
+        finally:
+            self.release_connection(conn)
+    
+    def purge_orphaned_cache(self, batch_size: int = CACHE_SWEEP_BATCH_SIZE) -> int:
+        """Delete entries from old generations, committing every batch_size rows."""
+        total = 0
+        while True:
+            deleted = self._delete_orphaned_batch(batch_size)
+            total += deleted
+            if deleted < batch_size:
+                break
+        if total:
+            log_info(f"Purged {total} cache entries from old generations")
+        return total
+    
+    def evict_cache(self, max_bytes: Optional[int] = None,
+                    type_quotas: Optional[Dict[str, int]] = None,
+                    policy: Optional[str] = None,
+                    batch_size: int = CACHE_SWEEP_BATCH_SIZE) -> int:
+        """Delete the coldest cache entries until the cache is within budget.
+        
+        Each query_type in type_quotas is trimmed to its quota first, then
+        the whole table to max_bytes. policy is 'lru', 'lfu' or 'size'
+        (see EVICTION_ORDER). Defaults come from set_cache_budget().
+        Entries orphaned by bump_cache_generation() are purged first and
+        are not counted as evictions.
+        """
+        max_bytes = self.cache_max_bytes if max_bytes is None else max_bytes
+        type_quotas = self.cache_type_quotas if type_quotas is None else type_quotas
+        policy = policy or self.cache_eviction_policy
+        if policy not in EVICTION_ORDER:
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        
+        self.flush_cache_touches()
+        self.purge_orphaned_cache(batch_size)
+        total = 0
+        for query_type, quota in type_quotas.items():
+            total += self._evict_over_budget(quota, policy, batch_size, query_type)
+        total += self._evict_over_budget(max_bytes, policy, batch_size)
+        
+        if total:
+            log_info(f"Evicted {total} cache entries ({policy})")
+        return total
+    
+    def _evict_over_budget(self, budget: int, policy: str, batch_size: int,
+                           query_type: Optional[str] = None) -> int:
+        """Evict entries (of one query_type, or all) until they fit in budget bytes."""
+        where, params = ('WHERE query_type = ?', (query_type,)) if query_type else ('', ())
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute(f'SELECT TOTAL(size_bytes) FROM response_cache {where}', params)
+            excess = cursor.fetchone()[0] - budget
+            if excess <= 0:
+                return 0
+            
+            victims = []
+            cursor.execute(f'''
+                SELECT id, query_type, size_bytes FROM response_cache {where}
+                ORDER BY {EVICTION_ORDER[policy]}
+            ''', params)
+            for row_id, row_type, size_bytes in cursor:
+                victims.append((row_id, row_type))
+                excess -= size_bytes or 0
+                if excess <= 0:
+                    break
+            
+            deleted = 0
+            for start in range(0, len(victims), batch_size):
+                batch = victims[start:start + batch_size]
+                placeholders = ','.join('?' * len(batch))
+                cursor.execute(f'DELETE FROM response_cache WHERE id IN ({placeholders})',
+                               [row_id for row_id, _ in batch])
+                conn.commit()
+                deleted += cursor.rowcount
+                with self._cache_evictions_lock:
+                    for _, row_type in batch:
+                        self._cache_evictions[row_type] = self._cache_evictions.get(row_type, 0) + 1
+            return deleted
+        except Exception as e:
+            log_error("DATABASE", "Failed to evict cache entries", str(e))
+            return 0
+        finally:
+            self.release_connection(conn)
+    
+    def get_cache_evictions(self) -> Dict[str, int]:
+        """Entries evict_cache() has removed since startup, per query_type."""
+        with self._cache_evictions_lock:
+            return dict(self._cache_evictions)
     
     def clear_all_cache(self) -> int:
         """Clear all cache."""
@@ -426,30 +1644,132 @@ class Database:
             log_error("DATABASE", "Failed to clear all cache", str(e))
             return 0
         finally:
-            conn.close()
+            self.release_connection(conn)
     
     # ============ BACKUP/RESTORE ============
     
-    def backup(self, backup_path: Optional[str] = None) -> bool:
-        """Backup database to file."""
+    @property
+    def backup_dir(self) -> Path:
+        """Directory holding rotated backups."""
+        return self.db_path.parent / BACKUP_DIR_NAME
+    
+    @property
+    def latest_backup_path(self) -> Path:
+        """Copy of the most recent backup, used by restore."""
+        return self.db_path.parent / LATEST_BACKUP_NAME
+    
+    def backup(self, backup_path: Optional[str] = None, progress=None,
+               pages: int = BACKUP_PAGES_PER_STEP, rotate: bool = True) -> bool:
+        """Backup database to file.
+        
+        Copies pages at a time so writers are never blocked for long;
+        progress(copied_pages, total_pages) is called after each step.
+        Without backup_path, a timestamped copy is written to backup_dir,
+        leafy_backup_latest.db is updated and old backups are rotated.
+        """
+        self.flush()
+        default_location = not backup_path
         try:
-            if not backup_path:
-                backup_path = self.db_path.parent / f'leafy_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db'
+            if default_location:
+                self.backup_dir.mkdir(exist_ok=True)
+                backup_path = self.backup_dir / f'leafy_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.db'
+            backup_path = Path(backup_path)
             
-            conn = self.get_connection()
-            backup_conn = sqlite3.connect(str(backup_path))
+            # Write to a temporary file so a partial backup never looks complete
+            tmp_path = backup_path.with_name(backup_path.name + '.tmp')
+            if tmp_path.exists():
+                tmp_path.unlink()
             
-            with backup_conn:
-                conn.backup(backup_conn)
+            def on_step(status, remaining, total):
+                if progress:
+                    progress(total - remaining, total)
             
-            conn.close()
-            backup_conn.close()
+            conn = self.get_connection()
+            backup_conn = sqlite3.connect(str(tmp_path))
+            try:
+                conn.backup(backup_conn, pages=pages, progress=on_step, sleep=BACKUP_STEP_SLEEP)
+            finally:
+                backup_conn.close()
+                self.release_connection(conn)
+            
+            os.replace(tmp_path, backup_path)
             log_info(f"Database backed up to: {backup_path}")
+            
+            if default_location:
+                self._update_latest_backup(backup_path)
+                if rotate:
+                    self.rotate_backups()
             return True
         except Exception as e:
             log_error("DATABASE", "Failed to backup database", str(e))
             return False
     
+    def backup_async(self, progress=None, on_complete=None, **kwargs):
+        """Run backup() on a background thread and return its AsyncTask.
+        
+        progress and on_complete(success) are called from that thread.
+        """
+        def run():
+            success = self.backup(progress=progress, **kwargs)
+            if on_complete:
+                on_complete(success)
+            return success
+        
+        return run_async(run)
+    
+    def _update_latest_backup(self, backup_path: Path):
+        """Atomically point leafy_backup_latest.db at a finished backup."""
+        latest = self.latest_backup_path
+        tmp_path = latest.with_name(latest.name + '.tmp')
+        if tmp_path.exists():
+            tmp_path.unlink()
+        
+        try:
+            os.link(backup_path, tmp_path)
+        except OSError:
+            shutil.copy2(backup_path, tmp_path)
+        os.replace(tmp_path, latest)
+    
+    def list_backups(self) -> List[Path]:
+        """Rotated backups in backup_dir, newest first."""
+        if not self.backup_dir.exists():
+            return []
+        backups = [p for p in self.backup_dir.iterdir() if BACKUP_NAME_PATTERN.match(p.name)]
+        return sorted(backups, key=lambda p: p.name, reverse=True)
+    
+    def rotate_backups(self, keep_daily: int = BACKUP_KEEP_DAILY,
+                       keep_weekly: int = BACKUP_KEEP_WEEKLY) -> int:
+        """Keep the newest backup of each of the last keep_daily days and
+        keep_weekly ISO weeks, deleting the rest. Returns the number removed."""
+        keep = set()
+        days, weeks = set(), set()
+        
+        for path in self.list_backups():
+            stamp = datetime.strptime(BACKUP_NAME_PATTERN.match(path.name).group(1), "%Y%m%d_%H%M%S")
+            day = stamp.date()
+            week = stamp.isocalendar()[:2]
+            
+            if day not in days and len(days) < keep_daily:
+                days.add(day)
+                keep.add(path)
+            if week not in weeks and len(weeks) < keep_weekly:
+                weeks.add(week)
+                keep.add(path)
+        
+        removed = 0
+        for path in self.list_backups():
+            if path in keep:
+                continue
+            try:
+                path.unlink()
+                removed += 1
+            except OSError as e:
+                log_error("DATABASE", f"Failed to remove old backup: {path}", str(e))
+        
+        if removed:
+            log_info(f"Removed {removed} old backup(s)")
+        return removed
+    
     def restore(self, backup_path: str) -> bool:
         """Restore database from backup."""
         try:
@@ -465,7 +1785,18 @@ class Database:
                 backup_conn.backup(conn)
             
             backup_conn.close()
-            conn.close()
+            self.release_connection(conn)
+            
+            # Older backups may predate newer tables and indexes
+            self.init_database()
+            with self._cache_generations_lock:
+                self._cache_generations = None  # reloaded from the restored rows
+            for callback in list(self._restore_listeners):
+                try:
+                    callback()
+                except Exception as e:
+                    log_error("DATABASE", "Restore listener failed", str(e))
+            self.reload_settings()
             log_info(f"Database restored from: {backup_path}")
             return True
         except Exception as e:
@@ -474,6 +1805,7 @@ class Database:
     
     def get_stats(self) -> Dict[str, int]:
         """Get database statistics."""
+        self.flush()
         conn = self.get_connection()
         cursor = conn.cursor()
         
@@ -489,6 +1821,9 @@ class Database:
             cursor.execute('SELECT COUNT(*) FROM response_cache')
             stats['cache_entries'] = cursor.fetchone()[0]
             
+            cursor.execute('SELECT COUNT(*) FROM response_cache WHERE failure_kind IS NOT NULL')
+            stats['negative_cache_entries'] = cursor.fetchone()[0]
+            
             cursor.execute('SELECT COUNT(*) FROM settings')
             stats['settings'] = cursor.fetchone()[0]
             
@@ -497,8 +1832,9 @@ class Database:
             log_error("DATABASE", "Failed to get database stats", str(e))
             return {}
         finally:
-            conn.close()
+            self.release_connection(conn)
 
 
 # Global database instance
 db = Database()
+atexit.register(db.close)
@@ -0,0 +1,148 @@
+"""
+Intent routing for Leafy
+Matches an utterance against every command phrase in a single pass over
+its words and picks the winning intent by priority
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# How an intent's slot is taken from the utterance
+SLOT_AFTER = 'after'  # the text after the matched phrase ("calculate X")
+SLOT_REST = 'rest'  # the utterance with the matched phrase removed ("X wikipedia")
+
+WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def tokenize(text: str) -> List[Tuple[str, int, int]]:
+    """Split lowercased text into (word, start, end) with character offsets."""
+    return [(m.group(), m.start(), m.end()) for m in WORD_RE.finditer(text.lower())]
+
+
+class Intent:
+    """A command Leafy understands.
+
+    phrases are matched as whole words anywhere in the utterance. When
+    several intents match, the highest priority wins, then the longest
+    phrase, then the earliest one.
+    """
+
+    __slots__ = ('name', 'phrases', 'priority', 'slot')
+
+    def __init__(self, name: str, phrases: Iterable[str], priority: int = 0,
+                 slot: Optional[str] = None):
+        if slot not in (None, SLOT_AFTER, SLOT_REST):
+            raise ValueError(f"Unknown slot mode: {slot}")
+        self.name = name
+        self.phrases = tuple(phrases)
+        self.priority = priority
+        self.slot = slot
+
+
+class IntentMatch:
+    """The intent an utterance was routed to, with its slot text if any."""
+
+    __slots__ = ('intent', 'text', 'phrase', 'start', 'end', 'slot')
+
+    def __init__(self, intent: Intent, text: str, phrase: str, start: int, end: int,
+                 slot: Optional[str] = None):
+        self.intent = intent
+        self.text = text  # the whole utterance
+        self.phrase = phrase
+        self.start = start  # character offsets of the phrase in the utterance
+        self.end = end
+        self.slot = slot
+
+    @property
+    def name(self) -> str:
+        return self.intent.name
+
+    def __repr__(self) -> str:
+        return f"IntentMatch({self.name!r}, phrase={self.phrase!r}, slot={self.slot!r})"
+
+
+class IntentRouter:
+    """Word-level Aho-Corasick automaton over every intent phrase.
+
+    Routing an utterance costs one pass over its words however many
+    intents are registered.
+    """
+
+    def __init__(self, intents: Iterable[Intent]):
+        self.intents = list(intents)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Per state: (intent index, phrase, phrase length in words) ending here
+        self._out: List[List[Tuple[int, str, int]]] = [[]]
+
+        for index, intent in enumerate(self.intents):
+            for phrase in intent.phrases:
+                self._add_phrase(index, phrase)
+        self._link()
+
+    def _add_phrase(self, index: int, phrase: str):
+        words = [word for word, _, _ in tokenize(phrase)]
+        if not words:
+            raise ValueError(f"Intent {self.intents[index].name} has an empty phrase")
+
+        state = 0
+        for word in words:
+            nxt = self._goto[state].get(word)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][word] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((index, " ".join(words), len(words)))
+
+    def _link(self):
+        """Compute failure links breadth-first and merge their outputs."""
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for word, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and word not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(word, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _scan(self, words: List[Tuple[str, int, int]]):
+        """Yield (intent index, phrase, first word, last word) for every match."""
+        state = 0
+        for position, (word, _, _) in enumerate(words):
+            while state and word not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(word, 0)
+            for index, phrase, length in self._out[state]:
+                yield index, phrase, position - length + 1, position
+
+    def _to_match(self, text: str, words, index: int, phrase: str,
+                  first: int, last: int) -> IntentMatch:
+        intent = self.intents[index]
+        start, end = words[first][1], words[last][2]
+        slot = None
+        if intent.slot == SLOT_AFTER:
+            slot = text[end:].strip()
+        elif intent.slot == SLOT_REST:
+            slot = " ".join((text[:start] + " " + text[end:]).split())
+        return IntentMatch(intent, text, phrase, start, end, slot)
+
+    def matches(self, text: str) -> List[IntentMatch]:
+        """Every phrase found in text, in the order they end."""
+        words = tokenize(text)
+        return [self._to_match(text, words, *found) for found in self._scan(words)]
+
+    def match(self, text: str) -> Optional[IntentMatch]:
+        """Route text to its winning intent, or None if nothing matches."""
+        words = tokenize(text)
+        best, best_key = None, None
+        for found in self._scan(words):
+            index, _, first, last = found
+            key = (self.intents[index].priority, last - first, -first)
+            if best_key is None or key > best_key:
+                best, best_key = found, key
+        return None if best is None else self._to_match(text, words, *best)
+
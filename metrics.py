@@ -0,0 +1,52 @@
+"""
+Latency metrics for Leafy
+Fixed-bucket histograms cheap enough to record on every lookup or utterance
+"""
+
+import bisect
+from typing import Any, Dict
+
+
+class LatencyHistogram:
+    """Counts of durations in fixed log-spaced buckets (not thread-safe)."""
+    
+    # Bucket upper bounds in milliseconds; the last bucket is unbounded
+    BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500,
+                 1000, 2500, 5000, 10000)
+    
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+    
+    def record(self, seconds: float):
+        """Add one duration."""
+        ms = seconds * 1000
+        self.buckets[bisect.bisect_left(self.BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+    
+    def percentile(self, p: float) -> float:
+        """Upper bound (ms) of the bucket holding the p-th percentile, capped at max."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(self.BOUNDS_MS[i], self.max_ms) if i < len(self.BOUNDS_MS) else self.max_ms
+        return self.max_ms
+    
+    def summary(self) -> Dict[str, Any]:
+        """count, mean/p50/p95/max in ms and the raw bucket counts."""
+        return {
+            'count': self.count,
+            'mean_ms': self.total_ms / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'max_ms': self.max_ms,
+            'buckets': list(self.buckets),
+        }
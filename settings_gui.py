@@ -5,6 +5,7 @@ Allows users to customize voice, theme, language, and other preferences
 
 from tkinter import *
 from tkinter import ttk, messagebox
+from cache import ResponseCache
 from db import db
 from logger import log_info
 
@@ -19,7 +20,7 @@ class SettingsWindow:
         
         self.window = Toplevel(parent)
         self.window.title("Leafy Settings")
-        self.window.geometry("500x600")
+        self.window.geometry("500x700")
         self.window.resizable(False, False)
         
         self.window.transient(parent)
@@ -187,9 +188,14 @@ class SettingsWindow:
         """
         ttk.Label(frame, text=stats_text, justify=LEFT).pack(anchor=W, pady=10)
         
-        backup_btn = Button(frame, text="Backup Database", command=self.backup_database,
-                           bg="#4CAF50", fg="white", padx=20)
-        backup_btn.pack(anchor=W, pady=5, fill=X)
+        self.backup_btn = Button(frame, text="Backup Database", command=self.backup_database,
+                                 bg="#4CAF50", fg="white", padx=20)
+        self.backup_btn.pack(anchor=W, pady=5, fill=X)
+        
+        self.backup_progress = 0
+        self.backup_progress_bar = ttk.Progressbar(frame, orient=HORIZONTAL,
+                                                   mode="determinate", maximum=100)
+        self.backup_progress_bar.pack(anchor=W, pady=5, fill=X)
         
         restore_btn = Button(frame, text="Restore Database", command=self.restore_database,
                             bg="#2196F3", fg="white", padx=20)
@@ -202,6 +208,25 @@ class SettingsWindow:
                                   bg="#f44336", fg="white", padx=20)
         clear_history_btn.pack(anchor=W, pady=5, fill=X)
         
+        ttk.Separator(frame, orient=HORIZONTAL).pack(fill=X, pady=20)
+        
+        ttk.Label(frame, text="Cache Metrics:", font=("Arial", 10, "bold")).pack(anchor=W, pady=10)
+        
+        columns = ("type", "hits", "misses", "negative", "ratio", "lookup", "fetch", "saved")
+        headings = ("Type", "Hits", "Misses", "Neg. Hits", "Hit %",
+                    "Lookup p95", "Fetch p95", "Saved")
+        self.cache_metrics_tree = ttk.Treeview(frame, columns=columns, show="headings", height=4)
+        for column, heading in zip(columns, headings):
+            self.cache_metrics_tree.heading(column, text=heading)
+            self.cache_metrics_tree.column(column, width=52, anchor=E)
+        self.cache_metrics_tree.column("type", width=80, anchor=W)
+        self.cache_metrics_tree.pack(fill=X, pady=5)
+        
+        refresh_metrics_btn = Button(frame, text="Refresh Metrics",
+                                     command=self.refresh_cache_metrics, padx=20)
+        refresh_metrics_btn.pack(anchor=W, pady=5)
+        self.refresh_cache_metrics()
+        
         self.debug_mode_var = BooleanVar(value=False)
         debug_check = ttk.Checkbutton(frame, text="Debug Mode (verbose logging)",
                                      variable=self.debug_mode_var)
@@ -241,24 +266,32 @@ class SettingsWindow:
     def apply_settings(self):
         """Apply and save settings."""
         try:
-            db.set_setting("speech_rate", self.speech_rate_var.get(), "int")
-            db.set_setting("speech_volume", self.speech_volume_var.get(), "float")
-            db.set_setting("voice", self.voice_var.get())
-            db.set_setting("language", self.language_var.get())
-            db.set_setting("microphone", self.microphone_var.get())
-            
-            db.set_setting("theme", self.theme_var.get())
-            db.set_setting("font_size", self.font_size_var.get(), "int")
-            db.set_setting("window_size", self.window_size_var.get())
-            db.set_setting("show_timestamps", self.timestamps_var.get(), "bool")
-            db.set_setting("notifications", self.notifications_var.get(), "bool")
-            
-            db.set_setting("autostart", self.autostart_var.get(), "bool")
-            db.set_setting("minimize_tray", self.minimize_tray_var.get(), "bool")
-            db.set_setting("log_level", self.log_level_var.get())
-            db.set_setting("enable_cache", self.enable_cache_var.get(), "bool")
-            
-            db.set_setting("debug_mode", self.debug_mode_var.get(), "bool")
+            saved = db.set_settings({
+                "speech_rate": self.speech_rate_var.get(),
+                "speech_volume": self.speech_volume_var.get(),
+                "voice": self.voice_var.get(),
+                "language": self.language_var.get(),
+                "microphone": self.microphone_var.get(),
+                
+                "theme": self.theme_var.get(),
+                "font_size": self.font_size_var.get(),
+                "window_size": self.window_size_var.get(),
+                "show_timestamps": self.timestamps_var.get(),
+                "notifications": self.notifications_var.get(),
+                
+                "autostart": self.autostart_var.get(),
+                "minimize_tray": self.minimize_tray_var.get(),
+                "log_level": self.log_level_var.get(),
+                "enable_cache": self.enable_cache_var.get(),
+                
+                "debug_mode": self.debug_mode_var.get(),
+            }, types={
+                "speech_rate": "int",
+                "speech_volume": "float",
+                "font_size": "int",
+            })
+            if not saved:
+                raise RuntimeError("database write failed")
             
             log_info("Settings applied successfully")
             messagebox.showinfo("Success", "Settings saved successfully!")
@@ -271,8 +304,7 @@ class SettingsWindow:
     def reset_defaults(self):
         """Reset all settings to defaults."""
         if messagebox.askyesno("Confirm", "Reset all settings to defaults?"):
-            db.get_connection().execute("DELETE FROM settings")
-            db.get_connection().commit()
+            db.clear_settings()
             
             self.load_settings()
             messagebox.showinfo("Success", "Settings reset to defaults!")
@@ -280,12 +312,49 @@ class SettingsWindow:
     def clear_cache(self):
         """Clear cache."""
         if messagebox.askyesno("Confirm", "Clear all cached responses?"):
-            cleared = db.clear_all_cache()
+            cleared = ResponseCache.clear_all()
             messagebox.showinfo("Success", f"Cleared {cleared} cache entries!")
     
+    def refresh_cache_metrics(self):
+        """Show the latest per-type cache metrics."""
+        tree = self.cache_metrics_tree
+        tree.delete(*tree.get_children())
+        for query_type, m in ResponseCache.get_metrics().items():
+            tree.insert("", END, values=(
+                query_type,
+                m['hits'],
+                m['misses'],
+                m['negative_hits'],
+                f"{m['hit_ratio']:.0%}",
+                f"{m['lookup_time']['p95_ms']:g}ms",
+                f"{m['fetch_time']['p95_ms']:g}ms",
+                f"{m['saved_ms'] / 1000:.1f}s",
+            ))
+    
     def backup_database(self):
-        """Backup database."""
-        if db.backup():
+        """Backup database on a background thread."""
+        self.backup_btn.config(state=DISABLED)
+        self.backup_progress = 0
+        
+        def on_progress(copied, total):
+            self.backup_progress = int(copied * 100 / total) if total else 100
+        
+        task = db.backup_async(progress=on_progress)
+        self.window.after(100, self._poll_backup, task)
+    
+    def _poll_backup(self, task):
+        """Update backup progress from the Tk thread until the task finishes."""
+        if not self.window.winfo_exists():
+            return
+        
+        self.backup_progress_bar["value"] = self.backup_progress
+        if task.thread.is_alive():
+            self.window.after(100, self._poll_backup, task)
+            return
+        
+        self.backup_btn.config(state=NORMAL)
+        if task.result:
+            self.backup_progress_bar["value"] = 100
             messagebox.showinfo("Success", "Database backed up successfully!")
         else:
             messagebox.showerror("Error", "Failed to backup database")
@@ -293,7 +362,7 @@ class SettingsWindow:
     def restore_database(self):
         """Restore database."""
         if messagebox.askyesno("Confirm", "Restore from backup? Current data will be replaced."):
-            if db.restore(str(db.db_path.parent / "leafy_backup_latest.db")):
+            if db.restore(str(db.latest_backup_path)):
                 messagebox.showinfo("Success", "Database restored successfully!")
                 self.load_settings()
             else:
@@ -302,6 +371,5 @@ class SettingsWindow:
     def clear_history(self):
         """Clear command history."""
         if messagebox.askyesno("Confirm", "Clear all command history?"):
-            db.get_connection().execute("DELETE FROM command_history")
-            db.get_connection().commit()
+            db.clear_command_history()
             messagebox.showinfo("Success", "Command history cleared!")
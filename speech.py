@@ -0,0 +1,508 @@
+"""
+Speech output for Leafy
+A worker thread owns the text-to-speech engine and speaks queued text a
+sentence at a time, so callers never wait for speech and new speech from
+the user can cut Leafy off. Fixed phrases are rendered to audio files
+once per voice and played from disk
+"""
+
+import functools
+import hashlib
+import itertools
+import math
+import queue
+import re
+import shutil
+import subprocess
+import threading
+import time
+import wave
+from array import array
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from db import db
+from logger import log_info, log_error
+from metrics import LatencyHistogram
+from platform_utils import get_platform
+
+# pyttsx3 driver for each platform
+TTS_DRIVERS = {
+    'windows': 'sapi5',
+    'macos': 'nsss',
+    'linux': 'espeak',
+}
+
+# Settings applied to the engine, with their defaults
+SPEECH_SETTINGS = {
+    'speech_rate': 160,
+    'speech_volume': 1.0,
+    'voice': "default",
+}
+
+# Utterance priorities; lower is spoken first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2  # rendering phrase audio, only when nothing else is queued
+
+# Speech is split after sentence punctuation (but not list numbers like
+# "1.") and at line breaks
+SENTENCE_BREAK_RE = re.compile(r'(?<=[.!?])(?<!\b\d\.)(?<!\b\d\d\.)\s+|\s*\n\s*')
+
+# While Leafy is talking, the microphone must hear this many times the
+# ambient energy threshold before it counts as the user barging in
+BARGE_IN_FACTOR = 3.0
+# Seconds of audio kept from before the barge-in, so its first syllables
+# still reach the recognizer
+BARGE_IN_PRE_ROLL = 0.3
+
+# Constant lines Leafy says often; each is rendered to an audio file per
+# voice/rate/volume and played from PHRASE_AUDIO_DIR instead of synthesized
+CACHED_PHRASES = (
+    "Good Morning!", "Good Afternoon!", "Good Evening!", "I am Leafy!",
+    "What do people call you?", "How may I help you?", "I am fine, Thank you",
+    "How are you doing?", "I'm glad", "Noted", "At your service!", "Here you go",
+    "Done", "Locating....", "Searching wikipedia...", "According to Wikipedia",
+    "OK, what would you like me to note down?", "Do you want me to mention the date and time too?",
+    "What should I name the screenshot?", "Please hold the screen", "Hibernating",
+    "Leafy, Signing out!", "Just trying to help", "Sorry, I can't do that on this computer",
+)
+PHRASE_AUDIO_DIR = Path(__file__).parent / 'data' / 'phrase_audio'
+
+# File type each driver's save_to_file() writes
+AUDIO_EXTENSIONS = {
+    'nsss': '.aiff',
+}
+
+# Words in voice names that reveal the voice's gender when the driver doesn't
+VOICE_NAME_HINTS = {
+    'female': {'female', 'zira', 'hazel', 'susan', 'samantha', 'victoria', 'karen', 'moira'},
+    'male': {'male', 'david', 'george', 'mark', 'alex', 'daniel', 'fred'},
+}
+
+
+def create_engine(driver: Optional[str]):
+    """Create a pyttsx3 engine (slow: loads the platform speech stack)."""
+    import pyttsx3
+    return pyttsx3.init(driver)
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split text into sentences so the first can be spoken at once."""
+    return [s for s in (part.strip() for part in SENTENCE_BREAK_RE.split(str(text))) if s]
+
+
+def chunk_rms(chunk: bytes, sample_width: int = 2) -> float:
+    """Root-mean-square energy of a chunk of signed PCM audio."""
+    typecode = {1: 'b', 2: 'h', 4: 'i'}[sample_width]
+    samples = array(typecode, chunk[:len(chunk) - len(chunk) % sample_width])
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(x * x for x in samples) / len(samples))
+
+
+def phrase_file_name(phrase: str, extension: str = '.wav') -> str:
+    """File name of a phrase's rendered audio."""
+    return hashlib.sha1(phrase.encode('utf-8')).hexdigest()[:16] + extension
+
+
+def audio_duration(path: Path) -> Optional[float]:
+    """Length in seconds of a WAV file, or None if it can't be read."""
+    try:
+        with wave.open(str(path), 'rb') as audio:
+            return audio.getnframes() / audio.getframerate()
+    except (wave.Error, EOFError, OSError, ZeroDivisionError):
+        return None
+
+
+class AudioPlayer:
+    """Plays audio files with the platform's own player; stop() works from any thread."""
+
+    def __init__(self):
+        self.platform = get_platform()
+        self._process = None
+        self._stopped = threading.Event()
+
+    def play(self, path: Path):
+        """Play path to the end (or until stop()). Raises OSError or RuntimeError if it can't."""
+        self._stopped.clear()
+        if self.platform == 'windows':
+            import winsound
+            winsound.PlaySound(str(path), winsound.SND_FILENAME | winsound.SND_ASYNC)
+            self._stopped.wait(audio_duration(path) or 0)
+            return
+
+        command = ['afplay', str(path)] if self.platform == 'macos' else ['aplay', '-q', str(path)]
+        self._process = subprocess.Popen(command)
+        try:
+            self._process.wait()
+        finally:
+            self._process = None
+
+    def stop(self):
+        """Cut off the file being played, if any."""
+        self._stopped.set()
+        if self.platform == 'windows':
+            import winsound
+            winsound.PlaySound(None, 0)
+        process = self._process
+        if process is not None:
+            process.terminate()
+
+
+def pick_voice(voices: List[Any], wanted: str) -> Optional[str]:
+    """Id of the voice matching a voice setting, or None for the engine default.
+
+    wanted is "default", "male", "female" or a voice id.
+    """
+    if not wanted or wanted == "default":
+        return None
+    for voice in voices:
+        if voice.id == wanted:
+            return voice.id
+
+    hints = VOICE_NAME_HINTS.get(wanted, set())
+    for voice in voices:
+        gender = (getattr(voice, 'gender', None) or "").lower()
+        words = set(re.findall(r"[a-z]+", (voice.name or "").lower()))
+        if gender == wanted or words & hints:
+            return voice.id
+    return None
+
+
+class Utterance:
+    """Text handed to speak(), with its timings once it has been spoken."""
+
+    __slots__ = ('text', 'priority', 'interruptible', 'chunks_left', 'enqueued_at',
+                 'started_at', 'finished_at', 'cancelled', 'done')
+
+    def __init__(self, text: str, priority: int, interruptible: bool, chunks: int):
+        self.text = text
+        self.priority = priority
+        self.interruptible = interruptible
+        self.chunks_left = chunks
+        self.enqueued_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+        self.cancelled = False
+        self.done = threading.Event()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the utterance has been spoken or interrupted."""
+        return self.done.wait(timeout)
+
+
+class SpeechManager:
+    """Owns the TTS engine and speaks through it on a worker thread.
+
+    start() creates the engine on the worker. speak() only queues text,
+    by priority, one sentence per item; anything queued before the engine
+    is ready is spoken once it is. interrupt() drops queued speech and
+    stops the sentence being spoken.
+
+    Sentences in phrases are rendered to files under audio_dir, in a
+    subdirectory per voice/rate/volume, and played with player from then
+    on. Changing a speech setting discards the old renders.
+    """
+
+    def __init__(self, driver: Optional[str] = None,
+                 engine_factory: Callable[[Optional[str]], Any] = create_engine,
+                 player: Optional[AudioPlayer] = None,
+                 audio_dir: Path = PHRASE_AUDIO_DIR,
+                 phrases=CACHED_PHRASES):
+        self.driver = driver or TTS_DRIVERS.get(get_platform())
+        self.engine_factory = engine_factory
+        self.player = player or AudioPlayer()
+        self.audio_dir = Path(audio_dir)
+        self.phrases = frozenset(phrases)
+        self._phrase_dir = None  # audio_dir subdirectory for the current voice settings
+        self._extension = AUDIO_EXTENSIONS.get(self.driver, '.wav')
+        self.engine = None
+        self.error = None
+        self._default_voice = None  # the engine's own voice, for voice="default"
+        self._ready = threading.Event()
+        # (priority, order, utterance, sentence); with no utterance the last item is
+        # a job for the worker (settings, rendering) or None to stop it
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()  # keeps equal priorities first-in, first-out
+        self._unfinished = []
+        self._current = None  # utterance whose sentence is being spoken
+        self._lock = threading.Condition()  # guards _unfinished and the stats
+        self._engine_lock = threading.Lock()  # pyttsx3 engines are not thread-safe
+        self._thread = None
+        self.queue_time = LatencyHistogram()  # speak() to the first sentence starting
+        self.playback_time = LatencyHistogram()  # first sentence starting to the last ending
+        self.interrupted = 0
+        self.phrases_played = 0  # sentences played from rendered audio
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    @property
+    def busy(self) -> bool:
+        """Whether anything is being spoken or waiting to be."""
+        with self._lock:
+            return bool(self._unfinished)
+
+    def start(self):
+        """Start the worker, which creates the engine, and follow settings changes."""
+        if self._thread is not None:
+            return
+        db.add_settings_listener(self.apply_settings, keys=SPEECH_SETTINGS)
+        self._thread = threading.Thread(target=self._run, name="leafy-tts",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        """Drop pending speech and stop the worker."""
+        if self._thread is None:
+            return
+        self.interrupt(force=True)
+        self._queue.put((-1, next(self._order), None, None))
+        self._thread.join(timeout)
+        self._thread = None
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Block until the engine has been created (or failed to be)."""
+        return self._ready.wait(timeout)
+
+    def wait_until_idle(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything queued has been spoken or interrupted."""
+        with self._lock:
+            return self._lock.wait_for(lambda: not self._unfinished, timeout)
+
+    def speak(self, text: str, priority: int = PRIORITY_NORMAL,
+              interruptible: bool = True) -> Utterance:
+        """Queue text to be spoken and return at once.
+
+        Lower priorities are spoken first. interruptible=False protects the
+        utterance from interrupt(), e.g. for warnings before a shutdown.
+        """
+        chunks = split_sentences(text)
+        utterance = Utterance(str(text), priority, interruptible, len(chunks))
+        if not chunks:
+            utterance.done.set()
+            return utterance
+
+        with self._lock:
+            self._unfinished.append(utterance)
+        for chunk in chunks:
+            self._queue.put((priority, next(self._order), utterance, chunk))
+        return utterance
+
+    def interrupt(self, force: bool = False) -> int:
+        """Barge-in: drop queued speech and stop the current sentence.
+
+        Utterances queued with interruptible=False carry on unless force is
+        set. Returns the number of utterances dropped.
+        """
+        with self._lock:
+            dropped = [u for u in self._unfinished if force or u.interruptible]
+            for utterance in dropped:
+                utterance.cancelled = True
+                self._finish(utterance)
+            self.interrupted += len(dropped)
+            playing_dropped = self._current is not None and self._current.cancelled
+        if playing_dropped:
+            self.player.stop()
+        if dropped:
+            log_info(f"Speech interrupted ({len(dropped)} utterance(s) dropped)")
+        return len(dropped)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue and playback latency summaries, and how often speech was cut off."""
+        with self._lock:
+            return {
+                'utterances': self.queue_time.count,
+                'interrupted': self.interrupted,
+                'phrases_played': self.phrases_played,
+                'queue_time': self.queue_time.summary(),
+                'playback_time': self.playback_time.summary(),
+            }
+
+    def _finish(self, utterance: Utterance):
+        """Mark utterance done; callers hold _lock."""
+        if utterance.done.is_set():
+            return
+        utterance.finished_at = time.perf_counter()
+        if utterance.started_at is not None and not utterance.cancelled:
+            self.playback_time.record(utterance.finished_at - utterance.started_at)
+        self._unfinished.remove(utterance)
+        utterance.done.set()
+        self._lock.notify_all()
+
+    def _run(self):
+        self._warm_up()
+        while True:
+            _, _, utterance, chunk = self._queue.get()
+            if utterance is None:
+                if chunk is None:
+                    return
+                try:
+                    chunk()  # a job for the worker between sentences
+                except Exception as e:
+                    log_error("SPEECH", "Speech worker job failed", str(e))
+                continue
+            if utterance.cancelled:
+                continue
+
+            with self._lock:
+                if utterance.started_at is None:
+                    utterance.started_at = time.perf_counter()
+                    self.queue_time.record(utterance.started_at - utterance.enqueued_at)
+                self._current = utterance
+            if not self._play_phrase(chunk):
+                self._say(chunk)
+            with self._lock:
+                self._current = None
+                utterance.chunks_left -= 1
+                if utterance.chunks_left <= 0:
+                    self._finish(utterance)
+
+    def _warm_up(self):
+        start = time.perf_counter()
+        try:
+            engine = self.engine_factory(self.driver)
+            with self._engine_lock:
+                self.engine = engine
+                self._default_voice = engine.getProperty('voice')
+                self._apply(engine, {key: db.get_setting(key, default)
+                                     for key, default in SPEECH_SETTINGS.items()})
+                if hasattr(engine, 'connect'):
+                    engine.connect('started-word', self._on_word)
+                self._update_phrase_dir(engine)
+            elapsed = (time.perf_counter() - start) * 1000
+            log_info(f"Speech engine ({self.driver}) ready in {elapsed:.0f} ms")
+        except Exception as e:
+            self.error = str(e)
+            log_error("SPEECH", f"Failed to start speech engine ({self.driver})", str(e))
+        self._ready.set()
+
+    def _on_word(self, name, location, length):
+        # Engine callbacks run on the worker, where stop() is safe to call
+        current = self._current
+        if current is not None and current.cancelled:
+            self.engine.stop()
+
+    def _say(self, text: str):
+        if self.engine is None:
+            print(text)  # no speech on this machine; at least show it
+            return
+        try:
+            with self._engine_lock:
+                self.engine.say(text)
+                self.engine.runAndWait()
+        except Exception as e:
+            log_error("SPEECH", "Failed to speak", str(e))
+
+    def apply_settings(self, changes: Dict[str, Any]):
+        """Settings listener: have the worker apply changed speech settings.
+
+        Runs on whichever thread saved the settings (e.g. the settings
+        window), so it only queues the change; the worker applies it
+        before the next sentence.
+        """
+        self._queue.put((-1, next(self._order), None,
+                         functools.partial(self._apply_settings, changes)))
+
+    def _apply_settings(self, changes: Dict[str, Any]):
+        with self._engine_lock:
+            if self.engine is not None:
+                self._apply(self.engine, changes)
+                self._update_phrase_dir(self.engine)
+
+    def _update_phrase_dir(self, engine):
+        """Point phrase audio at the current voice; drop other voices' renders
+        and queue the missing phrases for rendering. Callers hold _engine_lock."""
+        if not hasattr(engine, 'save_to_file'):
+            return  # this engine can't render; every phrase is spoken live
+        voice = "|".join(str(engine.getProperty(name)) for name in ('voice', 'rate', 'volume'))
+        key = hashlib.sha1(f"{self.driver}|{voice}".encode('utf-8')).hexdigest()[:12]
+        phrase_dir = self.audio_dir / key
+        if phrase_dir == self._phrase_dir:
+            return
+        self._phrase_dir = phrase_dir
+
+        try:
+            phrase_dir.mkdir(parents=True, exist_ok=True)
+            for stale in self.audio_dir.iterdir():
+                if stale.is_dir() and stale != phrase_dir:
+                    shutil.rmtree(stale, ignore_errors=True)
+        except OSError as e:
+            log_error("SPEECH", "Failed to prepare phrase audio cache", str(e))
+            return
+
+        missing = [p for p in sorted(self.phrases)
+                   if not (phrase_dir / phrase_file_name(p, self._extension)).exists()]
+        for phrase in missing:
+            self._queue.put((PRIORITY_BACKGROUND, next(self._order), None,
+                             functools.partial(self._render, phrase)))
+        if missing:
+            log_info(f"Rendering {len(missing)} phrase(s) for voice {key}")
+
+    def _phrase_path(self, phrase: str) -> Optional[Path]:
+        phrase_dir = self._phrase_dir
+        if phrase_dir is None or phrase not in self.phrases:
+            return None
+        return phrase_dir / phrase_file_name(phrase, self._extension)
+
+    def _render(self, phrase: str):
+        """Render a phrase to its audio file (on the worker, between utterances)."""
+        path = self._phrase_path(phrase)
+        if path is None or path.exists():
+            return
+        partial = path.with_name(path.stem + '.part' + path.suffix)
+        try:
+            with self._engine_lock:
+                self.engine.save_to_file(phrase, str(partial))
+                self.engine.runAndWait()
+            partial.replace(path)
+        except Exception as e:
+            log_error("SPEECH", f"Failed to render phrase: {phrase}", str(e))
+            partial.unlink(missing_ok=True)
+
+    def _play_phrase(self, phrase: str) -> bool:
+        """Play a phrase's rendered audio. False if there is none to play."""
+        path = self._phrase_path(phrase)
+        if path is None or not path.exists():
+            return False
+        try:
+            self.player.play(path)
+        except (OSError, RuntimeError) as e:
+            log_error("SPEECH", "Failed to play phrase audio", str(e))
+            return False
+        with self._lock:
+            self.phrases_played += 1
+        return True
+
+    def _apply(self, engine, settings: Dict[str, Any]):
+        if settings.get('speech_rate') is not None:
+            engine.setProperty('rate', int(settings['speech_rate']))
+        if settings.get('speech_volume') is not None:
+            engine.setProperty('volume', float(settings['speech_volume']))
+        if 'voice' in settings:
+            voice_id = pick_voice(engine.getProperty('voices'), settings['voice'])
+            voice_id = voice_id or self._default_voice
+            if voice_id is not None:
+                engine.setProperty('voice', voice_id)
+
+
+def wait_for_speech(recognizer, source, speech: SpeechManager) -> bytes:
+    """Block until the microphone hears the user, interrupting Leafy if it is talking.
+
+    recognizer and source are a speech_recognition Recognizer and an open
+    Microphone. Returns the raw audio from just before the threshold was
+    crossed up to and including the loud chunk; prepend it to what
+    recognizer.listen() captures next.
+    """
+    frames = deque(maxlen=max(1, math.ceil(BARGE_IN_PRE_ROLL * source.SAMPLE_RATE / source.CHUNK)))
+    while True:
+        chunk = source.stream.read(source.CHUNK)
+        frames.append(chunk)
+        talking = speech.busy
+        threshold = recognizer.energy_threshold * (BARGE_IN_FACTOR if talking else 1)
+        if chunk_rms(chunk, source.SAMPLE_WIDTH) > threshold:
+            if talking:
+                speech.interrupt()
+            return b"".join(frames)
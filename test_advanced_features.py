@@ -3,6 +3,9 @@
 
 import sys
 import os
+import shutil
+import tempfile
+import threading
 import time
 from pathlib import Path
 
@@ -59,6 +62,561 @@ def test_database():
         return False
 
 
+def _temp_database():
+    """Create a throwaway Database in a temporary directory."""
+    from db import Database
+    tmp_dir = Path(tempfile.mkdtemp(prefix="leafy_test_"))
+    return Database(tmp_dir / "test.db"), tmp_dir
+
+
+def test_connection_pool():
+    """Test pooled per-thread connections."""
+    print("\n" + "="*60)
+    print("Testing Connection Pool (db.py)")
+    print("="*60)
+    
+    database, tmp_dir = _temp_database()
+    try:
+        print("DONE: Testing connection reuse within a thread...")
+        conn = database.get_connection()
+        assert database.get_connection() is conn, "Connection not reused"
+        
+        journal_mode = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        assert journal_mode == 'wal', f"Unexpected journal mode: {journal_mode}"
+        print(f"  Journal mode: {journal_mode}")
+        
+        print("DONE: Testing one connection per thread...")
+        other = []
+        worker = threading.Thread(target=lambda: other.append(database.get_connection()))
+        worker.start()
+        worker.join()
+        assert other[0] is not conn, "Threads share a connection"
+        
+        print("DONE: Testing failed writes are rolled back...")
+        database.save_note("Pool Note", "content")
+        assert not database.save_note("Pool Note", None), "NULL content accepted"
+        assert not conn.in_transaction, "Transaction left open"
+        assert database.get_note("Pool Note")['content'] == "content"
+        
+        print("DONE: Testing close()...")
+        database.close()
+        assert database.pool.size() == 0, "Connections left open"
+        
+        print("\nConnection pool tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nConnection pool test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_write_behind():
+    """Test batched command history writes."""
+    print("\n" + "="*60)
+    print("Testing Command Write-Behind (db.py)")
+    print("="*60)
+    
+    database, tmp_dir = _temp_database()
+    try:
+        print("DONE: Testing queued add_command()...")
+        database.enable_write_behind(batch_size=10, flush_interval_ms=50)
+        for i in range(25):
+            assert database.add_command(f"queued command {i}"), "add_command failed"
+        
+        print("DONE: Testing flush() barrier...")
+        assert database.flush(timeout=5), "flush() timed out"
+        count = database.get_stats()['commands']
+        assert count == 25, f"Expected 25 commands, found {count}"
+        print(f"  Commands written: {count}")
+        
+        print("DONE: Testing drain on close...")
+        for i in range(5):
+            database.add_command(f"late command {i}")
+        database.disable_write_behind()
+        count = database.get_stats()['commands']
+        assert count == 30, f"Queued commands lost: {count}"
+        
+        print("\nWrite-behind tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nWrite-behind test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_notes_search():
+    """Test full-text note search."""
+    print("\n" + "="*60)
+    print("Testing Notes Full-Text Search (db.py)")
+    print("="*60)
+    
+    database, tmp_dir = _temp_database()
+    try:
+        database.save_note("Python tips", "Use generators for streaming", "python,code")
+        database.save_note("Standup", "Discuss python packaging at ten", "work")
+        database.save_note("Groceries", "milk eggs bread", "home")
+        
+        print("DONE: Testing ranked search...")
+        titles = [n['title'] for n in database.search_notes("python")]
+        assert titles == ["Python tips", "Standup"], f"Unexpected ranking: {titles}"
+        
+        print("DONE: Testing prefix and phrase queries...")
+        assert len(database.search_notes("pack")) == 1, "Prefix query failed"
+        assert len(database.search_notes('"packaging at ten"')) == 1, "Phrase query failed"
+        assert not database.search_notes('"ten at packaging"'), "Phrase order ignored"
+        
+        print("DONE: Testing snippets...")
+        note = database.search_notes("eggs", snippets=True)[0]
+        assert note['snippet'] == "milk [eggs] bread", f"Bad snippet: {note['snippet']}"
+        
+        print("DONE: Testing index stays in sync...")
+        database.save_note("Groceries", "cheese", "home")
+        assert not database.search_notes("eggs"), "Stale index entry after update"
+        database.delete_note("Groceries")
+        assert not database.search_notes("cheese"), "Stale index entry after delete"
+        
+        print("DONE: Testing backfill of an existing database...")
+        conn = database.get_connection()
+        conn.execute("DROP TABLE notes_fts")
+        conn.commit()
+        database.init_database()
+        assert len(database.search_notes("python")) == 2, "Backfill failed"
+        
+        print("DONE: Testing LIKE fallback...")
+        database.fts_enabled = False
+        assert len(database.search_notes("python")) == 2, "Fallback search failed"
+        
+        print("\nNotes search tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nNotes search test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_cache_expiry():
+    """Test indexed cache expiry, migration and batched sweeping."""
+    print("\n" + "="*60)
+    print("Testing Cache Expiry (db.py)")
+    print("="*60)
+    
+    import sqlite3
+    from db import Database
+    
+    tmp_dir = Path(tempfile.mkdtemp(prefix="leafy_test_"))
+    db_path = tmp_dir / "test.db"
+    database = None
+    try:
+        print("DONE: Testing migration of an old response_cache table...")
+        old = sqlite3.connect(str(db_path))
+        old.execute('''
+            CREATE TABLE response_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                query_hash TEXT UNIQUE NOT NULL,
+                query_type TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                ttl_seconds INTEGER DEFAULT 86400
+            )
+        ''')
+        old.execute("INSERT INTO response_cache (query_hash, query_type, response, ttl_seconds) "
+                    "VALUES ('fresh', 'news', 'fresh response', 3600)")
+        old.execute("INSERT INTO response_cache (query_hash, query_type, response, created_at, ttl_seconds) "
+                    "VALUES ('stale', 'news', 'stale response', '2000-01-01 00:00:00', 60)")
+        old.commit()
+        old.close()
+        
+        database = Database(db_path)
+        assert database.get_cached_response('fresh') == 'fresh response', "Migrated entry lost"
+        assert database.get_cached_response('stale') is None, "Expired entry returned"
+        
+        print("DONE: Testing batched clear_expired_cache()...")
+        conn = database.get_connection()
+        conn.executemany("INSERT INTO response_cache (query_hash, query_type, response, expires_at) "
+                         "VALUES (?, 'news', 'x', 0)", [(f"old{i}",) for i in range(25)])
+        conn.commit()
+        cleared = database.clear_expired_cache(batch_size=10)
+        assert cleared == 26, f"Expected 26 expired entries, cleared {cleared}"
+        assert database.get_stats()['cache_entries'] == 1, "Live entry removed"
+        
+        print("DONE: Testing background sweeper...")
+        conn.execute("UPDATE response_cache SET expires_at = 0")
+        conn.commit()
+        database.start_cache_sweeper(interval=0.05, batch_size=10)
+        deadline = time.time() + 5
+        while database.get_stats()['cache_entries'] and time.time() < deadline:
+            time.sleep(0.05)
+        assert database.get_stats()['cache_entries'] == 0, "Sweeper did not run"
+        database.stop_cache_sweeper()
+        
+        print("DONE: Testing the sweeper also runs at startup...")
+        conn.executemany("INSERT INTO response_cache (query_hash, query_type, response, expires_at) "
+                         "VALUES (?, 'news', 'x', 0)", [(f"left{i}",) for i in range(5)])
+        conn.commit()
+        database.start_cache_sweeper(interval=3600)
+        deadline = time.time() + 5
+        while database.get_stats()['cache_entries'] and time.time() < deadline:
+            time.sleep(0.05)
+        assert database.get_stats()['cache_entries'] == 0, "Startup sweep did not run"
+        database.stop_cache_sweeper()
+        
+        print("\nCache expiry tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nCache expiry test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        if database:
+            database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_cache_eviction():
+    """Test byte-budgeted response_cache eviction."""
+    print("\n" + "="*60)
+    print("Testing Cache Eviction (db.py)")
+    print("="*60)
+    
+    from db import encode_payload
+    
+    database, tmp_dir = _temp_database()
+    try:
+        entry_size = len(encode_payload("x" * 100))
+        
+        def fill():
+            database.clear_all_cache()
+            for i in range(10):
+                database.cache_response(f"hash{i}", "news" if i % 2 else "wikipedia",
+                                        "x" * 100, 3600)
+            conn = database.get_connection()
+            conn.execute("UPDATE response_cache SET last_access = last_access - id")
+            conn.commit()
+        
+        def remaining():
+            conn = database.get_connection()
+            return {row[0] for row in conn.execute("SELECT query_hash FROM response_cache")}
+        
+        print("DONE: Testing access tracking...")
+        fill()
+        for _ in range(3):
+            database.get_cached_entry("hash0")
+        database.flush_cache_touches()
+        conn = database.get_connection()
+        hits = conn.execute("SELECT hit_count FROM response_cache WHERE query_hash = 'hash0'").fetchone()[0]
+        assert hits == 3, f"Expected 3 hits, got {hits}"
+        database.cache_response("hash0", "wikipedia", "x" * 100, 3600)
+        hits = conn.execute("SELECT hit_count FROM response_cache WHERE query_hash = 'hash0'").fetchone()[0]
+        assert hits == 3, "Replacing an entry reset its hit_count"
+        
+        print("DONE: Testing LRU keeps recently accessed entries...")
+        fill()
+        assert database.evict_cache(max_bytes=5 * entry_size, policy='lru') == 5
+        assert remaining() == {f"hash{i}" for i in range(5)}, remaining()
+        
+        print("DONE: Testing LFU keeps frequently hit entries...")
+        fill()
+        database.get_cached_entry("hash9")
+        assert database.evict_cache(max_bytes=entry_size, policy='lfu') == 9
+        assert remaining() == {"hash9"}, remaining()
+        
+        print("DONE: Testing per-type quotas...")
+        fill()
+        database.set_cache_budget(type_quotas={'news': 2 * entry_size})
+        database.evict_cache()
+        assert remaining() == {f"hash{i}" for i in (0, 1, 2, 3, 4, 6, 8)}, remaining()
+        
+        try:
+            database.evict_cache(policy='random')
+            raise AssertionError("Unknown policy accepted")
+        except ValueError:
+            pass
+        
+        print("\nCache eviction tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nCache eviction test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_cache_compression():
+    """Test codec-tagged response_cache payloads."""
+    print("\n" + "="*60)
+    print("Testing Cache Compression (db.py)")
+    print("="*60)
+    
+    from db import CODEC_RAW, CODEC_ZLIB, encode_payload, decode_payload
+    
+    database, tmp_dir = _temp_database()
+    try:
+        conn = database.get_connection()
+        
+        def stored(query_hash):
+            return conn.execute('SELECT response, size_bytes FROM response_cache WHERE query_hash = ?',
+                                (query_hash,)).fetchone()
+        
+        print("DONE: Testing large payloads are compressed...")
+        large = "Python is a high-level programming language. " * 200
+        database.cache_response("large", "wikipedia", large, 3600)
+        payload, size_bytes = stored("large")
+        assert isinstance(payload, bytes) and payload[0] == CODEC_ZLIB, "Payload not compressed"
+        assert size_bytes == len(payload) < len(large), "size_bytes should be the stored size"
+        assert database.get_cached_response("large") == large, "Round trip failed"
+        
+        print("DONE: Testing small payloads are stored raw...")
+        database.cache_response("small", "calculation", "42 \u00b0C", 3600)
+        payload, _ = stored("small")
+        assert payload[0] == CODEC_RAW, "Small payload should not be compressed"
+        assert database.get_cached_response("small") == "42 \u00b0C", "Round trip failed"
+        
+        print("DONE: Testing legacy TEXT rows are still readable...")
+        conn.execute("INSERT INTO response_cache (query_hash, query_type, response, expires_at) "
+                     "VALUES ('legacy', 'news', 'old headlines', ?)", (int(time.time()) + 3600,))
+        conn.commit()
+        assert database.get_cached_response("legacy") == "old headlines", "Legacy row unreadable"
+        
+        assert decode_payload(encode_payload("x" * 5000, min_bytes=0)) == "x" * 5000
+        
+        print("\nCache compression tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nCache compression test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_settings_snapshot():
+    """Test the in-memory settings snapshot and bulk writes."""
+    print("\n" + "="*60)
+    print("Testing Settings Snapshot (db.py)")
+    print("="*60)
+    
+    database, tmp_dir = _temp_database()
+    try:
+        changes = []
+        database.add_settings_listener(changes.append)
+        rate_changes = []
+        database.add_settings_listener(rate_changes.append, keys=["speech_rate"])
+        
+        print("DONE: Testing set_settings() bulk write...")
+        assert database.set_settings({
+            "speech_rate": 180, "speech_volume": 0.5, "notifications": False,
+            "voice": "female", "recent": ["a", "b"],
+        }), "set_settings failed"
+        assert database.get_setting("speech_rate") == 180
+        assert database.get_setting("notifications") is False
+        assert database.get_setting("recent") == ["a", "b"]
+        
+        print("DONE: Testing change notifications...")
+        assert len(changes) == 1 and len(changes[0]) == 5, f"Unexpected changes: {changes}"
+        assert rate_changes == [{"speech_rate": 180}], f"Unexpected changes: {rate_changes}"
+        database.set_setting("speech_rate", 180, "int")
+        assert len(changes) == 1, "Listener fired for an unchanged value"
+        
+        print("DONE: Testing reads come from memory...")
+        conn = database.get_connection()
+        conn.execute("UPDATE settings SET value = '999' WHERE key = 'speech_rate'")
+        conn.commit()
+        assert database.get_setting("speech_rate") == 180, "Read went to the database"
+        
+        print("DONE: Testing snapshot matches a fresh load...")
+        database.reload_settings()
+        assert database.get_setting("speech_rate") == 999, "reload_settings() failed"
+        assert changes[-1] == {"speech_rate": 999}, f"Reload not notified: {changes[-1]}"
+        
+        print("DONE: Testing clear_settings()...")
+        assert database.clear_settings() == 5
+        assert database.get_setting("voice", "default") == "default"
+        
+        print("\nSettings snapshot tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nSettings snapshot test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_backup_rotation():
+    """Test incremental backups, the latest pointer and rotation."""
+    print("\n" + "="*60)
+    print("Testing Backup and Rotation (db.py)")
+    print("="*60)
+    
+    import sqlite3
+    database, tmp_dir = _temp_database()
+    try:
+        for i in range(200):
+            database.save_note(f"Note {i}", "x" * 2000)
+        
+        print("DONE: Testing stepped backup with progress...")
+        steps = []
+        task = database.backup_async(progress=lambda copied, total: steps.append((copied, total)),
+                                     pages=16)
+        assert task.wait(timeout=30), "Background backup failed"
+        assert len(steps) > 1 and steps[-1][0] == steps[-1][1], f"Unexpected progress: {steps[-3:]}"
+        print(f"  Backup took {len(steps)} steps")
+        
+        print("DONE: Testing leafy_backup_latest.db...")
+        latest = sqlite3.connect(str(database.latest_backup_path))
+        count = latest.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+        latest.close()
+        assert count == 200, f"Latest backup has {count} notes"
+        assert database.restore(str(database.latest_backup_path)), "Restore failed"
+        
+        print("DONE: Testing rotation...")
+        for stamp in ["20240101_090000", "20240101_180000", "20240102_090000",
+                      "20240110_090000", "20240120_090000", "20240201_090000"]:
+            (database.backup_dir / f"leafy_backup_{stamp}.db").write_bytes(b"")
+        removed = database.rotate_backups(keep_daily=2, keep_weekly=3)
+        kept = [p.name[13:28] for p in database.list_backups()]
+        # Today's real backup takes one daily and one weekly slot
+        assert removed == 4, f"Expected 4 removed, got {removed}: {kept}"
+        assert "20240120_090000" in kept and "20240101_090000" not in kept, f"Wrong backups kept: {kept}"
+        
+        print("\nBackup tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nBackup test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_command_rollups():
+    """Test incrementally maintained command usage rollups."""
+    print("\n" + "="*60)
+    print("Testing Command Usage Rollups (db.py)")
+    print("="*60)
+    
+    database, tmp_dir = _temp_database()
+    try:
+        print("DONE: Testing rollups maintained on insert...")
+        database.add_command("open youtube", duration=1.0)
+        database.add_command("open youtube", duration=3.0)
+        database.add_command("news", status="failed", duration=2.0)
+        database.enable_write_behind()
+        database.add_command("open youtube", duration=2.0)
+        database.disable_write_behind()
+        
+        top = database.get_top_commands(limit=1)
+        assert top[0]['command'] == "open youtube" and top[0]['count'] == 3, f"Bad top: {top}"
+        assert top[0]['total_duration'] == 6.0 and top[0]['max_duration'] == 3.0
+        
+        print("DONE: Testing time-window queries...")
+        recent = database.get_top_commands(limit=5, days=1)
+        assert [r['command'] for r in recent] == ["open youtube", "news"], f"Bad window: {recent}"
+        usage = database.get_daily_usage(days=7)
+        assert len(usage) == 1 and usage[0]['count'] == 4 and usage[0]['failure_count'] == 1
+        
+        print("DONE: Testing rebuild from raw history...")
+        incremental = database.get_top_commands(limit=5)
+        assert database.rebuild_command_stats(), "Rebuild failed"
+        assert database.get_top_commands(limit=5) == incremental, "Rebuild differs from rollups"
+        
+        print("DONE: Testing clear_command_history()...")
+        assert database.clear_command_history() == 4
+        assert database.get_top_commands() == [], "Rollups not cleared"
+        
+        print("\nCommand rollup tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nCommand rollup test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_streaming_iterators():
+    """Test keyset-paginated iterators."""
+    print("\n" + "="*60)
+    print("Testing Streaming Iterators (db.py)")
+    print("="*60)
+    
+    database, tmp_dir = _temp_database()
+    try:
+        conn = database.get_connection()
+        # Many notes share a timestamp, so paging must break ties on id
+        conn.executemany("INSERT INTO notes (title, content, updated_at) VALUES (?, ?, ?)",
+                         [(f"Note {i}", f"body {i} shared", f"2024-01-01 00:00:0{i % 3}")
+                          for i in range(250)])
+        conn.commit()
+        for i in range(45):
+            database.add_command(f"command {i % 5}")
+        
+        print("DONE: Testing iter_notes() pages without gaps or repeats...")
+        ids = [row['id'] for row in database.iter_notes(page_size=20)]
+        assert len(ids) == 250 and len(set(ids)) == 250, f"Got {len(ids)} rows, {len(set(ids))} unique"
+        keys = [(row['updated_at'], row['id']) for row in database.iter_notes(page_size=20)]
+        assert keys == sorted(keys, reverse=True), "Rows not in keyset order"
+        
+        print("DONE: Testing lazy iteration...")
+        first = next(database.iter_notes(page_size=20))
+        assert first['updated_at'] == "2024-01-01 00:00:02"
+        
+        print("DONE: Testing iter_search_notes()...")
+        assert sum(1 for _ in database.iter_search_notes("shared", page_size=30)) == 250
+        database.fts_enabled = False
+        assert sum(1 for _ in database.iter_search_notes("shared", page_size=30)) == 250
+        database.fts_enabled = True
+        
+        print("DONE: Testing command history iterators...")
+        assert sum(1 for _ in database.iter_command_history(page_size=10)) == 45
+        assert sum(1 for _ in database.iter_search_commands("command 3", page_size=4)) == 9
+        
+        print("\nStreaming iterator tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nStreaming iterator test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
 def test_caching():
     """Test caching module."""
     print("\n" + "="*60)
@@ -111,6 +669,1064 @@ def test_caching():
         return False
 
 
+def test_query_canonicalization():
+    """Test canonical cache keys."""
+    print("\n" + "="*60)
+    print("Testing Query Canonicalization (cache.py)")
+    print("="*60)
+    
+    from cache import ResponseCache, canonicalize_query, replay_hit_rate
+    
+    try:
+        print("DONE: Testing keyword lookups share a key...")
+        keys = {ResponseCache.hash_query(q, "wikipedia")
+                for q in ["wikipedia  python", "python wikipedia", "Python?"]}
+        assert len(keys) == 1, f"Expected one key, got {len(keys)}"
+        assert canonicalize_query("latest news on cricket", "news") == "cricket"
+        
+        print("DONE: Testing calculation rules...")
+        assert canonicalize_query("calculate two hundred and five plus twenty one",
+                                  "calculation") == "205 + 21"
+        assert canonicalize_query("205+21", "calculation") == "205 + 21"
+        assert canonicalize_query("What's 3 to the power of 2?", "calculation") == "3 ^ 2"
+        
+        print("DONE: Testing word order is kept where it matters...")
+        assert canonicalize_query("two minus five", "calculation") != \
+            canonicalize_query("five minus two", "calculation")
+        assert canonicalize_query("dog bites man", "general") != \
+            canonicalize_query("man bites dog", "general")
+        
+        print("DONE: Testing distinct questions keep distinct keys...")
+        keys = {canonicalize_query(q, "wikipedia") for q in ["c++", "C#", "c", ".NET", "net"]}
+        assert keys == {"c++", "c#", "c", ".net", "net"}, keys
+        assert canonicalize_query("node.js wikipedia", "wikipedia") == "node.js"
+        assert canonicalize_query("The Who", "wikipedia") == "the who"
+        assert canonicalize_query("who are you", "wikipedia") == "who are you"
+        assert canonicalize_query("tell me about you", "general") == "tell me about you"
+        assert canonicalize_query("a hundred plus one", "calculation") == "100 + 1"
+        assert canonicalize_query("a hundred", "calculation") != \
+            canonicalize_query("hundred", "calculation")
+        assert canonicalize_query("a hundred", "general") == "a hundred"
+        assert canonicalize_query("five five", "calculation") != canonicalize_query("10", "calculation")
+        assert canonicalize_query("one two three", "calculation") == "1 2 3"
+        assert canonicalize_query("nineteen eighty four", "calculation") == "19 84"
+        assert canonicalize_query("one thousand two hundred thirty four", "calculation") == "1234"
+        
+        print("DONE: Testing hit rate replay...")
+        stats = replay_hit_rate([("python wikipedia", "wikipedia"),
+                                 ("wikipedia python", "wikipedia"),
+                                 ("Python", "wikipedia")])
+        assert stats['raw_hit_rate'] == 0 and stats['canonical_hit_rate'] == 2 / 3, stats
+        
+        print("\nQuery canonicalization tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nQuery canonicalization test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_memory_cache():
+    """Test the in-process LRU tier of the response cache."""
+    print("\n" + "="*60)
+    print("Testing Memory Cache Tier (cache.py)")
+    print("="*60)
+    
+    import cache
+    from cache import MemoryCache, ResponseCache
+    
+    database, tmp_dir = _temp_database()
+    original_db, cache.db = cache.db, database
+    try:
+        print("DONE: Testing LRU eviction by entry count...")
+        memory = MemoryCache(max_entries=2, max_bytes=1024)
+        expires = time.time() + 60
+        memory.put("a", "alpha", "general", expires)
+        memory.put("b", "beta", "general", expires)
+        memory.get("a")
+        memory.put("c", "gamma", "general", expires)
+        assert memory.get("b") is None and memory.get("a") is not None, "LRU order ignored"
+        
+        print("DONE: Testing eviction by total bytes...")
+        memory = MemoryCache(max_entries=10, max_bytes=10)
+        memory.put("a", "12345", "general", expires)
+        memory.put("b", "123456", "general", expires)
+        assert memory.get("a") is None and memory.total_bytes == 6, "Byte bound ignored"
+        
+        print("DONE: Testing per-entry TTL...")
+        memory.put("short", "x", "general", time.time() + 0.05)
+        time.sleep(0.1)
+        assert memory.get("short") is None, "Expired entry returned"
+        
+        print("DONE: Testing write-through and invalidation...")
+        query = "memory tier test query"
+        ResponseCache.cache_result(query, "cached answer", "general", 60)
+        query_hash = ResponseCache.hash_query(query, "general")
+        assert ResponseCache.memory.get(query_hash).value == "cached answer"
+        ResponseCache.memory.clear()
+        assert ResponseCache.get_cached(query, "general") == "cached answer", "SQLite tier missed"
+        assert ResponseCache.memory.get(query_hash) is not None, "L1 not filled from SQLite"
+        ResponseCache.clear_all()
+        assert ResponseCache.get_cached(query, "general") is None, "clear_all() left entries"
+        
+        print("\nMemory cache tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nMemory cache test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        ResponseCache.memory.clear()
+        cache.db = original_db
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_single_flight():
+    """Test request coalescing in get_cached_or_fetch()."""
+    print("\n" + "="*60)
+    print("Testing Single-Flight Fetches (cache.py)")
+    print("="*60)
+    
+    import cache
+    from cache import SingleFlight, get_cached_or_fetch
+    
+    database, tmp_dir = _temp_database()
+    original_db, cache.db = cache.db, database
+    try:
+        print("DONE: Testing concurrent callers share one fetch...")
+        calls = []
+        
+        def slow_fetch():
+            calls.append(1)
+            time.sleep(0.2)
+            return "fetched once"
+        
+        results = []
+        workers = [threading.Thread(target=lambda: results.append(
+            get_cached_or_fetch("single flight query", "general", slow_fetch, 60)))
+            for _ in range(8)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert len(calls) == 1, f"fetch_func called {len(calls)} times"
+        assert results == ["fetched once"] * 8, f"Unexpected results: {results}"
+        
+        print("DONE: Testing errors fan out to every waiter...")
+        flights = SingleFlight()
+        errors = []
+        
+        def failing():
+            time.sleep(0.2)
+            raise ValueError("upstream failed")
+        
+        def caller():
+            try:
+                flights.do("key", failing)
+            except ValueError as e:
+                errors.append(e)
+        
+        workers = [threading.Thread(target=caller) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        assert len(errors) == 4 and len({id(e) for e in errors}) == 1, f"Errors: {errors}"
+        assert not flights.in_flight("key"), "Key not released"
+        
+        print("\nSingle-flight tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nSingle-flight test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        cache.ResponseCache.memory.clear()
+        cache.db = original_db
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_stale_while_revalidate():
+    """Test soft/hard TTLs in get_cached_or_fetch()."""
+    print("\n" + "="*60)
+    print("Testing Stale-While-Revalidate (cache.py)")
+    print("="*60)
+    
+    import cache
+    from cache import ResponseCache, get_cached_or_fetch
+    
+    database, tmp_dir = _temp_database()
+    original_db, cache.db = cache.db, database
+    ResponseCache.memory.clear()
+    try:
+        print("DONE: Testing stale entries are served while refreshing...")
+        query_hash = ResponseCache.hash_query("swr query", "general")
+        database.cache_response(query_hash, "general", "old answer", 3600, stale_after=0)
+        entry = database.get_cached_entry(query_hash)
+        assert entry['stale_at'] <= entry['expires_at'], f"Bad entry: {entry}"
+        
+        refreshed = threading.Event()
+        
+        def fetch():
+            refreshed.set()
+            return "new answer"
+        
+        from async_ops import async_manager
+        tracked = len(async_manager.tasks)
+        result = get_cached_or_fetch("swr query", "general", fetch, 60, hard_ttl=3600)
+        assert result == "old answer", f"Expected stale answer, got {result}"
+        assert refreshed.wait(5), "Background refresh did not run"
+        assert len(async_manager.tasks) == tracked, "Refresh task was kept"
+        
+        deadline = time.time() + 5
+        while (ResponseCache.get_cached("swr query", "general") != "new answer"
+               or cache._fetches.in_flight(query_hash)):
+            assert time.time() < deadline, "Refreshed value was not cached"
+            time.sleep(0.01)
+        entry = ResponseCache.lookup("swr query", "general")
+        assert not entry.is_stale(), "Refreshed entry should be fresh"
+        
+        print("DONE: Testing hard-expired entries block on the fetch...")
+        database.cache_response(query_hash, "general", "expired answer", 0)
+        ResponseCache.memory.clear()
+        result = get_cached_or_fetch("swr query", "general", lambda: "blocking answer", 60)
+        assert result == "blocking answer", f"Expected fresh answer, got {result}"
+        
+        print("\nStale-while-revalidate tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nStale-while-revalidate test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        cache.ResponseCache.memory.clear()
+        cache.db = original_db
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_negative_caching():
+    """Test negative entries for failed and empty fetches."""
+    print("\n" + "="*60)
+    print("Testing Negative Caching (cache.py)")
+    print("="*60)
+    
+    import cache
+    from cache import ResponseCache, get_cached_or_fetch
+    
+    database, tmp_dir = _temp_database()
+    original_db, cache.db = cache.db, database
+    ResponseCache.memory.clear()
+    ResponseCache.reset_metrics()
+    try:
+        print("DONE: Testing failures are cached and not retried...")
+        calls = []
+        
+        def failing_fetch():
+            calls.append(1)
+            raise LookupError("page not found")
+        
+        assert get_cached_or_fetch("missing page", "wikipedia", failing_fetch, 60) is None
+        assert get_cached_or_fetch("missing page", "wikipedia", failing_fetch, 60) is None
+        assert len(calls) == 1, f"fetch_func called {len(calls)} times"
+        assert ResponseCache.get_failure("missing page", "wikipedia") == "LookupError"
+        assert ResponseCache.get_cached("missing page", "wikipedia") is None
+        
+        print("DONE: Testing empty results are cached separately...")
+        assert get_cached_or_fetch("no results", "calculation", lambda: "", 60) == ""
+        assert ResponseCache.get_failure("no results", "calculation") == ResponseCache.FAILURE_EMPTY
+        entry = database.get_cached_entry(ResponseCache.hash_query("no results", "calculation"))
+        assert entry['failure_kind'] == "empty", f"Bad row: {entry}"
+        assert database.get_stats()['negative_cache_entries'] == 2
+        
+        print("DONE: Testing negative entries expire...")
+        ResponseCache.cache_failure("flaky", "news", "PageError", ttl=0)
+        ResponseCache.memory.clear()
+        assert get_cached_or_fetch("flaky", "news", lambda: "headlines", 60) == "headlines"
+        
+        print("DONE: Testing connectivity errors are not cached...")
+        from urllib.error import URLError
+        calls.clear()
+        
+        def offline_fetch():
+            calls.append(1)
+            raise URLError("network is unreachable")
+        
+        assert get_cached_or_fetch("2+2", "calculation", offline_fetch, 60) is None
+        assert ResponseCache.get_failure("2+2", "calculation") is None
+        assert get_cached_or_fetch("2+2", "calculation", lambda: "4", 60) == "4"
+        assert len(calls) == 1
+        
+        print("DONE: Testing hit counters...")
+        counts = ResponseCache.get_metrics()
+        assert (counts['wikipedia']['hits'], counts['wikipedia']['negative_hits'],
+                counts['wikipedia']['misses']) == (0, 2, 1), counts['wikipedia']
+        assert counts['news']['misses'] == 1, counts['news']
+        
+        print("\nNegative caching tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nNegative caching test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        cache.ResponseCache.memory.clear()
+        cache.db = original_db
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_cache_metrics():
+    """Test per-type cache metrics."""
+    print("\n" + "="*60)
+    print("Testing Cache Metrics (cache.py)")
+    print("="*60)
+    
+    import cache
+    from cache import ResponseCache, get_cached_or_fetch
+    from metrics import LatencyHistogram
+    
+    database, tmp_dir = _temp_database()
+    original_db, cache.db = cache.db, database
+    ResponseCache.memory.clear()
+    ResponseCache.reset_metrics()
+    try:
+        print("DONE: Testing latency histogram...")
+        histogram = LatencyHistogram()
+        for ms in [0.05, 0.3, 3, 3, 40, 2000]:
+            histogram.record(ms / 1000)
+        summary = histogram.summary()
+        assert summary['count'] == 6 and summary['max_ms'] == 2000, summary
+        assert summary['p50_ms'] == 5 and summary['p95_ms'] == 2000, summary
+        
+        print("DONE: Testing counters and timings per type...")
+        
+        def slow_fetch():
+            time.sleep(0.02)
+            return "answer"
+        
+        for _ in range(3):
+            get_cached_or_fetch("metrics query", "wikipedia", slow_fetch, 60)
+        get_cached_or_fetch("metrics query", "news", lambda: None, 60)
+        
+        metrics = ResponseCache.get_metrics()
+        wiki = metrics['wikipedia']
+        assert (wiki['hits'], wiki['misses'], wiki['stores']) == (2, 1, 1), wiki
+        assert wiki['lookup_time']['count'] == 3, wiki['lookup_time']
+        assert wiki['fetch_time']['count'] == 1 and wiki['fetch_time']['mean_ms'] >= 20
+        assert abs(wiki['hit_ratio'] - 2 / 3) < 1e-9 and wiki['saved_ms'] >= 40, wiki
+        assert metrics['news']['negative_stores'] == 1, metrics['news']
+        
+        print("DONE: Testing eviction counts...")
+        database.evict_cache(max_bytes=0)
+        assert ResponseCache.get_metrics()['wikipedia']['evictions'] == 1
+        
+        print("\nCache metrics tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nCache metrics test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        cache.ResponseCache.memory.clear()
+        cache.db = original_db
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_batch_cache():
+    """Test batched multi-key cache reads and writes."""
+    print("\n" + "="*60)
+    print("Testing Batch Cache (cache.py)")
+    print("="*60)
+    
+    import cache
+    import json
+    import db as db_module
+    from cache import ResponseCache
+    
+    database, tmp_dir = _temp_database()
+    original_db, cache.db = cache.db, database
+    ResponseCache.memory.clear()
+    ResponseCache.reset_metrics()
+    try:
+        print("DONE: Testing put_many...")
+        headlines = {f"headline {i}": f"story {i}" for i in range(5)}
+        assert ResponseCache.put_many(headlines, "news", ttl=60)
+        assert ResponseCache.put_many([("python", {"summary": "language"})], "wikipedia", ttl=60)
+        assert ResponseCache.get_metrics()['news']['stores'] == 5
+        
+        print("DONE: Testing get_many across both tiers...")
+        ResponseCache.memory.clear()
+        ResponseCache.get_cached("headline 0", "news")  # back in memory
+        ResponseCache.cache_failure("unknown", "wikipedia", "empty")
+        ResponseCache.reset_metrics()
+        
+        items = list(headlines) + ["missing", ("python", "wikipedia"), ("unknown", "wikipedia")]
+        results = ResponseCache.get_many(items, "news")
+        assert [results[q] for q in headlines] == list(headlines.values()), results
+        assert results["missing"] is None and results[("unknown", "wikipedia")] is None
+        assert json.loads(results[("python", "wikipedia")]) == {"summary": "language"}
+        
+        metrics = ResponseCache.get_metrics()
+        assert (metrics['news']['hits'], metrics['news']['misses']) == (5, 1), metrics['news']
+        assert metrics['wikipedia']['negative_hits'] == 1, metrics['wikipedia']
+        assert metrics['news']['lookup_time']['count'] == 6
+        
+        print("DONE: Testing mixed-type batches round trip...")
+        assert ResponseCache.put_many([("2+2", "calculation", "4"), ("rust", "wikipedia", "a language")],
+                                      ttl=60)
+        mixed = [("2+2", "calculation"), ("rust", "wikipedia")]
+        fetched = ResponseCache.get_many(mixed)
+        assert fetched == {("2+2", "calculation"): "4", ("rust", "wikipedia"): "a language"}, fetched
+        database.clear_all_cache()
+        ResponseCache.memory.clear()
+        assert ResponseCache.put_many(fetched, ttl=60)
+        assert ResponseCache.get_many(mixed) == fetched
+        
+        print("DONE: Testing database batches larger than CACHE_BATCH_SIZE...")
+        original_batch, db_module.CACHE_BATCH_SIZE = db_module.CACHE_BATCH_SIZE, 2
+        try:
+            entries = [{'query_hash': f"h{i}", 'query_type': 'general',
+                        'response': f"r{i}", 'ttl_seconds': 60} for i in range(7)]
+            assert database.cache_responses(entries)
+            rows = database.get_cached_entries([f"h{i}" for i in range(9)])
+        finally:
+            db_module.CACHE_BATCH_SIZE = original_batch
+        assert sorted(rows) == [f"h{i}" for i in range(7)], sorted(rows)
+        assert rows['h3']['response'] == "r3"
+        
+        database.flush_cache_touches()
+        conn = database.get_connection()
+        hits = conn.execute("SELECT hit_count FROM response_cache WHERE query_hash = 'h3'").fetchone()[0]
+        database.release_connection(conn)
+        assert hits == 1, hits
+        
+        print("\nBatch cache tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nBatch cache test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        cache.ResponseCache.memory.clear()
+        cache.db = original_db
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_cache_generations():
+    """Test generation-based cache invalidation."""
+    print("\n" + "="*60)
+    print("Testing Cache Generations (cache.py)")
+    print("="*60)
+    
+    import cache
+    from cache import ResponseCache
+    
+    database, tmp_dir = _temp_database()
+    original_db, cache.db = cache.db, database
+    ResponseCache.memory.clear()
+    try:
+        print("DONE: Testing generation 0 keeps existing keys...")
+        assert database.get_cache_generation("wikipedia") == 0
+        old_hash = ResponseCache.hash_query("python", "wikipedia")
+        assert old_hash == ResponseCache.hash_query("python", "wikipedia", generation=0)
+        
+        ResponseCache.cache_result("python", "English summary", "wikipedia", 60)
+        ResponseCache.cache_result("2+2", "4", "calculation", 60)
+        ResponseCache.cache_failure("unknown", "wikipedia")
+        
+        print("DONE: Testing invalidate_type...")
+        assert ResponseCache.invalidate_type("wikipedia") == 1
+        assert ResponseCache.hash_query("python", "wikipedia") != old_hash
+        assert ResponseCache.get_cached("python", "wikipedia") is None
+        assert ResponseCache.get_failure("unknown", "wikipedia") is None
+        assert ResponseCache.get_cached("2+2", "calculation") == "4"
+        assert database.get_cached_entry(old_hash) is not None  # orphaned, not yet deleted
+        
+        ResponseCache.cache_result("python", "Resumen en español", "wikipedia", 60)
+        assert ResponseCache.get_cached("python", "wikipedia") == "Resumen en español"
+        
+        print("DONE: Testing generations persist...")
+        reopened = type(database)(database.db_path)
+        try:
+            assert reopened.get_cache_generation("wikipedia") == 1
+        finally:
+            reopened.close()
+        
+        print("DONE: Testing orphans are purged by the eviction pass...")
+        assert database.evict_cache() == 0
+        assert database.get_cached_entry(old_hash) is None
+        assert database.get_stats()['cache_entries'] == 2
+        assert ResponseCache.get_cached("python", "wikipedia") == "Resumen en español"
+        
+        print("DONE: Testing language setting listener...")
+        ResponseCache.watch_settings()
+        database.set_setting("language", "es-es")
+        assert database.get_cache_generation("wikipedia") == 2
+        assert database.get_cache_generation("calculation") == 0
+        assert ResponseCache.get_cached("python", "wikipedia") is None
+        database.set_setting("speech_rate", 150, "int")
+        assert database.get_cache_generation("wikipedia") == 2
+        
+        print("DONE: Testing restore reloads generations...")
+        backup_path = tmp_dir / "generations_backup.db"
+        assert database.backup(str(backup_path), rotate=False)
+        for _ in range(3):
+            ResponseCache.invalidate_type("wikipedia")
+        ResponseCache.cache_result("python", "Stale summary", "wikipedia", 60)
+        assert database.restore(str(backup_path))
+        assert database.get_cache_generation("wikipedia") == 2
+        assert len(ResponseCache.memory) == 0
+        assert ResponseCache.get_cached("python", "wikipedia") is None
+        assert ResponseCache.invalidate_type("wikipedia") == 3
+        
+        print("\nCache generation tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nCache generation test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        cache.ResponseCache.memory.clear()
+        cache.db = original_db
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_cache_warmup():
+    """Test predictive cache warm-up."""
+    print("\n" + "="*60)
+    print("Testing Cache Warm-Up (warmup.py)")
+    print("="*60)
+    
+    import cache
+    import warmup
+    from cache import ResponseCache
+    from datetime import datetime, timezone
+    
+    database, tmp_dir = _temp_database()
+    original_db, cache.db, warmup.db = cache.db, database, database
+    ResponseCache.memory.clear()
+    try:
+        print("DONE: Testing candidates from frequency and time of day...")
+        conn = database.get_connection()
+        now = datetime.now()
+        morning = now.replace(hour=8, minute=0, second=0, microsecond=0)
+        evening = now.replace(hour=20, minute=0, second=0, microsecond=0)
+        rows = ([("whats the news", morning)] * 3 + [("python wikipedia", evening)] * 4 +
+                [("calculate 2 plus 2", morning)] + [("open chrome", morning)] * 9)
+        conn.executemany("INSERT INTO command_history (command, timestamp) VALUES (?, ?)",
+                         [(command, when.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S'))
+                          for command, when in rows])
+        conn.commit()
+        
+        fetched = []
+        
+        def fetch(query):
+            fetched.append(query)
+            return f"answer for {query}"
+        
+        warmer = warmup.CacheWarmer({'news': fetch, 'wikipedia': fetch, 'calculation': fetch},
+                                    is_busy=lambda: False, is_online=lambda: True)
+        assert warmer.candidates(morning) == [("top headlines", "news"), ("python", "wikipedia")]
+        assert warmer.candidates(evening)[0] == ("python", "wikipedia")
+        
+        print("DONE: Testing prefetch fills the cache once...")
+        stats = warmer.warm(morning)
+        assert stats['warmed'] == 2 and sorted(fetched) == ["python", "top headlines"], stats
+        assert ResponseCache.get_cached("python", "wikipedia") == "answer for python"
+        stats = warmer.warm(morning)
+        assert stats['cached'] == 2 and len(fetched) == 2, stats
+        
+        print("DONE: Testing commands are answered from warmed entries...")
+        from types import SimpleNamespace
+        from commands import lookup, registry
+        ResponseCache.cache_result(lookup.NEWS_QUERY, [{"title": "Warm story", "description": "cached"}],
+                                   "news", 60)
+        said = []
+        registry.dispatch("whats the news", SimpleNamespace(speak=said.append, listen=lambda: ""))
+        assert said[-1].startswith("1. Warm story"), said
+        assert set(lookup.FETCHERS) >= set(warmup.CACHED_INTENTS.values())
+        
+        print("DONE: Testing back-off gives up while offline...")
+        ResponseCache.clear_all()
+        offline = warmup.CacheWarmer({'news': fetch}, is_busy=lambda: False, is_online=lambda: False)
+        original_wait, warmup.WARMUP_MAX_WAIT = warmup.WARMUP_MAX_WAIT, 0
+        try:
+            stats = offline.warm(morning)
+        finally:
+            warmup.WARMUP_MAX_WAIT = original_wait
+        assert stats['skipped'] == 1 and len(fetched) == 2, stats
+        
+        print("\nCache warm-up tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nCache warm-up test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        cache.ResponseCache.memory.clear()
+        cache.db = warmup.db = original_db
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_intent_router():
+    """Test intent routing."""
+    print("\n" + "="*60)
+    print("Testing Intent Router (intents.py)")
+    print("="*60)
+    
+    try:
+        from commands import route
+        from intents import Intent, IntentRouter, SLOT_AFTER, SLOT_REST
+        
+        def name(text):
+            match = route(text)
+            return match.name if match else None
+        
+        print("DONE: Testing word boundaries...")
+        assert name("what time is it") == "time"
+        assert name("sometimes i wonder") is None
+        assert name("i am sadder than before") is None
+        assert name("stop") == "exit"
+        
+        print("DONE: Testing priorities...")
+        assert name("stop listening") == "pause_listening"
+        assert name("who is your creator") == "creator"
+        assert name("who is alan turing") == "general"
+        assert name("what is the great wall of china") == "general"
+        assert name("calculate the time it takes") == "calculate"
+        assert name("please open counter strike") == "open_app"
+        assert name("i am sad i cannot sleep") == "mood_sad"
+        assert name("i am upset please shutdown") == "mood_sad"
+        assert name("i feel great, restart the music") == "mood_good"
+        assert name("restart") == "restart" and name("go to sleep") == "hibernate"
+        
+        print("DONE: Testing slots...")
+        match = route("calculate 2+2 times 3")
+        assert match.slot == "2+2 times 3", match
+        assert route("where is New Delhi").slot == "New Delhi"
+        assert route("alan turing wikipedia").slot == "alan turing"
+        assert route("search for leafy on github").slot == "leafy on github"
+        match = route("open chrome please")
+        assert (match.phrase, match.slot) == ("open chrome", None), match
+        
+        print("DONE: Testing overlapping phrases...")
+        router = IntentRouter([
+            Intent('short', ["b c"], priority=1),
+            Intent('long', ["a b c d"], priority=1),
+            Intent('after', ["c"], slot=SLOT_AFTER),
+            Intent('rest', ["x"], slot=SLOT_REST),
+        ])
+        found = [(m.name, m.phrase) for m in router.matches("a b c d")]
+        assert found == [("short", "b c"), ("after", "c"), ("long", "a b c d")], found
+        assert router.match("a b c d").name == "long"
+        assert router.match("a b c e").name == "short"
+        assert router.match("x b y").slot == "b y"
+        
+        print("\nIntent router tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nIntent router test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_command_registry():
+    """Test lazily loaded command plugins."""
+    print("\n" + "="*60)
+    print("Testing Command Registry (commands/)")
+    print("="*60)
+    
+    from types import SimpleNamespace
+    tmp_dir = Path(tempfile.mkdtemp(prefix="leafy_test_"))
+    sys.path.insert(0, str(tmp_dir))
+    try:
+        from commands import CommandPlugin, CommandRegistry, registry
+        from intents import Intent, SLOT_AFTER
+        
+        (tmp_dir / "leafy_test_plugin.py").write_text(
+            "def echo(assistant, match):\n"
+            "    assistant.speak(match.slot)\n"
+            "\n"
+            "HANDLERS = {'echo': echo}\n")
+        plugin = CommandPlugin('test', 'leafy_test_plugin', [Intent('echo', ["echo"], slot=SLOT_AFTER)])
+        missing = CommandPlugin('missing', 'leafy_missing_plugin', [Intent('missing', ["missing"])])
+        test_registry = CommandRegistry([plugin, missing])
+        said = []
+        assistant = SimpleNamespace(speak=said.append, listen=lambda: "")
+        
+        print("DONE: Testing plugins load on first dispatch...")
+        assert test_registry.route("echo hello").name == "echo"
+        assert not plugin.loaded and 'leafy_test_plugin' not in sys.modules
+        assert not test_registry.dispatch("echo hello there", assistant)
+        assert plugin.loaded and said == ["hello there"], said
+        
+        print("DONE: Testing missing libraries are reported, not raised...")
+        assert not test_registry.dispatch("missing command", assistant)
+        assert said[-1] == "Sorry, I can't do that on this computer"
+        assert not test_registry.dispatch("nothing to do", assistant)
+        
+        print("DONE: Testing duplicate intents are rejected...")
+        try:
+            CommandRegistry([plugin, plugin])
+            raise AssertionError("Duplicate intent accepted")
+        except ValueError:
+            pass
+        
+        print("DONE: Testing Leafy's registry...")
+        assert registry.dispatch("bye", assistant), "exit should stop the command loop"
+        assert said[-1] == "Leafy, Signing out!"
+        
+        print("\nCommand registry tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nCommand registry test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        sys.path.remove(str(tmp_dir))
+        sys.modules.pop('leafy_test_plugin', None)
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+class _FakeEngine:
+    """Stands in for a pyttsx3 engine."""
+    
+    def __init__(self, voices=()):
+        self.properties = {'voices': list(voices), 'voice': "default-id", 'rate': 200, 'volume': 1.0}
+        self.spoken = []
+        self.set_on = []  # thread each setProperty() ran on
+    
+    def getProperty(self, name):
+        return self.properties[name]
+    
+    def setProperty(self, name, value):
+        self.properties[name] = value
+        self.set_on.append(threading.current_thread().name)
+    
+    def say(self, text):
+        self.spoken.append(text)
+    
+    def runAndWait(self):
+        pass
+
+
+def test_speech_manager():
+    """Test lazy TTS engine start-up."""
+    print("\n" + "="*60)
+    print("Testing Speech Manager (speech.py)")
+    print("="*60)
+    
+    import speech
+    from types import SimpleNamespace
+    from speech import SpeechManager, pick_voice
+    
+    database, tmp_dir = _temp_database()
+    original_db, speech.db = speech.db, database
+    try:
+        voices = [SimpleNamespace(id="v-david", name="Microsoft David Desktop", gender=None),
+                  SimpleNamespace(id="v-zira", name="Microsoft Zira Desktop", gender=None),
+                  SimpleNamespace(id="v-x", name="Voice X", gender="Female")]
+        
+        print("DONE: Testing voice selection...")
+        assert pick_voice(voices, "female") == "v-zira"
+        assert pick_voice(voices, "male") == "v-david"
+        assert pick_voice(voices, "v-x") == "v-x"
+        assert pick_voice(voices, "default") is None
+        
+        print("DONE: Testing speak() queues until the engine is ready...")
+        database.set_settings({"speech_rate": 150, "voice": "female"})
+        engine = _FakeEngine(voices)
+        release = threading.Event()
+        
+        def slow_factory(driver):
+            release.wait(5)
+            return engine
+        
+        manager = SpeechManager(driver="fake", engine_factory=slow_factory)
+        manager.start()
+        start = time.perf_counter()
+        manager.speak("Good Morning!")
+        manager.speak("I am Leafy!")
+        assert time.perf_counter() - start < 0.5, "speak() blocked on warm-up"
+        assert not manager.ready and engine.spoken == []
+        
+        release.set()
+        assert manager.wait_until_ready(5), "Warm-up did not finish"
+        manager.speak("How may I help you?")
+        assert manager.wait_until_idle(5), "Queued speech was not spoken"
+        assert engine.spoken == ["Good Morning!", "I am Leafy!", "How may I help you?"], engine.spoken
+        
+        print("DONE: Testing settings are applied...")
+        assert engine.properties['rate'] == 150 and engine.properties['voice'] == "v-zira"
+        database.set_settings({"speech_volume": 0.5, "voice": "default"})
+        deadline = time.time() + 5
+        while engine.properties['volume'] != 0.5:  # applied on the worker, not here
+            assert time.time() < deadline, engine.properties
+            time.sleep(0.01)
+        assert set(engine.set_on) == {"leafy-tts"}, engine.set_on
+        
+        print("DONE: Testing a bad setting does not stop speech...")
+        database.set_setting("speech_rate", "fast")
+        assert manager.speak("Still talking").wait(5) and engine.spoken[-1] == "Still talking"
+        assert engine.properties['voice'] == "default-id", engine.properties['voice']
+        
+        print("DONE: Testing a missing engine does not hang speak()...")
+        
+        def broken_factory(driver):
+            raise ImportError("No module named 'pyttsx3'")
+        
+        broken = SpeechManager(driver="fake", engine_factory=broken_factory)
+        broken.start()
+        assert broken.wait_until_ready(5) and broken.error
+        assert broken.speak("still shown").wait(5)
+        broken.stop(5)
+        
+        print("DONE: Testing platform drivers...")
+        assert SpeechManager().driver == speech.TTS_DRIVERS.get(speech.get_platform())
+        
+        manager.stop(5)
+        
+        print("\nSpeech manager tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nSpeech manager test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        speech.db = original_db
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_speech_queue():
+    """Test the TTS worker queue, sentence chunking and barge-in."""
+    print("\n" + "="*60)
+    print("Testing Speech Queue (speech.py)")
+    print("="*60)
+    
+    import struct
+    import speech
+    from types import SimpleNamespace
+    from speech import PRIORITY_HIGH, SpeechManager, chunk_rms, split_sentences, wait_for_speech
+    
+    database, tmp_dir = _temp_database()
+    original_db, speech.db = speech.db, database
+    manager = None
+    try:
+        print("DONE: Testing sentence chunking...")
+        assert split_sentences("Python is a language. It was made in 1991! Why?\n1. Headline") == [
+            "Python is a language.", "It was made in 1991!", "Why?", "1. Headline"]
+        assert split_sentences("  ") == []
+        
+        engine = _FakeEngine()
+        gate = threading.Semaphore(0)  # one permit per sentence the fake engine may finish
+        engine.runAndWait = lambda: gate.acquire(timeout=5)
+        manager = SpeechManager(driver="fake", engine_factory=lambda driver: engine)
+        manager.start()
+        assert manager.wait_until_ready(5)
+        
+        print("DONE: Testing speak() does not wait for playback...")
+        start = time.perf_counter()
+        summary = manager.speak("First sentence. Second sentence. Third sentence.")
+        assert time.perf_counter() - start < 0.5 and manager.busy
+        
+        deadline = time.time() + 5
+        while engine.spoken != ["First sentence."]:
+            assert time.time() < deadline, engine.spoken
+            time.sleep(0.01)
+        
+        print("DONE: Testing priorities...")
+        manager.speak("Warning!", priority=PRIORITY_HIGH)
+        for _ in range(4):
+            gate.release()
+        assert summary.wait(5) and manager.wait_until_idle(5)
+        assert engine.spoken == ["First sentence.", "Warning!", "Second sentence.",
+                                 "Third sentence."], engine.spoken
+        
+        print("DONE: Testing interrupt()...")
+        engine.spoken.clear()
+        news = manager.speak("Headline one. Headline two. Headline three.")
+        protected = manager.speak("Shutting down.", interruptible=False)
+        while not engine.spoken:
+            time.sleep(0.01)
+        assert manager.interrupt() == 1 and news.cancelled and not protected.cancelled
+        for _ in range(2):
+            gate.release()
+        assert manager.wait_until_idle(5)
+        assert engine.spoken == ["Headline one.", "Shutting down."], engine.spoken
+        
+        print("DONE: Testing latency stats...")
+        stats = manager.get_stats()
+        assert stats['utterances'] == 4 and stats['interrupted'] == 1, stats
+        assert stats['playback_time']['count'] == 3 and stats['queue_time']['max_ms'] > 0
+        
+        print("DONE: Testing barge-in from the microphone...")
+        quiet, loud = struct.pack('<4h', *[100] * 4), struct.pack('<4h', *[2000] * 4)
+        assert chunk_rms(loud) == 2000
+        chunks = iter([quiet, struct.pack('<4h', *[500] * 4), loud])
+        source = SimpleNamespace(CHUNK=4, SAMPLE_WIDTH=2, SAMPLE_RATE=16,
+                                 stream=SimpleNamespace(read=lambda n: next(chunks)))
+        recognizer = SimpleNamespace(energy_threshold=300)
+        manager.speak("A long answer.")
+        onset = wait_for_speech(recognizer, source, manager)  # 500 is Leafy's echo
+        assert onset == struct.pack('<4h', *[500] * 4) + loud  # 0.3 s of pre-roll is two chunks
+        assert manager.wait_until_idle(5) and manager.get_stats()['interrupted'] == 2
+        gate.release()
+        
+        print("\nSpeech queue tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nSpeech queue test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        if manager is not None:
+            for _ in range(10):
+                gate.release()
+            manager.stop(5)
+        speech.db = original_db
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+class _RenderingEngine(_FakeEngine):
+    """A fake engine that can also render speech to a file."""
+    
+    def __init__(self, voices=()):
+        super().__init__(voices)
+        self.pending = []
+        self.rendered = []
+    
+    def save_to_file(self, text, filename):
+        self.pending.append((text, filename))
+    
+    def runAndWait(self):
+        for text, filename in self.pending:
+            Path(filename).write_text(text)
+            self.rendered.append(text)
+        self.pending.clear()
+
+
+class _FakePlayer:
+    """Records played audio files instead of playing them."""
+    
+    def __init__(self):
+        self.played = []
+        self.stopped = 0
+    
+    def play(self, path):
+        self.played.append(path.read_text())
+    
+    def stop(self):
+        self.stopped += 1
+
+
+def test_phrase_audio():
+    """Test pre-rendered audio for fixed phrases."""
+    print("\n" + "="*60)
+    print("Testing Phrase Audio Cache (speech.py)")
+    print("="*60)
+    
+    import speech
+    from speech import SpeechManager, phrase_file_name
+    
+    database, tmp_dir = _temp_database()
+    original_db, speech.db = speech.db, database
+    manager = None
+    try:
+        engine, player = _RenderingEngine(), _FakePlayer()
+        audio_dir = tmp_dir / "phrase_audio"
+        (audio_dir / "old-voice").mkdir(parents=True)
+        manager = SpeechManager(driver="fake", engine_factory=lambda driver: engine, player=player,
+                                audio_dir=audio_dir, phrases=("Noted", "Here you go"))
+        manager.start()
+        assert manager.wait_until_ready(5)
+        
+        print("DONE: Testing phrases are rendered in the background...")
+        assert manager.speak("Hello there").wait(5)
+        deadline = time.time() + 5
+        while sorted(engine.rendered) != ["Here you go", "Noted"]:
+            assert time.time() < deadline, engine.rendered
+            time.sleep(0.01)
+        voice_dirs = [d for d in audio_dir.iterdir()]
+        assert len(voice_dirs) == 1 and voice_dirs[0].name != "old-voice", voice_dirs
+        assert (voice_dirs[0] / phrase_file_name("Noted")).read_text() == "Noted"
+        
+        print("DONE: Testing phrases play from disk...")
+        engine.spoken.clear()
+        assert manager.speak("Noted").wait(5)
+        assert manager.speak("Here you go").wait(5)
+        assert manager.speak("Your notes are empty.").wait(5)
+        assert player.played == ["Noted", "Here you go"], player.played
+        assert engine.spoken == ["Your notes are empty."], engine.spoken
+        assert manager.get_stats()['phrases_played'] == 2
+        
+        print("DONE: Testing a settings change re-renders...")
+        engine.rendered.clear()
+        database.set_settings({"speech_rate": 120})
+        deadline = time.time() + 5
+        while len(engine.rendered) < 2:
+            assert time.time() < deadline, engine.rendered
+            time.sleep(0.01)
+        assert [d for d in audio_dir.iterdir()] != voice_dirs and not voice_dirs[0].exists()
+        
+        print("DONE: Testing a restart reuses rendered audio...")
+        manager.stop(5)
+        engine.rendered.clear()
+        manager = SpeechManager(driver="fake", engine_factory=lambda driver: engine, player=player,
+                                audio_dir=audio_dir, phrases=("Noted", "Here you go"))
+        manager.start()
+        assert manager.speak("Noted").wait(5)
+        assert engine.rendered == [] and player.played[-1] == "Noted"
+        
+        print("\nPhrase audio tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nPhrase audio test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        if manager is not None:
+            manager.stop(5)
+        speech.db = original_db
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
 def test_async_operations():
     """Test async operations module."""
     print("\n" + "="*60)
@@ -179,6 +1795,81 @@ def test_async_operations():
         return False
 
 
+def test_async_database():
+    """Test the asyncio database facade."""
+    print("\n" + "="*60)
+    print("Testing Async Database (async_db.py)")
+    print("="*60)
+    
+    import asyncio
+    from async_db import READ_METHODS, AsyncDatabase
+    
+    database, tmp_dir = _temp_database()
+    
+    async def run_checks():
+        async with AsyncDatabase(database, timeout=5) as adb:
+            print("DONE: Testing mirrored coroutines...")
+            assert await adb.save_note("Async Note", "written from a coroutine")
+            notes = await adb.search_notes("coroutine")
+            assert notes[0]['title'] == "Async Note", f"Unexpected notes: {notes}"
+            
+            print("DONE: Testing concurrent reads...")
+            results = await asyncio.gather(*[adb.get_note("Async Note") for _ in range(10)])
+            assert all(r['title'] == "Async Note" for r in results)
+            
+            print("DONE: Testing timeouts...")
+            database.add_settings_listener(lambda changes: time.sleep(0.3))
+            try:
+                await adb.call('set_setting', 'slow', 1, 'int', timeout=0.05)
+                raise AssertionError("Timeout not raised")
+            except asyncio.TimeoutError:
+                pass
+            
+            print("DONE: Testing cancellation of queued writes...")
+            first = asyncio.ensure_future(adb.set_setting('kept', 1, 'int'))
+            second = asyncio.ensure_future(adb.set_setting('cancelled', 1, 'int'))
+            await asyncio.sleep(0.01)
+            second.cancel()
+            await first
+            settings = await adb.get_all_settings()
+            assert 'kept' in settings and 'cancelled' not in settings, f"Bad settings: {settings}"
+            
+            print("DONE: Testing async iterator timeouts...")
+            
+            def slow_rows():
+                for i in range(3):
+                    time.sleep(0.3)
+                    yield i
+            
+            database.iter_slow = slow_rows
+            try:
+                async for _ in adb.iterate('iter_slow', chunk_size=1, timeout=0.05):
+                    pass
+                raise AssertionError("Timeout not raised")
+            except asyncio.TimeoutError:
+                pass
+            
+            print("DONE: Testing cache lookups run on the writer...")
+            assert not READ_METHODS & {'get_cached_entry', 'get_cached_entries', 'get_cached_response'}
+            assert await adb.get_cached_entry("missing") is None
+    
+    try:
+        assert hasattr(AsyncDatabase, 'get_top_commands'), "Database method not mirrored"
+        asyncio.run(run_checks())
+        
+        print("\nAsync database tests PASSED")
+        return True
+        
+    except Exception as e:
+        print(f"\nAsync database test FAILED: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        database.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
 def test_settings_gui():
     """Test settings GUI module."""
     print("\n" + "="*60)
@@ -195,7 +1886,8 @@ def test_settings_gui():
             'reset_defaults',
             'clear_cache',
             'backup_database',
-            'restore_database'
+            'restore_database',
+            'refresh_cache_metrics'
         ]
         
         for method in required_methods:
@@ -220,8 +1912,33 @@ def main():
     
     results = {
         'Database': test_database(),
+        'Connection Pool': test_connection_pool(),
+        'Write-Behind': test_write_behind(),
+        'Notes Search': test_notes_search(),
+        'Cache Expiry': test_cache_expiry(),
+        'Cache Eviction': test_cache_eviction(),
+        'Cache Compression': test_cache_compression(),
+        'Settings Snapshot': test_settings_snapshot(),
+        'Backup': test_backup_rotation(),
+        'Command Rollups': test_command_rollups(),
+        'Streaming Iterators': test_streaming_iterators(),
         'Caching': test_caching(),
+        'Query Canonicalization': test_query_canonicalization(),
+        'Memory Cache': test_memory_cache(),
+        'Single Flight': test_single_flight(),
+        'Stale-While-Revalidate': test_stale_while_revalidate(),
+        'Negative Caching': test_negative_caching(),
+        'Cache Metrics': test_cache_metrics(),
+        'Batch Cache': test_batch_cache(),
+        'Cache Generations': test_cache_generations(),
+        'Cache Warm-Up': test_cache_warmup(),
+        'Intent Router': test_intent_router(),
+        'Command Registry': test_command_registry(),
+        'Speech Manager': test_speech_manager(),
+        'Speech Queue': test_speech_queue(),
+        'Phrase Audio': test_phrase_audio(),
         'Async Operations': test_async_operations(),
+        'Async Database': test_async_database(),
         'Settings GUI': test_settings_gui(),
     }
     
@@ -0,0 +1,174 @@
+"""
+Predictive cache warm-up for Leafy
+Prefetches the lookups users repeat, especially around this time of day,
+so the first answers after startup come from the response cache
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional, Dict, List, Tuple, Callable
+from async_ops import run_async
+from cache import ResponseCache, get_cached_or_fetch
+from db import db
+from commands import route
+from commands.lookup import NEWS_QUERY
+from logger import log_info, log_error
+
+WARMUP_HISTORY_DAYS = 30  # how far back command_history is mined
+WARMUP_MAX_QUERIES = 20  # lookups prefetched per run
+WARMUP_MIN_COUNT = 2  # a lookup must have been asked this often
+WARMUP_HOUR_WINDOW = 1  # hours either side of now counted as "this time of day"
+WARMUP_HOUR_WEIGHT = 3  # extra weight for lookups asked around this time of day
+WARMUP_CONCURRENCY = 2  # prefetches running at once
+
+# Back-off while the machine is busy or offline
+WARMUP_MAX_CPU_PERCENT = 70
+WARMUP_BACKOFF_START = 5  # seconds
+WARMUP_BACKOFF_MAX = 300
+WARMUP_MAX_WAIT = 900  # give up on a run after waiting this long in total
+
+# TTLs used for prefetched entries, per query type
+WARMUP_TTLS = {
+    'wikipedia': ResponseCache.TTL_WIKIPEDIA,
+    'calculation': ResponseCache.TTL_CALCULATION,
+    'news': ResponseCache.TTL_NEWS,
+}
+
+# Intents answered through the response cache, with their query_type
+CACHED_INTENTS = {
+    'wikipedia': 'wikipedia',
+    'calculate': 'calculation',
+    'news': 'news',
+    'general': 'general',
+}
+
+# command_history rows worth passing to classify_command
+LOOKUP_PATTERNS = ['%wikipedia%', '%calculate%', '%news%', '%what is%', "%what's%", '%who is%']
+
+
+def classify_command(command: str) -> Optional[Tuple[str, str]]:
+    """Map a spoken command to the (query, query_type) Leafy would cache, if any."""
+    match = route(command.lower().strip())
+    if match is None or match.name not in CACHED_INTENTS:
+        return None
+    query_type = CACHED_INTENTS[match.name]
+    if query_type == 'news':
+        return NEWS_QUERY, 'news'
+    if query_type == 'general':
+        return match.text, 'general'
+    return match.slot, query_type
+
+
+def machine_busy() -> bool:
+    """Whether CPU load is too high for background prefetching."""
+    try:
+        import psutil
+        return psutil.cpu_percent(interval=0.5) > WARMUP_MAX_CPU_PERCENT
+    except ImportError:
+        return False
+
+
+def machine_online() -> bool:
+    """Whether upstream APIs are reachable."""
+    from utils import check_internet
+    return check_internet()
+
+
+class CacheWarmer:
+    """Prefetches frequent and time-of-day-correlated lookups into the cache.
+
+    fetchers maps a query_type to a function taking the query and returning
+    the response to cache; lookups of other types are skipped.
+    """
+
+    def __init__(self, fetchers: Dict[str, Callable[[str], object]],
+                 concurrency: int = WARMUP_CONCURRENCY,
+                 max_queries: int = WARMUP_MAX_QUERIES,
+                 days: int = WARMUP_HISTORY_DAYS,
+                 is_busy: Callable[[], bool] = machine_busy,
+                 is_online: Callable[[], bool] = machine_online):
+        self.fetchers = fetchers
+        self.concurrency = concurrency
+        self.max_queries = max_queries
+        self.days = days
+        self.is_busy = is_busy
+        self.is_online = is_online
+        self._stop = threading.Event()
+        self.task = None
+
+    def candidates(self, now: Optional[datetime] = None) -> List[Tuple[str, str]]:
+        """Lookups worth prefetching, best first, as (query, query_type)."""
+        hour = (now or datetime.now()).hour
+        scores = {}
+        for row in db.get_command_hours(self.days, like=LOOKUP_PATTERNS):
+            lookup = classify_command(row['command'])
+            if lookup is None or lookup[1] not in self.fetchers:
+                continue
+
+            # Distance between hours on a 24-hour clock
+            distance = min((row['hour'] - hour) % 24, (hour - row['hour']) % 24)
+            weight = 1 + WARMUP_HOUR_WEIGHT if distance <= WARMUP_HOUR_WINDOW else 1
+            total, score = scores.get(lookup, (0, 0))
+            scores[lookup] = (total + row['count'], score + row['count'] * weight)
+
+        ranked = sorted((item for item in scores.items() if item[1][0] >= WARMUP_MIN_COUNT),
+                        key=lambda item: item[1][1], reverse=True)
+        return [lookup for lookup, _ in ranked[:self.max_queries]]
+
+    def _wait_until_idle(self, deadline: float) -> bool:
+        """Back off while the machine is busy or offline. False means give up."""
+        delay = WARMUP_BACKOFF_START
+        while not self._stop.is_set():
+            if not self.is_busy() and self.is_online():
+                return True
+            if time.monotonic() + delay > deadline:
+                return False
+            log_info(f"Cache warm-up backing off for {delay}s")
+            self._stop.wait(delay)
+            delay = min(delay * 2, WARMUP_BACKOFF_MAX)
+        return False
+
+    def _prefetch(self, query: str, query_type: str, deadline: float) -> str:
+        """Fetch one lookup unless it is cached; returns the outcome."""
+        entry = ResponseCache.lookup(query, query_type)
+        if entry is not None and not entry.is_stale():
+            return 'cached'
+        if not self._wait_until_idle(deadline):
+            return 'skipped'
+
+        fetcher = self.fetchers[query_type]
+        ttl = WARMUP_TTLS.get(query_type, ResponseCache.TTL_SHORT)
+        result = get_cached_or_fetch(query, query_type, lambda: fetcher(query), ttl)
+        return 'warmed' if result else 'failed'
+
+    def warm(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Prefetch the current candidates. Returns counts per outcome."""
+        deadline = time.monotonic() + WARMUP_MAX_WAIT
+        lookups = self.candidates(now)
+        stats = {'candidates': len(lookups), 'cached': 0, 'warmed': 0, 'failed': 0, 'skipped': 0}
+
+        with ThreadPoolExecutor(max_workers=self.concurrency,
+                                thread_name_prefix="leafy-cache-warmup") as pool:
+            futures = [pool.submit(self._prefetch, query, query_type, deadline)
+                       for query, query_type in lookups]
+            for future in futures:
+                try:
+                    stats[future.result()] += 1
+                except Exception as e:
+                    stats['failed'] += 1
+                    log_error("CACHE", "Cache warm-up fetch failed", str(e))
+
+        log_info(f"Cache warm-up finished: {stats}")
+        return stats
+
+    def start(self):
+        """Run warm() on a background thread; returns its AsyncTask."""
+        self._stop.clear()
+        self.task = run_async(self.warm)
+        return self.task
+
+    def stop(self):
+        """Stop backing off and skip the lookups not yet started."""
+        self._stop.set()